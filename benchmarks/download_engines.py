@@ -0,0 +1,158 @@
+"""Benchmark of the download engines
+
+    Downloads a novel from a local novelbin-like server (see novelbin_server.py) with each engine,
+    every engine in a new process, and shows its chapters per second, the p50 and p99 latency of
+    a chapter (from waiting on the rate limiter for its first request to the 200, retries included), the peak RSS and the CPU time.
+    The server adds latency, errors and bursts of 429 so the rate limiter and retries are measured too.
+
+    Run from the root of the repository:
+        python -m benchmarks.download_engines [OPTIONS] [PAGE.html ...]
+
+    Without any pages a novelbin-like page is generated. Nothing is cached and the epub files are
+    written to a temporary directory.
+"""
+
+import contextlib
+import math
+import multiprocessing
+import os
+import queue
+import sys
+import tempfile
+import time
+import click
+import requests
+
+from benchmarks.novelbin_server import NovelBinServer
+from benchmarks.parse_chapters import make_page
+from src.providers.novel_bin import NovelBinDownloader
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+
+class BenchmarkDownloader(NovelBinDownloader):
+    """Novel Bin served by a NovelBinServer"""
+
+
+    def get_all_chapter_urls(self, _response: requests.Response) -> list[str]:
+        """Get all chapter urls from the server's chapter-archive"""
+
+        base_url, novel_id = self.homepage_url.rstrip("/").rsplit("/b/", maxsplit=1)
+        return self.chapter_urls_extractor(self.fetch(f"{base_url}/ajax/chapter-archive?novelId={novel_id}"))
+
+
+def get_percentile(values: list[float], percent: float) -> float:
+    """Get the value percent of the values are at or below (nearest rank)"""
+
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(max(math.ceil(len(values) * percent / 100), 1), len(values)) - 1]
+
+
+def get_peak_rss() -> tuple[float, float]:
+    """Get the peak RSS in MB of this process and of its largest child process, 0 if it cannot be measured"""
+
+    if resource is None:
+        return (0.0, 0.0)
+    # ru_maxrss is in bytes on macOS and in kilobytes everywhere else
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale)
+
+
+def get_cpu_time() -> float:
+    """Get the number of CPU seconds used by this process and its child processes"""
+
+    if resource is None:
+        return time.process_time()
+    return sum(usage.ru_utime + usage.ru_stime for usage in (resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)))
+
+
+def run_engine(engine: str, homepage_url: str, options: dict, results: multiprocessing.Queue) -> None:
+    """Download the novel with an engine and put what was measured in results, runs in its own process"""
+
+    downloader = BenchmarkDownloader(homepage_url)
+    with tempfile.TemporaryDirectory() as directory, open(os.devnull, "w") as devnull:
+        sys.argv[0] = os.path.join(directory, "n2epub") # The epub is written next to the executable, each engine runs in its own process
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(devnull):
+            succeeded = downloader.download(
+                engine, options["wait_time"], False, options["max_workers"], options["rate"], options["max_rate"],
+                cache_size=0, stream=options["stream"], processes=options["processes"]
+            )
+        seconds = time.perf_counter() - start
+
+    latencies = [latency for latency, _, _ in downloader.stats.latencies]
+    rss, child_rss = get_peak_rss()
+    results.put({
+        "succeeded": succeeded,
+        "chapters": len(latencies),
+        "seconds": seconds,
+        "p50": get_percentile(latencies, 50),
+        "p99": get_percentile(latencies, 99),
+        "rss": rss,
+        "child_rss": child_rss,
+        "cpu": get_cpu_time(),
+    })
+
+
+@click.command()
+@click.help_option("-h", "--help")
+@click.argument("pages", nargs=-1, type=click.Path(exists=True, dir_okay=False))
+@click.option("-e", "--engines", "engines", default="sync,threaded,async,pipeline", show_default=True, help="Comma separated engines to run.", metavar="ENGINES")
+@click.option("-n", "--chapters", "chapter_count", default=200, type=click.IntRange(1), show_default=True, help="Number of chapters in the novel.", metavar="CHAPTERS")
+@click.option("-l", "--latency", "latency", default=50.0, type=click.FloatRange(0), show_default=True, help="Average milliseconds before a chapter is answered.", metavar="MS")
+@click.option("-j", "--jitter", "jitter", default=20.0, type=click.FloatRange(0), show_default=True, help="Max milliseconds the latency of a chapter is off by.", metavar="MS")
+@click.option("-E", "--error-rate", "error_rate", default=0.0, type=click.FloatRange(0, 1), show_default=True, help="Chance of a chapter request failing with a 500.", metavar="RATE")
+@click.option("-b", "--burst-every", "burst_every", default=0.0, type=click.FloatRange(0), show_default=True, help="Seconds between the start of each burst of 429 (0 for no bursts).", metavar="SECONDS")
+@click.option("-B", "--burst-length", "burst_length", default=1.0, type=click.FloatRange(0), show_default=True, help="Seconds a burst of 429 lasts.", metavar="SECONDS")
+@click.option("--seed", "seed", default=0, show_default=True, help="Seed of the latencies and errors.")
+@click.option("-w", "--wait", "wait_time", default=0, type=click.IntRange(0), show_default=True, help="Time between each chapter in sync.", metavar="TIME")
+@click.option("-m", "--max-workers", "max_workers", default=10, type=click.IntRange(1), show_default=True, help="Max number of chapters downloading at once in threaded, async and pipeline.", metavar="WORKERS")
+@click.option("-P", "--processes", "processes", default=0, type=click.IntRange(0), show_default=True, help="Number of processes parsing chapters in pipeline (0 for one per cpu).", metavar="PROCESSES")
+@click.option("-r", "--rate", "rate", default=0.0, type=click.FloatRange(0), show_default=True, help="Requests per second to start at (0 for no limit).", metavar="RATE")
+@click.option("-R", "--max-rate", "max_rate", default=0.0, type=click.FloatRange(0), show_default=True, help="Highest requests per second the rate adapts to (0 to never change the rate).", metavar="RATE")
+@click.option("-S", "--stream", "stream", is_flag=True, default=False, help="Write each chapter into the epub as soon as it is downloaded.")
+def main(pages: tuple[str, ...], engines: str, chapter_count: int, latency: float, jitter: float, error_rate: float, burst_every: float, burst_length: float, seed: int, **options) -> None:
+    """Download a novel from a local server with each engine and compare them"""
+
+    page_texts = []
+    for path in pages:
+        with open(path, encoding="utf-8") as f:
+            page_texts.append(f.read())
+    if not page_texts:
+        page_texts = [make_page(200)]
+
+    server = NovelBinServer(page_texts, chapter_count, latency / 1000, jitter / 1000, error_rate, burst_every, burst_length, seed)
+    server.start()
+
+    # Every engine runs in a new process so its peak RSS and CPU time are its own
+    context = multiprocessing.get_context("spawn")
+    print(f"{"engine":<10} {"chapters":>8} {"seconds":>8} {"ch/s":>8} {"p50 ms":>8} {"p99 ms":>8} {"RSS MB":>8} {"child MB":>8} {"CPU s":>7} {"500s":>5} {"429s":>5}")
+    for engine in engines.split(","):
+        server.reset()
+        results = context.Queue()
+        process = context.Process(target=run_engine, args=(engine, server.homepage_url, options, results))
+        process.start()
+        process.join()
+        try:
+            result = results.get(timeout=1)
+        except queue.Empty:
+            print(f"{engine:<10} the benchmark process exited with {process.exitcode}")
+            continue
+
+        status_counts = server.status_counts
+        print(
+            f"{engine:<10} {result["chapters"]:>8} {result["seconds"]:>8.2f} {result["chapters"] / result["seconds"]:>8.1f}"
+            f" {result["p50"] * 1000:>8.1f} {result["p99"] * 1000:>8.1f} {result["rss"]:>8.1f} {result["child_rss"]:>8.1f}"
+            f" {result["cpu"]:>7.2f} {status_counts.get(500, 0):>5} {status_counts.get(429, 0):>5}"
+            + ("" if result["succeeded"] else "  (a chapter failed to download)")
+        )
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""Local novelbin-like server for benchmarks
+
+    Serves a novel laid out like novelbin (a homepage with og meta tags, a chapter-archive page
+    listing every chapter and one page per chapter) from 127.0.0.1, with latency, errors and
+    bursts of 429 responses like a real provider, so download engines can be compared offline.
+"""
+
+import http.server
+import math
+import random
+import threading
+import time
+import urllib.parse
+
+
+NOVEL_ID = "benchmark-novel"
+NOVEL_TITLE = "Benchmark Novel"
+
+
+class NovelBinHandler(http.server.BaseHTTPRequestHandler):
+    """Answers the requests NovelBinDownloader sends"""
+
+    protocol_version = "HTTP/1.1"
+    server: "NovelBinServer"
+
+
+    def log_message(self, *_) -> None:
+        pass
+
+
+    def do_GET(self) -> None:
+        url = urllib.parse.urlsplit(self.path)
+        if url.path == f"/b/{NOVEL_ID}":
+            self.send_body(200, self.server.make_homepage())
+        elif url.path == "/ajax/chapter-archive":
+            self.send_body(200, self.server.make_chapter_archive())
+        elif url.path == "/cover.jpg":
+            self.send_body(200, b"\xff\xd8\xff\xe0" + b"\x00" * 20000, "image/jpeg")
+        elif url.path.startswith(f"/b/{NOVEL_ID}/chapter-"):
+            self.send_chapter(int(url.path.rsplit("-", maxsplit=1)[1]))
+        else:
+            self.send_body(404, b"")
+
+
+    def send_chapter(self, chapter_number: int) -> None:
+        """Answer a chapter request after the latency, with an error or a 429 if it is its turn"""
+
+        attempt = self.server.count_attempt(chapter_number)
+        chance = random.Random(f"{self.server.seed} {chapter_number} {attempt}")
+        time.sleep(max(0.0, self.server.latency + chance.uniform(-self.server.jitter, self.server.jitter)))
+
+        if (retry_after := self.server.get_burst_left()) is not None:
+            self.server.count_status(429)
+            self.send_body(429, b"", headers={"Retry-After": str(math.ceil(retry_after))})
+        elif chance.random() < self.server.error_rate:
+            self.server.count_status(500)
+            self.send_body(500, b"")
+        elif 1 <= chapter_number <= self.server.chapter_count:
+            self.server.count_status(200)
+            self.send_body(200, self.server.pages[(chapter_number - 1) % len(self.server.pages)])
+        else:
+            self.send_body(404, b"")
+
+
+    def send_body(self, status: int, body: bytes, content_type: str = "text/html; charset=utf-8", headers: dict[str, str] | None = None) -> None:
+        """Send a whole response"""
+
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class NovelBinServer(http.server.ThreadingHTTPServer):
+    """NovelBin Server
+
+        Every chapter page is one of the pages it is given in turn. Each chapter request waits latency
+        seconds give or take jitter and then fails with a 500 error_rate of the time. Which attempts of which
+        chapters fail and how long they take only depends on seed, so every engine gets the same errors.
+        For burst_length seconds out of every burst_every seconds every chapter request is answered with a
+        429 and a Retry-After until the end of the burst.
+    """
+
+    daemon_threads = True
+
+
+    def __init__(self, pages: list[str], chapter_count: int, latency: float = 0.05, jitter: float = 0.02, error_rate: float = 0, burst_every: float = 0, burst_length: float = 1, seed: int = 0) -> None:
+        """Constructor
+
+            pages: the html of the chapter pages
+            chapter_count: number of chapters in the novel
+            latency: average number of seconds before a chapter is answered
+            jitter: max number of seconds the latency of a chapter is off by
+            error_rate: chance of a chapter request failing with a 500
+            burst_every: number of seconds between the start of each burst of 429, 0 for no bursts
+            burst_length: number of seconds a burst of 429 lasts
+            seed: seed of the latencies and errors
+        """
+
+        super().__init__(("127.0.0.1", 0), NovelBinHandler)
+        self.pages = [page.encode() for page in pages]
+        self.chapter_count = chapter_count
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.burst_every = burst_every
+        self.burst_length = burst_length
+        self.seed = seed
+
+        self.lock = threading.Lock()
+        self.start_time = time.monotonic()
+        self.attempts = {} # The number of requests for each chapter
+        self.status_counts = {} # The number of chapter responses with each status
+
+
+    @property
+    def homepage_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/b/{NOVEL_ID}"
+
+
+    def start(self) -> None:
+        """Serve requests in a daemon thread"""
+
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+
+    def reset(self) -> None:
+        """Forget the requests so far, so the next download gets the same errors and bursts as the first"""
+
+        with self.lock:
+            self.start_time = time.monotonic()
+            self.attempts = {}
+            self.status_counts = {}
+
+
+    def count_attempt(self, chapter_number: int) -> int:
+        """Count a request for a chapter and return how many were sent before it"""
+
+        with self.lock:
+            attempt = self.attempts.get(chapter_number, 0)
+            self.attempts[chapter_number] = attempt + 1
+            return attempt
+
+
+    def count_status(self, status: int) -> None:
+        with self.lock:
+            self.status_counts[status] = self.status_counts.get(status, 0) + 1
+
+
+    def get_burst_left(self) -> float | None:
+        """Get the number of seconds left in the burst of 429 going on now, None if there is none"""
+
+        if not self.burst_every:
+            return None
+        into_burst = (time.monotonic() - self.start_time) % self.burst_every
+        if into_burst >= self.burst_length:
+            return None
+        return self.burst_length - into_burst
+
+
+    def make_homepage(self) -> bytes:
+        """Make the homepage of the novel"""
+
+        return (
+            "<html><head>\n"
+            f"<meta property=\"og:novel:novel_name\" content=\"{NOVEL_TITLE}\">\n"
+            "<meta property=\"og:novel:author\" content=\"Benchmark Author\">\n"
+            f"<meta property=\"og:image\" content=\"http://127.0.0.1:{self.server_address[1]}/cover.jpg\">\n"
+            "</head><body></body></html>"
+        ).encode()
+
+
+    def make_chapter_archive(self) -> bytes:
+        """Make the list of every chapter's url"""
+
+        return "".join(
+            f"<li><a\n href=\"{self.homepage_url}/chapter-{i}\" title=\"Chapter {i}\">Chapter {i}</a></li>\n"
+            for i in range(1, self.chapter_count + 1)
+        ).encode()
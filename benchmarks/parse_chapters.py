@@ -0,0 +1,62 @@
+"""Micro-benchmark of chapter parsing
+
+    Times how long it takes to get the title and text out of saved chapter pages with the
+    extractors of a provider, next to the patterns they replaced.
+
+    Run from the root of the repository:
+        python -m benchmarks.parse_chapters [PAGE.html ...]
+
+    Without any pages a novelbin-like page is generated.
+"""
+
+import re
+import sys
+import timeit
+
+from src.providers.novel_bin import NovelBinDownloader
+
+
+def make_page(paragraphs: int) -> str:
+    """Make a page that looks like a novelbin chapter"""
+
+    header = "<html><head><script>var chapter = {title: \"Chapter 1: The Start\"};</script></head><body>\n" + "<div class=\"nav\"><a href=\"#\">Prev</a></div>\n" * 50
+    chapter = "".join(f"<p>{"Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 4}{i}</p>\n" for i in range(paragraphs))
+    footer = "<p>Report</p>\n<p>Comments</p>\n<p>Copyright</p>\n" + "<div class=\"footer\">footer</div>\n" * 200 + "</body></html>"
+    return header + chapter + footer
+
+
+def old_parse(text: str) -> tuple[str, str]:
+    """How NovelBinDownloader parsed chapters before it used extractors"""
+
+    title = re.search(r'title: "([^"]*)"', text).group(1)
+    all_text = re.findall(r'<p>((?=.*</p>).*?)</p>', text, re.DOTALL)[:-3]
+    return title, "\n".join(line.strip() for line in all_text)
+
+
+def new_parse(text: str) -> tuple[str, str]:
+    """How NovelBinDownloader parses chapters with its extractors"""
+
+    title = NovelBinDownloader.chapter_title_extractor.extract(text)
+    return title, NovelBinDownloader.chapter_text_extractor.extract(text)
+
+
+def main() -> None:
+    pages = {}
+    for path in sys.argv[1:]:
+        with open(path, encoding="utf-8") as f:
+            pages[path] = f.read()
+    if not pages:
+        pages = {f"generated ({paragraphs} paragraphs)": make_page(paragraphs) for paragraphs in (50, 200, 800)}
+
+    print(f"{"page":<35} {"size":>9} {"old ms":>9} {"new ms":>9} {"speedup":>8}")
+    for name, text in pages.items():
+        if old_parse(text) != new_parse(text):
+            print(f"{name}: the old and new parsers do not agree", file=sys.stderr)
+        number = 20
+        old_time = min(timeit.repeat(lambda: old_parse(text), number=number, repeat=3)) / number
+        new_time = min(timeit.repeat(lambda: new_parse(text), number=number, repeat=3)) / number
+        print(f"{name:<35} {len(text):>9} {old_time * 1000:>9.3f} {new_time * 1000:>9.3f} {old_time / new_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+import concurrent.futures
+import threading
+import time
+import urllib.parse
+from typing import TYPE_CHECKING, TextIO
+import click
+
+from src import constants
+from src.download import get_downloader
+
+if TYPE_CHECKING:
+    from src.downloader import Downloader
+
+
+@click.command()
+@click.help_option("-h", "--help")
+@click.argument("url_file", type=click.File("r"))
+@click.option("-n", "--novels", "novels", default=4, type=click.IntRange(1, clamp=True), show_default=True, help="Max number of novels downloading at once.", metavar="NOVELS")
+@click.option("-m", "--max-workers", "max_workers", default=20, type=click.IntRange(1, clamp=True), show_default=True, help="Number of threads downloading chapters, shared by every novel.", metavar="WORKERS")
+@click.option("-H", "--per-host", "per_host", default=10, type=click.IntRange(1, clamp=True), show_default=True, help="Max number of chapters downloading at once from each host.", metavar="CHAPTERS")
+@click.option("-r", "--rate", "rate", default=4.0, type=click.FloatRange(0, clamp=True), show_default=True, help="Requests per second to each host to start at (0 for no limit).", metavar="RATE")
+@click.option("-R", "--max-rate", "max_rate", default=20.0, type=click.FloatRange(0, clamp=True), show_default=True, help="Highest requests per second to each host the rate adapts to (0 to never change the rate).", metavar="RATE")
+@click.option("-v", "--verbose", "verbose", is_flag=True, default=False, help="Output extra information.")
+@click.option("-c", "--cache-size", "cache_size", default=500, type=click.IntRange(0, clamp=True), show_default=True, help="Max size of the chapter cache and of the http cache in MB (0 to not cache anything).", metavar="MB")
+@click.option("-t", "--ttl", "ttl", default=0, type=click.IntRange(0, clamp=True), show_default=True, help="Seconds the homepage, chapter list and cover are used from the http cache without asking the provider if they changed.", metavar="SECONDS")
+@click.option("-S", "--stream", "stream", is_flag=True, default=False, help="Write each chapter into the epub as soon as it is downloaded.")
+@click.option("--images/--no-images", "images", default=True, show_default=True, help="Put the images in chapters into the epub.")
+@click.option("-i", "--image-size", "image_size", default=0, type=click.IntRange(0, clamp=True), show_default=True, help="Max pixels of the longest side of the cover and images, bigger ones are scaled down (0 to keep their size, needs Pillow).", metavar="PIXELS")
+@click.option("-q", "--image-quality", "image_quality", default=0, type=click.IntRange(0, 95, clamp=True), show_default=True, help="Jpeg quality the cover and images are saved again at (0 for 85 with --image-size and to keep them otherwise, needs Pillow).", metavar="QUALITY")
+@click.option("-z", "--compression", "compression", default="normal", type=click.Choice(["store", "fast", "normal", "max"]), show_default=True, help="How much chapters are compressed, store writes the epub the fastest and max makes it the smallest.")
+@click.option("--stats", "stats", is_flag=True, default=False, help="Show how long each stage of each download took and how its chapters went.")
+@click.option("-T", "--trace", "trace", default=None, type=click.File("w"), help="Write every timed stage and chapter to a file as json lines.", metavar="FILE")
+def batch(url_file: click.File, novels: int, max_workers: int, per_host: int, rate: float, max_rate: float, verbose: bool, cache_size: int, ttl: int, stream: bool, images: bool, image_size: int, image_quality: int, compression: str, stats: bool, trace: click.File | None) -> None:
+    """Downloads every novel in a list of urls as epub files
+
+        URL_FILE: a file with the url to the homepage of a series on each line, use - to read
+        the urls from stdin. Empty lines and lines starting with # are skipped.
+
+        The provider of each url is automatically detected like in the download command.
+
+        Chapters of every novel are downloaded in one pool of max_workers threads so a novel with
+        a lot of chapters can use the threads a small one is done with. Novels from the same host
+        share one cloudflare session, at most per_host chapters downloading at once and the rate
+        limit.
+
+        A summary of every novel is shown once they are all done, with --stats it includes
+        how long each stage of every download took. Every novel writes to the same --trace file.
+    """
+
+    urls = [line.strip() for line in url_file if line.strip() and not line.strip().startswith("#")]
+    if not urls:
+        click.echo("No urls to download.", err=True)
+        return
+
+    start = time.monotonic()
+    with NovelPool(max_workers, per_host, rate, max_rate) as pool, concurrent.futures.ThreadPoolExecutor(max_workers=novels) as executor:
+        results = list(executor.map(lambda url: download_novel(pool, url, verbose, cache_size, ttl, stream, images, image_size, image_quality, compression, trace), urls))
+
+    downloaded = sum(1 for _, status, _, _ in results if status == "downloaded")
+    click.echo(f"\nDownloaded {downloaded}/{len(results)} novels in {time.monotonic() - start:.1f} seconds:")
+    for url, status, seconds, _ in results:
+        click.echo(f"\t{status} after {seconds:.1f} seconds: {url}")
+    if stats:
+        for _, _, _, downloader in results:
+            if downloader is not None:
+                click.echo(f"\n{downloader.stats.get_summary()}")
+
+
+class NovelPool:
+    """Novel Pool
+
+        Shares one pool of threads between every Downloader prepared with it, and one cloudflare
+        session, semaphore and rate limiter between every Downloader of the same host.
+    """
+
+
+    def __init__(self, max_workers: int, per_host: int, rate: float, max_rate: float) -> None:
+        """Constructor
+
+            max_workers: number of threads downloading chapters
+            per_host: max number of chapters downloading at once from each host
+            rate: number of requests per second to each host to start at, 0 for no limit
+            max_rate: the highest number of requests per second to each host the rate can adapt to, 0 to never change the rate
+        """
+
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        self.per_host = per_host
+        self.rate = rate
+        self.max_rate = max_rate
+        self.hosts = {} # host: (scraper, host_slots, rate_limiter)
+        self.lock = threading.Lock()
+
+
+    def __enter__(self) -> "NovelPool":
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.executor.shutdown(cancel_futures=True)
+
+
+    def prepare(self, downloader: "Downloader") -> None:
+        """Make the downloader use the shared threads and the shared state of its host"""
+
+        host = urllib.parse.urlparse(downloader.homepage_url).netloc
+        with self.lock:
+            if host not in self.hosts:
+                self.hosts[host] = (downloader.scraper, threading.Semaphore(self.per_host), downloader.create_rate_limiter(self.rate, self.max_rate))
+            downloader.scraper, downloader.host_slots, downloader.rate_limiter = self.hosts[host]
+        downloader.executor = self.executor
+
+
+def download_novel(pool: NovelPool, url: str, verbose: bool, cache_size: int, ttl: int, stream: bool, images: bool, image_size: int, image_quality: int, compression: str = "normal", trace: TextIO | None = None) -> tuple[str, str, float, "Downloader | None"]:
+    """Download one novel of a batch with the threaded engine
+
+        returns the url, what happened, how many seconds it took and the Downloader, None if there is no provider for the url
+    """
+
+    start = time.monotonic()
+    downloader = None
+    try:
+        downloader = get_downloader(url, None)(url)
+        downloader.stats.trace = trace
+        pool.prepare(downloader)
+        if downloader.download("threaded", 0, verbose, pool.per_host, pool.rate, pool.max_rate, cache_size * 1024 * 1024, stream, ttl=ttl, images=images, image_size=image_size, image_quality=image_quality, compression=compression):
+            status = "downloaded"
+        else:
+            status = "failed"
+    except constants.ProgError as e:
+        raise Exception(e)
+    except Exception as e:
+        click.echo(f"Error occurred while downloading {url}:\n\t{e}", err=True)
+        status = f"error ({e})"
+    return (url, status, time.monotonic() - start, downloader)
@@ -0,0 +1,212 @@
+import collections
+import concurrent.futures
+import mmap
+import posixpath
+import re
+import struct
+import threading
+import zipfile
+import zlib
+
+from src import constants
+from src.reader_index import ReaderIndex
+from src.wrap import WrappedChapter
+
+
+class Book:
+    """Book
+
+        Reads the chapters of an epub file made by the download command only when they are needed.
+
+        Opening the book only reads the package document and the table of contents to make an index
+        of each chapter's title and where its member is in the zip. A chapter is decompressed and
+        parsed into paragraphs the first time it is displayed, the parsed chapters are kept in a least
+        recently used cache, and the chapters next to the one being read are loaded in a background
+        thread so turning the page does not wait on them. Chapters are wrapped to each width they are
+        displayed at as they are scrolled through, and the wrapped chapters are cached too.
+
+        What is found out about the book is kept in a ReaderIndex so opening it again only reads the
+        index, and each chapter is read straight from the memory-mapped epub with the offsets in it.
+    """
+
+    LOCAL_HEADER = struct.Struct("<4s22xHH")
+    PARAGRAPH_PATTERN = re.compile(rb"<p>(.*?)</p>", re.DOTALL) # Same as ParagraphExtractor's, scans the chapter once
+
+
+    def __init__(self, filename: str, cache_size: int = 32) -> None:
+        """Constructor
+
+            filename: the path to the epub file
+            cache_size: max number of parsed chapters and of wrapped chapters kept in memory
+        """
+
+        self.filename = filename
+        self.cache_size = cache_size
+        self.cache = collections.OrderedDict()
+        self.wrapped = collections.OrderedDict()
+        self.loading = {}
+        self.lock = threading.Lock()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+        self.index = ReaderIndex(filename)
+        if not self.index.load():
+            self.index.titles, self.index.members = self.get_index()
+        self.titles = self.index.titles
+
+        with open(filename, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+    def __enter__(self) -> "Book":
+        return self
+
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+
+    def __len__(self) -> int:
+        return len(self.titles)
+
+
+    def get_index(self) -> tuple[list[str], list[tuple[int, int, int]]]:
+        """Get the title and the header offset, compressed size and compress type of the member in the zip
+            of every chapter in the order of the spine
+        """
+
+        from lxml import etree # Only needed when there is no reader index, so opening a novel again does not import it
+
+        with zipfile.ZipFile(self.filename) as zip_file:
+            container = etree.fromstring(zip_file.read("META-INF/container.xml"))
+            opf_path = container.find(".//container:rootfile", constants.NAMESPACES).get("full-path")
+            opf_dir = posixpath.dirname(opf_path)
+            opf = etree.fromstring(zip_file.read(opf_path))
+
+            hrefs = {item.get("id"): item.get("href") for item in opf.iterfind(".//opf:manifest/opf:item", constants.NAMESPACES)}
+            toc_titles = {}
+            if (ncx := opf.find(".//opf:item[@media-type='application/x-dtbncx+xml']", constants.NAMESPACES)) is not None:
+                ncx_path = posixpath.join(opf_dir, ncx.get("href"))
+                ncx_dir = posixpath.dirname(ncx_path)
+                for nav_point in etree.fromstring(zip_file.read(ncx_path)).iterfind(".//ncx:navPoint", constants.NAMESPACES):
+                    src = nav_point.find("ncx:content", constants.NAMESPACES).get("src").split("#")[0]
+                    toc_titles[posixpath.normpath(posixpath.join(ncx_dir, src))] = nav_point.findtext("ncx:navLabel/ncx:text", "", constants.NAMESPACES)
+
+            titles = []
+            members = []
+            for itemref in opf.iterfind(".//opf:spine/opf:itemref", constants.NAMESPACES):
+                href = hrefs.get(itemref.get("idref"))
+                if href is None or not posixpath.basename(href)[:1].isdigit():
+                    continue
+                member = posixpath.normpath(posixpath.join(opf_dir, href))
+                info = zip_file.getinfo(member)
+                titles.append(toc_titles.get(member) or f"Chapter {len(members) + 1}")
+                members.append((info.header_offset, info.compress_size, info.compress_type))
+        return (titles, members)
+
+
+    def get_position(self) -> tuple[int, int]:
+        """Get the chapter and line the book was last read at"""
+
+        if self.index.chapter >= len(self):
+            return (0, 0)
+        return (self.index.chapter, self.index.line)
+
+
+    def set_position(self, chapter_index: int, line_index: int) -> None:
+        """Set the chapter and line the book was last read at"""
+
+        self.index.chapter = chapter_index
+        self.index.line = line_index
+
+
+    def read_member(self, chapter_index: int) -> bytes:
+        """Read and decompress the member in the zip of a chapter"""
+
+        header_offset, compress_size, compress_type = self.index.members[chapter_index]
+        signature, name_length, extra_length = self.LOCAL_HEADER.unpack_from(self.map, header_offset)
+        if signature != b"PK\x03\x04":
+            raise Exception(f"{self.filename} changed while it was being read.")
+        data_offset = header_offset + self.LOCAL_HEADER.size + name_length + extra_length
+        data = self.map[data_offset:data_offset + compress_size]
+        if compress_type == zipfile.ZIP_STORED:
+            return data
+        if compress_type == zipfile.ZIP_DEFLATED:
+            return zlib.decompress(data, -15)
+        raise Exception(f"Chapter {chapter_index + 1} of {self.filename} is compressed with an unsupported method.")
+
+
+    def get_wrapped(self, chapter_index: int, width: int) -> WrappedChapter:
+        """Get a chapter wrapped to a width"""
+
+        key = (chapter_index, width)
+        if key in self.wrapped:
+            self.wrapped.move_to_end(key)
+        else:
+            self.wrapped[key] = WrappedChapter(self.get_text(chapter_index), width)
+            while len(self.wrapped) > self.cache_size:
+                self.wrapped.popitem(last=False)
+        return self.wrapped[key]
+
+
+    def get_text(self, chapter_index: int) -> list[str]:
+        """Get the text of each paragraph of a chapter, loading it if it is not cached"""
+
+        with self.lock:
+            if chapter_index in self.cache:
+                self.cache.move_to_end(chapter_index)
+                return self.cache[chapter_index]
+            future = self.loading.get(chapter_index)
+
+        if future is not None:
+            return future.result()
+        return self.load(chapter_index)
+
+
+    def prefetch(self, chapter_index: int) -> None:
+        """Start loading the chapters before and after a chapter in the background"""
+
+        for index in (chapter_index + 1, chapter_index - 1):
+            if not 0 <= index < len(self):
+                continue
+            with self.lock:
+                if index in self.cache or index in self.loading:
+                    continue
+                self.loading[index] = self.executor.submit(self.load, index)
+
+
+    def load(self, chapter_index: int) -> list[str]:
+        """Decompress and parse a chapter and cache the text of its paragraphs"""
+
+        try:
+            text = self.read_text(chapter_index)
+            with self.lock:
+                self.cache[chapter_index] = text
+                self.cache.move_to_end(chapter_index)
+                while len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+            return text
+        finally:
+            with self.lock:
+                self.loading.pop(chapter_index, None)
+
+
+    def read_text(self, chapter_index: int) -> list[str]:
+        """Decompress and parse a chapter into the text of its paragraphs without caching it"""
+
+        content = self.read_member(chapter_index)
+        if (paragraphs := self.index.get_paragraphs(chapter_index)) is None:
+            paragraphs = [match.span(1) for match in self.PARAGRAPH_PATTERN.finditer(content)]
+            self.index.set_paragraphs(chapter_index, paragraphs)
+        return [content[start:end].decode().strip() for start, end in paragraphs]
+
+
+    def close(self) -> None:
+        """Stop loading chapters, save the index and close the epub file"""
+
+        self.executor.shutdown(cancel_futures=True)
+        try:
+            self.index.write()
+        except OSError:
+            pass # Reading still works without an index, it is just slower to open next time
+        self.index.close()
+        self.map.close()
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import re
+import threading
+
+from src import constants
+
+
+def get_cache_dir() -> str:
+    """Get the directory every novel's chapter cache is stored in"""
+
+    return os.path.join(constants.get_root_dir(), ".n2epub_cache")
+
+
+class ChapterCache:
+    """Chapter Cache
+
+        Stores each chapter's html and parsed text on disk as soon as it is downloaded so a failed or
+        interrupted download can be resumed without fetching the chapters again.
+
+        Every novel gets its own directory inside the cache directory and each chapter is stored under
+        the sha256 of its url as <key>.html and <key>.json. Reading a chapter marks it as recently used,
+        and once the whole cache directory grows past max_size the least recently used files are deleted.
+    """
+
+
+    def __init__(self, novel_title: str, max_size: int, cache_dir: str | None = None) -> None:
+        """Constructor
+
+            novel_title: the title of the novel used to name its directory
+            max_size: max number of bytes the whole cache directory can use
+            cache_dir: where the cache is stored, defaults to get_cache_dir()
+        """
+
+        self.cache_dir = cache_dir or get_cache_dir()
+        self.novel_dir = os.path.join(self.cache_dir, re.sub(r"[^\w\-]+", "_", novel_title).strip("_"))
+        self.max_size = max_size
+        self.lock = threading.Lock()
+
+        os.makedirs(self.novel_dir, exist_ok=True)
+        self.size = sum(os.path.getsize(path) for path in self.get_all_files())
+
+
+    @staticmethod
+    def get_key(url: str) -> str:
+        """Get the key a chapter is stored under"""
+
+        return hashlib.sha256(url.encode()).hexdigest()
+
+
+    def get(self, url: str) -> tuple[str, str] | None:
+        """Get the chapter's title and text if it is cached"""
+
+        path = os.path.join(self.novel_dir, self.get_key(url) + ".json")
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return (data["title"], data["text"])
+
+
+    def put(self, url: str, html: str, title: str, text: str) -> None:
+        """Store a downloaded chapter
+
+            url: the url of the chapter
+            html: the html of the chapter's page
+            title: the chapter's parsed title
+            text: the chapter's parsed text
+        """
+
+        key = self.get_key(url)
+        written = 0
+        # The json is written last and atomically since it is what marks the chapter as cached
+        for suffix, content in ((".html", html), (".json", json.dumps({"url": url, "title": title, "text": text}))):
+            path = os.path.join(self.novel_dir, key + suffix)
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                f.write(content)
+            os.replace(path + ".tmp", path)
+            written += os.path.getsize(path)
+
+        with self.lock:
+            self.size += written
+            if self.size > self.max_size:
+                self.evict()
+
+
+    def evict(self) -> None:
+        """Delete the least recently used files until the cache fits in max_size"""
+
+        files = []
+        for path in self.get_all_files():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+
+        self.size = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if self.size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.size -= size
+
+
+    def get_all_files(self) -> list[str]:
+        """Get the paths of every chapter file in the whole cache directory
+
+            The http responses and the indexes of the read and search commands are also in the
+            cache directory but are kept in their own directories with their own suffixes.
+        """
+
+        return [
+            os.path.join(root, file_name)
+            for root, _, file_names in os.walk(self.cache_dir)
+            for file_name in file_names
+            if file_name.endswith(".html") or file_name.endswith(".json")
+        ]
@@ -0,0 +1,74 @@
+import threading
+from typing import Iterable, Iterator
+
+
+class ChapterUrls:
+    """Chapter Urls
+
+        The urls of a novel's chapters, found in a background thread so chapters can be downloaded
+        while the rest of the urls are still being found (like the later pages of a table of contents).
+
+        Iterating gives the (index, url) of each chapter as soon as it is found, and get can be called
+        from any thread. The length is the number of urls found so far.
+    """
+
+
+    def __init__(self, urls: Iterable[str]) -> None:
+        """Constructor
+
+            urls: the urls in order, a list is used as is and anything else is read in a background thread
+        """
+
+        self.condition = threading.Condition()
+        self.error = None # What the background thread raised, raised again in the thread using the urls
+        if isinstance(urls, (list, tuple)):
+            self.urls = list(urls)
+            self.done = True
+            return
+
+        self.urls = []
+        self.done = False
+        threading.Thread(target=self.find, args=(urls,), daemon=True).start()
+
+
+    def __len__(self) -> int:
+        return len(self.urls)
+
+
+    def __iter__(self) -> Iterator[tuple[int, str]]:
+        index = 0
+        while (url := self.get(index)) is not None:
+            yield (index, url)
+            index += 1
+
+
+    def find(self, urls: Iterable[str]) -> None:
+        """Read the urls, runs in the background thread"""
+
+        try:
+            for url in urls:
+                with self.condition:
+                    self.urls.append(url)
+                    self.condition.notify_all()
+        except Exception as e:
+            self.error = e
+        finally:
+            with self.condition:
+                self.done = True
+                self.condition.notify_all()
+
+
+    def get(self, index: int) -> str | None:
+        """Get the url at an index, waiting for it to be found
+
+            returns None if there are fewer urls than that
+        """
+
+        with self.condition:
+            self.condition.wait_for(lambda: index < len(self.urls) or self.done)
+            if index < len(self.urls):
+                return self.urls[index]
+            if self.error is not None:
+                raise Exception(f"Could not get every chapter's url: {self.error}")
+            return None
+
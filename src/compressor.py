@@ -0,0 +1,97 @@
+import concurrent.futures
+import os
+import threading
+import zipfile
+from typing import Callable
+import zlib
+
+from src import constants
+from src.zip_writer import ZipWriter
+
+
+class Compressor:
+    """Compressor
+
+        Deflates the chapters of an epub in a pool of threads so they are compressed on every core
+        at once (zlib lets go of the GIL while it compresses), they are then written into the zip
+        already compressed with ZipWriter.write_raw in the order they have to be in.
+
+        Levels:
+            store: chapters are not compressed, the fastest to write and the biggest file
+            fast: zlib level 1
+            normal: zlib level 6, what zip files are usually compressed with
+            max: zlib level 9, the smallest file and the slowest to write
+    """
+
+    LEVELS = {"store": 0, "fast": 1, "normal": 6, "max": 9}
+
+
+    def __init__(self, level: str = "normal", max_workers: int = 0) -> None:
+        """Constructor
+
+            level: one of LEVELS
+            max_workers: number of threads compressing, 0 for one per cpu
+        """
+
+        if level not in self.LEVELS:
+            raise constants.ProgError(f"{level} is not a compression level.")
+
+        self.level = level
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers or os.cpu_count() or 1, thread_name_prefix="compress")
+        self.lock = threading.Lock()
+        self.count = 0 # Number of chapters compressed
+        self.size = 0 # Number of bytes of the chapters before they were compressed
+        self.compressed_size = 0 # Number of bytes of the chapters once compressed
+
+
+    def submit(self, data: bytes, prepare: Callable[[bytes], bytes] | None = None) -> concurrent.futures.Future:
+        """Start compressing a chapter
+
+            data: the chapter
+            prepare: changes the chapter in the compressor's threads before it is compressed
+
+            returns a future of the (raw, crc, size, method) of the chapter to give to ZipWriter.write_raw
+        """
+
+        return self.executor.submit(self.compress, data, prepare)
+
+
+    def compress(self, data: bytes, prepare: Callable[[bytes], bytes] | None = None) -> tuple[bytes, int, int, int]:
+        """Compress a chapter, runs in the compressor's threads"""
+
+        if prepare is not None:
+            data = prepare(data)
+        if self.level == "store":
+            raw, method = data, zipfile.ZIP_STORED
+        else:
+            raw, method = ZipWriter.deflate(data, self.LEVELS[self.level]), zipfile.ZIP_DEFLATED
+        crc = zlib.crc32(data)
+        with self.lock:
+            self.count += 1
+            self.size += len(data)
+            self.compressed_size += len(raw)
+        return (raw, crc, len(data), method)
+
+
+    def write(self, writer: ZipWriter, name: str, data: bytes) -> None:
+        """Write a member at the compressor's level right away, for the few members too small to be worth a thread"""
+
+        writer.write(name, data, self.level != "store", self.LEVELS[self.level])
+
+
+    def get_summary(self, seconds: float) -> str:
+        """Get how many chapters were compressed and how many bytes it saved
+
+            seconds: how long packaging the epub held up the download
+        """
+
+        return (
+            f"Packaged {self.count} chapters in {seconds:.2f} seconds ({self.level}), {self.size / 1024 / 1024:.1f} MB "
+            f"compressed to {self.compressed_size / 1024 / 1024:.1f} MB ({(self.size - self.compressed_size) / 1024 / 1024:.1f} MB saved)."
+        )
+
+
+    def close(self) -> None:
+        """Stop the threads, chapters that did not start compressing are dropped"""
+
+        self.executor.shutdown(cancel_futures=True)
@@ -1,19 +1,34 @@
-import importlib
+from typing import TYPE_CHECKING
 import click
 
-from src import constants
-from src.providers.novel_bin import NovelBinDownloader
+from src import constants, providers
+
+if TYPE_CHECKING: # Importing a Downloader imports cloudscraper, requests and ebooklib so it is only done once a download starts
+    from src.downloader import Downloader
 
 
 @click.command()
 @click.help_option("-h", "--help")
 @click.argument("url")
 @click.option("-p", "--provider", "provider", is_flag=False, flag_value="", type=click.STRING, default=None, help="Name of the provider (website) of the novel.", metavar="PROVIDER")
-@click.option("-s", "--sync", "sync", is_flag=True, default=True, help="Download synchronously.")
-@click.option("-w", "--wait", "wait_time", default=3, type=click.IntRange(0, clamp=True), show_default=True, help="Time between each chapter.", metavar="TIME")
+@click.option("-s", "--sync", "sync", is_flag=True, default=False, help="Download synchronously (same as --engine sync).")
+@click.option("-e", "--engine", "engine", default="threaded", type=click.Choice(["sync", "threaded", "async", "pipeline"]), show_default=True, help="How chapters are downloaded.")
+@click.option("-w", "--wait", "wait_time", default=3, type=click.IntRange(0, clamp=True), show_default=True, help="Time between each chapter to start at in sync.", metavar="TIME")
 @click.option("-v", "--verbose", "verbose", is_flag=True, default=False, help="Output extra information.")
-@click.option("-m", "--max-workers", "max_workers", default=10, type=click.IntRange(1, clamp=True), show_default=True, help="Chapter group size to be downloaded at once in async.", metavar="WORKERS")
-def download(url: str, provider: str | None, sync: bool, wait_time: int, verbose: bool, max_workers: int) -> None:
+@click.option("-m", "--max-workers", "max_workers", default=10, type=click.IntRange(1, clamp=True), show_default=True, help="Max number of chapters downloading at once in threaded, async and pipeline.", metavar="WORKERS")
+@click.option("-P", "--processes", "processes", default=0, type=click.IntRange(0, clamp=True), show_default=True, help="Number of processes parsing chapters in pipeline (0 for one per cpu).", metavar="PROCESSES")
+@click.option("-r", "--rate", "rate", default=4.0, type=click.FloatRange(0, clamp=True), show_default=True, help="Requests per second to start at in threaded, async and pipeline (0 for no limit).", metavar="RATE")
+@click.option("-R", "--max-rate", "max_rate", default=20.0, type=click.FloatRange(0, clamp=True), show_default=True, help="Highest requests per second the rate adapts to (0 to never change the rate).", metavar="RATE")
+@click.option("-c", "--cache-size", "cache_size", default=500, type=click.IntRange(0, clamp=True), show_default=True, help="Max size of the chapter cache and of the http cache in MB (0 to not cache anything).", metavar="MB")
+@click.option("-t", "--ttl", "ttl", default=0, type=click.IntRange(0, clamp=True), show_default=True, help="Seconds the homepage, chapter list and cover are used from the http cache without asking the provider if they changed.", metavar="SECONDS")
+@click.option("-S", "--stream", "stream", is_flag=True, default=False, help="Write each chapter into the epub as soon as it is downloaded.")
+@click.option("--images/--no-images", "images", default=True, show_default=True, help="Put the images in chapters into the epub.")
+@click.option("-i", "--image-size", "image_size", default=0, type=click.IntRange(0, clamp=True), show_default=True, help="Max pixels of the longest side of the cover and images, bigger ones are scaled down (0 to keep their size, needs Pillow).", metavar="PIXELS")
+@click.option("-q", "--image-quality", "image_quality", default=0, type=click.IntRange(0, 95, clamp=True), show_default=True, help="Jpeg quality the cover and images are saved again at (0 for 85 with --image-size and to keep them otherwise, needs Pillow).", metavar="QUALITY")
+@click.option("-z", "--compression", "compression", default="normal", type=click.Choice(["store", "fast", "normal", "max"]), show_default=True, help="How much chapters are compressed, store writes the epub the fastest and max makes it the smallest.")
+@click.option("--stats", "stats", is_flag=True, default=False, help="Show how long each stage of the download took and how each chapter went.")
+@click.option("-T", "--trace", "trace", default=None, type=click.File("w"), help="Write every timed stage and chapter to a file as json lines.", metavar="FILE")
+def download(url: str, provider: str | None, sync: bool, engine: str, wait_time: int, verbose: bool, max_workers: int, processes: int, rate: float, max_rate: float, cache_size: int, ttl: int, stream: bool, images: bool, image_size: int, image_quality: int, compression: str, stats: bool, trace: click.File | None) -> None:
     """Downloads a novel from a url as an epub file
 
         URL: the url to the homepage of the series to download.
@@ -23,52 +38,99 @@ def download(url: str, provider: str | None, sync: bool, wait_time: int, verbose
 
         Use --provider as a flag to pick from a list of available providers.
 
+        The threaded engine downloads chapters in a pool of threads, the async engine uses
+        asyncio and aiohttp with one keep-alive connection per worker and no thread per
+        request. The pipeline engine downloads in a pool
+        of threads and parses chapters in a pool of processes, which is faster when parsing
+        is what holds the download back (fast providers, many workers).
+
         Only in sync wait_time is the number of seconds to wait between downloading each chapter.
 
-        Only in async max_workers is the size of the group of chapters to be downloaded at once.
+        Only in threaded, async and pipeline max_workers is the number of chapters being downloaded at once,
+        a new one is started as soon as any other finishes.
+
+        Only in pipeline processes is the number of processes parsing chapters.
+
+        Only in threaded, async and pipeline rate is the number of requests started each second.
+
+        The rate (or wait_time in sync) is only where downloading starts. While the provider answers
+        quickly the rate goes up to max_rate, and when it starts throttling (429, 503, cloudflare
+        challenges) the rate is halved and any Retry-After header is waited out.
+
+        Each chapter is cached as soon as it is downloaded so if a download fails, running
+        the same command again only downloads the chapters that are missing. Once the cache
+        is bigger than cache_size the least recently used chapters are deleted.
+
+        The homepage, the list of chapters and the cover are kept in an http cache too. They are
+        used without being downloaded again for ttl seconds, after that the provider is asked if
+        they changed and they are only downloaded again if they did.
+
+        With --stream chapters are not kept in memory until every chapter is downloaded,
+        which keeps memory use flat no matter how many chapters the novel has.
+
+        The epub is written next to the executable through a temporary file that is only renamed
+        once it is complete. Chapters are compressed on every core at once, --compression trades
+        the time that takes for the size of the epub.
+
+        The cover and the images in chapters are downloaded in their own threads while chapters
+        are downloading, an image used more than once is only downloaded and stored once.
+        With --image-size or --image-quality (and Pillow installed) they are scaled down and
+        saved again as jpeg, which makes epubs with a lot of images much smaller for e-readers.
+
+        --stats shows how long fetching, retrying, parsing, building pages and writing the
+        epub took once the download is done, along with the size, retries and latency of the
+        chapters. --trace writes every one of them to a file as json lines as they happen.
     """
 
+    if sync:
+        engine = "sync"
+    downloader = None
     try:
-        if provider is None:
-            if url.startswith("https://novelbin"):
-                NovelBinDownloader(url).download(sync, wait_time, verbose, max_workers)
-            else:
-                raise Exception(f"{url} does not match any known provider (use --provider to explicitly specify a provider).")
-            return
-        if provider == "":
-            provider = get_provider()
-
-        provider_dict = importlib.import_module("src.providers." + provider).__dict__
-        downloader = list(provider_dict.values())[-1]
-        downloader(url).download(sync, wait_time, verbose, max_workers)
+        downloader = get_downloader(url, provider)(url)
+        downloader.stats.trace = trace
+        downloader.download(engine, wait_time, verbose, max_workers, rate, max_rate, cache_size * 1024 * 1024, stream, processes, ttl, images, image_size, image_quality, compression)
     except constants.ProgError as e:
         raise Exception(e)
-    except ModuleNotFoundError:
-        click.echo(f"{provider} is not a valid provider.", err=True)
     except Exception as e:
         click.echo(f"Error occurred while downloading:\n\t{e}", err=True)
+    finally:
+        if stats and downloader is not None:
+            click.echo(f"\n{downloader.stats.get_summary()}")
+
+
+def get_downloader(url: str, provider: str | None) -> type["Downloader"]:
+    """Gets the Downloader class of the provider
 
+        url: the url to the homepage of the series
+        provider: the name of the provider, None to detect it from the url or "" to let the user pick one
+
+        Only the module of the provider is imported.
+    """
 
-def get_provider() -> str:
+    if provider is None:
+        if (found := providers.find_provider(url)) is None:
+            raise Exception(f"{url} does not match any known provider (use --provider to explicitly specify a provider).")
+        return found.load()
+    if provider == "":
+        return get_provider().load()
+
+    if (found := providers.get_provider(provider)) is None:
+        raise Exception(f"{provider} is not a valid provider.")
+    return found.load()
+
+
+def get_provider() -> providers.Provider:
     """Gets user selected provider from list of available providers"""
 
     click.clear()
-    file_num = 1
-    providers = []
-    for file_name in [key for key in importlib.import_module("src.providers").__dict__.keys() if not key.startswith("__")]:
-        provider_dict = importlib.import_module("src.providers." + file_name).__dict__
-        downloader_class = list(provider_dict.values())[-1]
-        click.echo(f"{file_num}. {downloader_class.__doc__ or downloader_class.__name__} ({file_name})")
-        providers.append(file_name)
-
-        file_num += 1
+    for file_num, provider in enumerate(providers.PROVIDERS, start=1):
+        click.echo(f"{file_num}. {provider.title} ({provider.name})")
 
     click.echo("Enter the name of the provider (the name in the last set of parentheses):")
     while True:
-        provider = click.get_text_stream("stdin").readline().strip()
-        for prov in providers:
-            if provider == prov:
-                click.clear()
-                return provider
+        name = click.get_text_stream("stdin").readline().strip()
+        if (provider := providers.get_provider(name)) is not None:
+            click.clear()
+            return provider
 
-        click.echo("\nEnter a valid provider:")
\ No newline at end of file
+        click.echo("\nEnter a valid provider:")
@@ -1,13 +1,24 @@
+import asyncio
 import concurrent.futures
 import os
-import pathlib
 import time
+from typing import Callable, Iterable, Iterator
+import aiohttp
 import click
 import cloudscraper
 import requests
 from ebooklib import epub
 
-from src import constants
+from src import constants, pipeline
+from src.cache import ChapterCache
+from src.chapter_urls import ChapterUrls
+from src.epub_writer import StreamingEpubWriter
+from src.extractors import Extractor
+from src.http_cache import HttpCache
+from src.http_client import create_async_session, get_async
+from src.images import ImageStore
+from src.rate_limit import AdaptiveRateLimiter, RateLimiter, is_throttled
+from src.stats import DownloadStats
 
 
 class Downloader:
@@ -20,9 +31,31 @@ class Downloader:
             get_novel_title(self, response: requests.Response) -> str: MUST be implemented in order to get the novel's title.
             The other three (get_chapter_title, get_cover_image_url, get_novel_author) are not required, but you probably should implement them.
 
+            Instead of implementing a get method, the matching extractor (like chapter_text_extractor for get_chapter_text)
+            can be declared as a class attribute and it will be called with the response.
+
+            Other pages that are requested on every download (like a separate list of chapters) should be
+            requested with self.fetch so they go through the http cache.
+
+            If the table of contents is split into pages, get_toc_page_urls(self, response: requests.Response) -> list[str]
+            can return the url of every page. They are then downloaded at the same time and get_all_chapter_urls is called
+            with each page, chapters start downloading as soon as the first page is done.
+
         After these conditions are fulfilled simply call the download method.
     """
 
+    max_attempts = 5
+    max_image_attempts = 3
+    max_toc_workers = 8 # Max number of pages of the table of contents downloading at once
+    max_async_threads = 4 # Max number of threads the async engine reads the cache and builds pages in
+
+    chapter_urls_extractor: Extractor | None = None
+    chapter_title_extractor: Extractor | None = None
+    chapter_text_extractor: Extractor | None = None
+    cover_image_url_extractor: Extractor | None = None
+    novel_title_extractor: Extractor | None = None
+    novel_author_extractor: Extractor | None = None
+
 
     def __init__(self, homepage_url: str) -> None:
         """Constructor
@@ -32,201 +65,753 @@ class Downloader:
 
         self.homepage_url = homepage_url
         self.scraper = cloudscraper.create_scraper()
+        self.cache = None
+        self.http_cache = None
+        self.stats = DownloadStats(homepage_url) # How long each stage took and how each chapter went
+        self.images = None # Downloads the cover and the images in chapters, made by download
+        self.writer = None # Epub chapters are streamed into, no chapter is started while its reorder buffer is full
+
+        # Set by whatever runs several downloads at once so they share threads and limits
+        self.executor = None # Runs threaded downloads instead of a new pool for each novel
+        self.host_slots = None # Semaphore limiting the chapters in flight to the novel's host
+        self.rate_limiter = None # Shared by every novel from the same host
 
 
-    def download(self, threaded: bool, wait_time: int, verbose: bool, max_workers: int) -> None:
+    def download(self, engine: str, wait_time: int, verbose: bool, max_workers: int, rate: float, max_rate: float, cache_size: int, stream: bool = False, processes: int = 0, ttl: int = 0, images: bool = True, image_size: int = 0, image_quality: int = 0, compression: str = "normal") -> bool:
         """Download all chapters as an epub file
 
-            threaded: get chapters asynchronously if true
+            engine: how to get chapters, one of "sync", "threaded", "async" or "pipeline"
+            verbose: output extra information
+            max_rate: the highest number of requests per second the rate can adapt to, 0 to never change the rate
+            cache_size: max number of bytes the chapter cache and the http cache can each use, 0 to not cache anything
+            stream: write each chapter into the epub as soon as it is downloaded instead of keeping them all in memory,
+                    no chapter is started while too many are waiting for an earlier one
+            ttl: number of seconds the homepage, list of chapters and cover are used from the http cache without checking if they changed
+            images: put the images in chapters into the epub, otherwise they are left out
+            image_size: max number of pixels of the longest side of the cover and images, 0 to keep their size (needs Pillow)
+            image_quality: jpeg quality the cover and images are saved again at, 0 to only do it when image_size is given (needs Pillow)
+            compression: how much chapters are compressed in the epub, one of Compressor.LEVELS
+
+            The epub is written to the directory of the executable through a temporary file, so a
+            failed download never leaves a broken epub behind. Chapters are compressed on every core.
+
+            The cover and images are downloaded in their own threads while chapters are downloading,
+            chapters are only pointed to their images when they are written.
 
             Sync:
-                wait_time: number of seconds to wait between downloading each chapter, cloudflare can time out if it goes too fast and I find 3 seconds to work fine
-                verbose: ignored
+                wait_time: number of seconds to start waiting between downloading each chapter at, cloudflare can time out if it goes too fast and I find 3 seconds to work fine
                 max_workers: ignored
-            Async:
+                rate: ignored
+            Threaded, Async and Pipeline:
                 wait_time: ignored
-                verbose: output extra information
                 max_workers: max number of concurrent downloads
+                rate: number of requests started per second to start at, 0 for no limit
+            Pipeline:
+                processes: number of processes parsing chapters, 0 for one per cpu
+
+            returns False if a chapter failed to download
         """
 
-        home_page_response = self.scraper.get(self.homepage_url)
+        if cache_size:
+            self.http_cache = HttpCache(cache_size, ttl)
+        with self.stats.time("homepage"):
+            home_page_response = self.fetch(self.homepage_url)
 
-        urls = self.get_all_chapter_urls(home_page_response)
+        urls = ChapterUrls(self.iter_chapter_urls(home_page_response))
         novel_title = self.get_novel_title(home_page_response)
         novel_author = self.get_novel_author(home_page_response)
         cover_image_url = self.get_cover_image_url(home_page_response)
 
-        if os.path.exists(os.path.join(constants.get_root_dir(), novel_title + ".epub")):
-            raise Exception(f"{os.path.join(constants.get_root_dir(), novel_title + ".epub")} already exists.")
-
-        book = epub.EpubBook()
-        book.set_identifier(f"{novel_title} {len(urls)}")
-        book.set_title(novel_title)
-        book.set_language("en")
-        if novel_author:
-            book.add_author(novel_author)
-
-        if cover_image_url:
-            cover_image_response = self.scraper.get(cover_image_url)
-            book.set_cover("cover" + pathlib.Path(cover_image_url).suffix, cover_image_response.content)
-            cover = epub.EpubHtml(title="Cover", file_name="cover_page.xhtml")
-            cover.content = "<img src=\"cover.jpg\" width=\"100%\" height=\"100%\">"
-            book.add_item(cover)
-            book.toc.append(cover)
-
-            book.spine = ["cover", cover, "nav"]
-        else:
-            book.spine = ["nav"]
-
-        if not threaded:
-            chapters = self.download_chapters(urls, wait_time)
-        else:
-            chapters = self.download_chapters_threaded(urls, verbose, max_workers)
-
-        if chapters is None:
-            return
-        for chapter in chapters:
-            book.add_item(chapter)
-            book.toc.append(chapter)
-            book.spine.append(chapter)
+        filename = os.path.join(constants.get_root_dir(), novel_title + ".epub")
+        if os.path.exists(filename):
+            raise Exception(f"{filename} already exists.")
+
+        if cache_size:
+            self.cache = ChapterCache(novel_title, cache_size)
+
+        self.images = ImageStore(self.fetch_image, image_size, image_quality, images, self.stats.add_stage)
+        writer = None
+        try:
+            cover_future = self.images.submit(cover_image_url, self.fetch_cover) if cover_image_url else None
+            writer = StreamingEpubWriter(filename, novel_title, novel_title, novel_author, self.homepage_url, compression=compression, images=self.images)
+            if stream:
+                self.writer = writer
+
+            chapters = {} # Only used without stream, chapters are added once every one of them is downloaded
+
+            def add_chapter(index: int, chapter: epub.EpubHtml) -> None:
+                if not stream:
+                    chapters[index] = chapter
+                    return
+                with self.stats.time("write"):
+                    writer.add(index, chapter, urls.get(index))
+
+            if not self.get_chapter_pages(urls, add_chapter, engine, wait_time, verbose, max_workers, rate, max_rate, processes=processes):
+                writer.abort()
+                if self.cache is not None:
+                    click.echo("Chapters that were downloaded are cached and will not be downloaded again on the next run.")
+                return False
+            writer.identifier = f"{novel_title} {len(urls)}" # Every url is found once every chapter is downloaded
+            with self.stats.time("write"):
+                for index in range(len(chapters)):
+                    writer.add(index, chapters.pop(index), urls.get(index))
+                writer.flush(True) # Every image of the chapters is downloaded once they are written
+                if (cover_image_name := cover_future.result() if cover_future else None) is not None:
+                    writer.set_cover(cover_image_name, self.images.read(cover_image_name))
+                for file_name in self.images.file_names:
+                    if file_name != cover_image_name:
+                        writer.add_image(file_name, self.images.read(file_name))
+                writer.close()
+        except BaseException:
+            if writer is not None:
+                writer.abort()
+            raise
+        finally:
+            self.writer = None
+            self.images.close()
+
+        self.echo_images()
+        click.echo(writer.get_summary())
+        click.echo(f"\nDownloaded {filename}.")
+        return True
+
+
+    def echo_images(self) -> None:
+        """Show how many images were put into the epub if there were any"""
+
+        if self.images.file_names or self.images.failed:
+            click.echo(self.images.get_summary())
+
+
+    def is_backed_up(self) -> bool:
+        """Check if too many chapters are waiting to be written to start another"""
+
+        return self.writer is not None and self.writer.is_full()
+
+
+    def get_chapter_pages(self, urls: Iterable[str] | ChapterUrls, on_chapter: Callable[[int, epub.EpubHtml], None], engine: str, wait_time: int, verbose: bool, max_workers: int, rate: float, max_rate: float, first_chapter_number: int = 1, processes: int = 0) -> bool:
+        """Download chapters with the engine as epub.Html
+
+            urls: urls to download, they are found in the background while chapters are downloaded if it is not a list
+            on_chapter: called with the index of the url and the chapter's page as soon as each chapter is downloaded
+            engine: how to get chapters, one of "sync", "threaded", "async" or "pipeline"
+            first_chapter_number: the chapter number of the first url
+
+            The rest of the arguments are the same as in download.
+
+            returns False if a chapter failed to download
+        """
+
+        if not isinstance(urls, ChapterUrls):
+            urls = ChapterUrls(urls)
+        if engine == "sync":
+            rate = 1 / wait_time if wait_time else 0
+        rate_limiter = self.rate_limiter or self.create_rate_limiter(rate, max_rate)
+
+        if engine == "sync":
+            return self.download_chapters(urls, on_chapter, verbose, rate_limiter, first_chapter_number)
+        if engine == "threaded":
+            return self.download_chapters_threaded(urls, on_chapter, verbose, max_workers, rate_limiter, first_chapter_number)
+        if engine == "async":
+            return asyncio.run(self.download_chapters_async(urls, on_chapter, verbose, max_workers, rate_limiter, first_chapter_number))
+        if engine == "pipeline":
+            return self.download_chapters_pipeline(urls, on_chapter, verbose, max_workers, processes, rate_limiter, first_chapter_number)
+        raise constants.ProgError(f"{engine} is not a download engine.")
+
+
+    def fetch(self, url: str) -> requests.Response:
+        """Request a page that is requested on every download through the http cache if there is one"""
+
+        if self.http_cache is None:
+            return self.scraper.get(url)
+        return self.http_cache.get(self.scraper, url)
 
-        book.add_item(epub.EpubNcx())
-        book.add_item(epub.EpubNav())
 
-        epub.write_epub(novel_title + ".epub", book)
-        click.echo(f"\nDownloaded {os.path.join(constants.get_root_dir(), novel_title + ".epub")}.")
+    def fetch_cover(self, url: str) -> bytes | None:
+        """Download the cover through the http cache, runs in the threads of the image store
 
+            returns None if it could not be downloaded
+        """
+
+        with self.stats.time("cover"):
+            response = self.fetch(url)
+        return response.content if response.status_code == 200 else None
+
+
+    def fetch_image(self, url: str) -> bytes | None:
+        """Download an image in a chapter, retrying when it fails, runs in the threads of the image store
+
+            returns None if every attempt failed
+        """
+
+        for attempt in range(self.max_image_attempts):
+            with self.stats.time("image"):
+                try:
+                    response = self.scraper.get(url, timeout=15)
+                except requests.RequestException:
+                    response = None
+            if response is not None and response.status_code == 200:
+                return response.content
+            if response is not None and response.status_code < 500 and response.status_code != 429: # It will not be there on the next attempt either
+                return None
+            if attempt < self.max_image_attempts - 1:
+                time.sleep(attempt + 1)
+        return None
+
+
+    @staticmethod
+    def create_rate_limiter(rate: float, max_rate: float) -> RateLimiter:
+        """Create the rate limiter every request of a download waits on
+
+            rate: number of requests per second to start at, 0 for no limit
+            max_rate: the highest number of requests per second the rate can adapt to, 0 to never change the rate
+        """
 
-    def download_chapters(self, urls: list[str], wait_time: int) -> list[epub.EpubHtml]:
+        if max_rate:
+            return AdaptiveRateLimiter(rate, max_rate)
+        return RateLimiter(rate)
+
+
+    def download_chapters(self, urls: ChapterUrls, on_chapter: Callable[[int, epub.EpubHtml], None], verbose: bool, rate_limiter: RateLimiter, first_chapter_number: int = 1) -> bool:
         """Download all chapters synchronously as epub.Html
 
-            urls: list of urls to download
-            wait_time: number of seconds to wait between downloading each chapter
-        """
-
-        chapters = []
-        for i, url in enumerate(urls):
-            chapter_response = self.scraper.get(url, timeout=15)
-            chapter_title = self.get_chapter_title(chapter_response) or f"Chapter {i+1}"
-            chapter_text = self.get_chapter_text(chapter_response)
-            chapter = epub.EpubHtml(title=chapter_title, file_name=f"{i+1}_{"_".join(chapter_title.split(" "))}.xhtml")
-            chapter.content = """<html>
-                <h1>{chapter_title}</h1>
-                {chapter_text}
-            </html>""".format(chapter_title=chapter_title, chapter_text="\n".join([f"<p>{line}</p>" for line in chapter_text.splitlines()]))
-            chapters.append(chapter)
+            urls: urls to download, chapters start downloading while the rest are still being found
+            on_chapter: called with the index of the url and the chapter's page as soon as each chapter is downloaded
+            verbose: output extra information
+            rate_limiter: limiter every request waits on before being sent
+            first_chapter_number: the chapter number of the first url
+        """
+
+        for i, url in urls:
+            if (cached := self.get_cached_chapter_page(url, first_chapter_number + i)) is not None:
+                chapter, chapter_title = cached
+                on_chapter(i, chapter)
+                click.echo(f"Got {chapter_title} from the cache ({i + 1}/{len(urls)}).")
+                continue
+            if (chapter_response := self.fetch_chapter(self.scraper, url, verbose, rate_limiter)) is None:
+                click.echo(f"Download failed at {url} for {self.homepage_url}.")
+                return False
+            chapter, chapter_title = self.build_chapter_page(chapter_response, url, first_chapter_number + i)
+            on_chapter(i, chapter)
             click.echo(f"Got {chapter_title} at {url} ({i + 1}/{len(urls)}).")
-            time.sleep(wait_time)
-        return chapters
+        return True
 
 
-    def download_chapters_threaded(self, urls: list[str], verbose: bool, max_workers: int) -> list[epub.EpubHtml] | None:
+    def download_chapters_threaded(self, urls: ChapterUrls, on_chapter: Callable[[int, epub.EpubHtml], None], verbose: bool, max_workers: int, rate_limiter: RateLimiter, first_chapter_number: int = 1) -> bool:
         """Download all chapters asynchronously as epub.Html
 
-            urls: list of urls to download
+            urls: urls to download, chapters start downloading while the rest are still being found
+            on_chapter: called with the index of the url and the chapter's page as soon as each chapter is downloaded
             verbose: output extra information
             max_workers: max number of concurrent downloads
+            rate_limiter: limiter every request waits on before being sent
+            first_chapter_number: the chapter number of the first url
+
+            A new chapter is started as soon as any other one finishes so there are always
+            max_workers downloads in flight instead of waiting for a whole group to finish, unless
+            too many chapters are waiting to be written.
         """
 
-        chapters = [None for _ in range(len(urls))]
-        chapters_done = [False for _ in  range(max_workers)]
-        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = {executor.submit(self.get_chapter_page, url, i + 1, chapters_done, len(urls), verbose): (url, i) for i, url in enumerate(urls)}
-            for i, future in enumerate(concurrent.futures.as_completed(futures)):
-                url = futures[future][0]
-                index = futures[future][1]
-                if future.result()[0] is None:
-                    click.echo(f"Download failed at {url} for {self.homepage_url}.")
-                    executor.shutdown(cancel_futures=True)
-                    return None
-                chapter, chapter_title = future.result()
-                chapters[index] = chapter
-                click.echo(f"Got {chapter_title} at {url} ({i + 1}/{len(urls)}).")
-        return chapters
-
-
-    def get_chapter_page(self, chapter_url: str, chapter_number: int, chapters_done: list[bool], num_chapters: int, verbose: bool) -> (epub.EpubHtml | None, str):
+        executor = self.executor or concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        pending = iter(urls)
+        in_flight = {}
+
+        def submit_next() -> None:
+            """Start downloading chapters until max_workers are in flight or too many are waiting to be written"""
+
+            while len(in_flight) < max_workers and not self.is_backed_up() and (next_chapter := next(pending, None)) is not None:
+                i, url = next_chapter
+                if self.host_slots is not None:
+                    self.host_slots.acquire()
+                future = executor.submit(self.get_chapter_page, url, first_chapter_number + i, len(urls), verbose, rate_limiter)
+                if self.host_slots is not None:
+                    future.add_done_callback(lambda _: self.host_slots.release())
+                in_flight[future] = (url, i)
+
+        try:
+            submit_next()
+
+            done_count = 0
+            while in_flight:
+                done, _ = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    url, index = in_flight.pop(future)
+                    chapter, chapter_title = future.result()
+                    if chapter is None:
+                        click.echo(f"Download failed at {url} for {self.homepage_url}.")
+                        return False
+                    on_chapter(index, chapter)
+                    done_count += 1
+                    click.echo(f"Got {chapter_title} at {url} ({done_count}/{len(urls)}).")
+                    submit_next()
+        finally:
+            for future in in_flight:
+                future.cancel()
+            if self.executor is None:
+                executor.shutdown(cancel_futures=True)
+        return True
+
+
+    def download_chapters_pipeline(self, urls: ChapterUrls, on_chapter: Callable[[int, epub.EpubHtml], None], verbose: bool, max_workers: int, processes: int, rate_limiter: RateLimiter, first_chapter_number: int = 1) -> bool:
+        """Download all chapters with threads and parse them with processes as epub.Html
+
+            urls: urls to download, chapters start downloading while the rest are still being found
+            on_chapter: called with the index of the url and the chapter's page as soon as each chapter is downloaded
+            verbose: output extra information
+            max_workers: max number of concurrent downloads
+            processes: number of processes parsing chapters, 0 for one per cpu
+            rate_limiter: limiter every request waits on before being sent
+            first_chapter_number: the chapter number of the first url
+
+            The threads only download each chapter's bytes so parsing the html and building the page
+            does not hold the GIL they need. Downloads stop being started while 2 chapters per process
+            are waiting to be parsed so a slow parse does not fill memory with responses, and while
+            too many are waiting to be written.
+
+            Once a chapter fails no more downloads are started, but the chapters already downloading
+            or parsing are still parsed and cached so running the download again resumes after them.
+        """
+
+        processes = processes or os.cpu_count() or 1
+        executor = self.executor or concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        parse_executor = concurrent.futures.ProcessPoolExecutor(max_workers=processes, initializer=pipeline.init_parse_process, initargs=(type(self), self.homepage_url))
+        pending = iter(urls)
+        downloading = {}
+        parsing = {}
+        done_count = 0
+        failed_url = None # The first chapter every retry of failed for
+
+        def add_chapter(index: int, url: str, chapter_title: str, chapter_text: str, content: str | None, build_seconds: float, source: str) -> None:
+            """Add a parsed chapter
+
+                content: the chapter's page made by the parse process, None to make it here
+                build_seconds: the seconds the parse process took to make content
+                source: where the chapter is from in the message shown, like "at <url>"
+            """
+
+            nonlocal done_count
+            self.prefetch_images(chapter_text, url)
+            build_start = time.perf_counter()
+            chapter = self.make_chapter_page(first_chapter_number + index, chapter_title, chapter_text, content)
+            self.stats.add_stage("build", build_seconds + time.perf_counter() - build_start, url)
+            on_chapter(index, chapter)
+            done_count += 1
+            click.echo(f"Got {chapter_title} {source} ({done_count}/{len(urls)}).")
+
+        def submit_next() -> None:
+            """Start downloading the next chapter if there is one and the parse processes and the writer are keeping up"""
+
+            while failed_url is None and len(downloading) < max_workers and len(parsing) < 2 * processes and not self.is_backed_up() and (next_chapter := next(pending, None)) is not None:
+                i, url = next_chapter
+                if (cached := self.get_cached_chapter(url)) is not None:
+                    add_chapter(i, url, *cached, None, 0.0, "from the cache")
+                    continue
+                if verbose:
+                    click.echo(f"\tDownloading {url} ({first_chapter_number + i}/{len(urls)}).")
+                if self.host_slots is not None:
+                    self.host_slots.acquire()
+                future = executor.submit(self.fetch_chapter, self.scraper, url, verbose, rate_limiter)
+                if self.host_slots is not None:
+                    future.add_done_callback(lambda _: self.host_slots.release())
+                downloading[future] = (url, i)
+
+        try:
+            submit_next()
+
+            while downloading or parsing:
+                done, _ = concurrent.futures.wait([*downloading, *parsing], return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    if future in downloading:
+                        url, index = downloading.pop(future)
+                        if (chapter_response := future.result()) is None:
+                            if failed_url is None:
+                                click.echo(f"Download failed at {url} for {self.homepage_url}.")
+                                failed_url = url
+                            continue
+                        parse_future = parse_executor.submit(pipeline.parse_chapter, chapter_response.content, chapter_response.encoding, chapter_response.url, first_chapter_number + index)
+                        parsing[parse_future] = (chapter_response, url, index)
+                        continue
+
+                    chapter_response, url, index = parsing.pop(future)
+                    chapter_title, chapter_text, content, parse_seconds, build_seconds = future.result()
+                    self.stats.add_stage("parse", parse_seconds, url)
+                    if self.cache is not None:
+                        with self.stats.time("cache", url):
+                            self.cache.put(url, chapter_response.text, chapter_title, chapter_text)
+                    if failed_url is None:
+                        add_chapter(index, url, chapter_title, chapter_text, content, build_seconds, f"at {url}")
+                submit_next()
+        finally:
+            for future in [*downloading, *parsing]:
+                future.cancel()
+            if self.executor is None:
+                executor.shutdown(cancel_futures=True)
+            parse_executor.shutdown(cancel_futures=True)
+        return failed_url is None
+
+
+    def get_chapter_page(self, chapter_url: str, chapter_number: int, num_chapters: int, verbose: bool, rate_limiter: RateLimiter) -> (epub.EpubHtml | None, str):
         """Get the page in the epub for the chapter
 
             chapter_url: the url to the chapter
             chapter_number: the chapter number
-            chapters_done: a list of booleans to check that each chapter of a group is done before moving on
-            num_chapters: the number of total chapters to download not the group's total
+            num_chapters: the number of total chapters to download
             verbose: output extra information
+            rate_limiter: shared limiter every request waits on before being sent
 
             returns the chapter page and the chapter_title
         """
 
-        times = [3, 15, 30, 60, 0]
+        if (cached := self.get_cached_chapter_page(chapter_url, chapter_number)) is not None:
+            return cached
 
         if verbose:
             click.echo(f"\tDownloading {chapter_url} ({chapter_number}/{num_chapters}).")
 
-        chapter = None
-        chapter_title = ""
-        for retry in range(5):
-            chapter_response = self.scraper.get(chapter_url, timeout=15)
-            if chapter_response.status_code != 200:
+        if (chapter_response := self.fetch_chapter(self.scraper, chapter_url, verbose, rate_limiter)) is None:
+            return (None, "")
+        return self.build_chapter_page(chapter_response, chapter_url, chapter_number)
+
+
+    def fetch_chapter(self, session: requests.Session, chapter_url: str, verbose: bool, rate_limiter: RateLimiter) -> requests.Response | None:
+        """Request a chapter, retrying when it fails
+
+            session: the session to send the request with
+            chapter_url: the url to the chapter
+            verbose: output extra information
+            rate_limiter: limiter every request waits on before being sent and is told how it went
+
+            returns None if every attempt failed
+        """
+
+        start = time.perf_counter()
+        for attempt in range(self.max_attempts):
+            with self.stats.time("rate limit", chapter_url):
+                rate_limiter.wait()
+            with self.stats.time("request", chapter_url) as result:
+                try:
+                    chapter_response = session.get(chapter_url, timeout=15)
+                except requests.RequestException as e:
+                    chapter_response = None
+                    reason = str(e)
+                result["status"] = chapter_response.status_code if chapter_response is not None else "error"
+            if chapter_response is not None:
+                if chapter_response.status_code == 200 and not is_throttled(chapter_response):
+                    rate_limiter.record(chapter_response)
+                    self.stats.add_chapter(chapter_url, "downloaded", attempt + 1, time.perf_counter() - start, len(chapter_response.content))
+                    return chapter_response
+                reason = f"{chapter_response.status_code} {chapter_response.reason}"
+            rate_limiter.record(chapter_response)
+
+            if attempt < self.max_attempts - 1:
+                retry_delay = rate_limiter.get_retry_delay(attempt, chapter_response)
                 if verbose:
-                    click.echo(f"\t\tRetrying download of {chapter_url} after {times[retry]} seconds because {chapter_response.status_code} {chapter_response.reason}.")
-                time.sleep(times[retry])
-                continue
+                    click.echo(f"\t\tRetrying download of {chapter_url} after {retry_delay:.0f} seconds because {reason}.")
+                with self.stats.time("retry wait", chapter_url):
+                    time.sleep(retry_delay)
+        self.stats.add_chapter(chapter_url, "failed", self.max_attempts, time.perf_counter() - start)
+        return None
+
+
+    async def download_chapters_async(self, urls: ChapterUrls, on_chapter: Callable[[int, epub.EpubHtml], None], verbose: bool, max_workers: int, rate_limiter: RateLimiter, first_chapter_number: int = 1) -> bool:
+        """Download all chapters with asyncio as epub.Html
+
+            urls: urls to download, chapters start downloading while the rest are still being found
+            on_chapter: called with the index of the url and the chapter's page as soon as each chapter is downloaded
+            verbose: output extra information
+            max_workers: max number of concurrent downloads
+            rate_limiter: limiter every request waits on before being sent
+            first_chapter_number: the chapter number of the first url
+
+            Every request is sent by one non-blocking aiohttp session with max_workers keep-alive
+            connections that carries the cloudflare cookies and headers of self.scraper. A semaphore
+            keeps at most max_workers chapters in flight and a new one starts as soon as any other
+            finishes, unless too many chapters are waiting to be written. Only the cache, building the pages and waiting for urls that are not found yet
+            run in threads. When a chapter fails only the chapters still being fetched are cancelled,
+            the ones already fetched are still cached.
+        """
+
+        loop = asyncio.get_running_loop()
+        chapter_slots = asyncio.Semaphore(max_workers)
+        tasks = set()
+        done_count = 0
+
+        async def download_chapter(index: int, url: str) -> None:
+            """Download a chapter and add it or raise if every retry failed"""
+
+            nonlocal done_count
+            try:
+                chapter, chapter_title = await self.get_chapter_page_async(session, executor, url, first_chapter_number + index, len(urls), verbose, rate_limiter)
+            finally:
+                chapter_slots.release()
+            if chapter is None:
+                raise Exception(f"Download failed at {url} for {self.homepage_url}.")
+            on_chapter(index, chapter)
+            done_count += 1
+            click.echo(f"Got {chapter_title} at {url} ({done_count}/{len(urls)}).")
+
+        async with create_async_session(self.scraper, max_workers) as session:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=min(max_workers, self.max_async_threads)) as executor:
+                try:
+                    i = 0
+                    while True:
+                        await chapter_slots.acquire()
+                        # Raises the first failure so no more chapters are started after it
+                        for task in [task for task in tasks if task.done()]:
+                            tasks.remove(task)
+                            task.result()
+                        # The chapter the written ones wait for is still in flight, so one of them finishing makes room
+                        if self.is_backed_up():
+                            chapter_slots.release()
+                            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                            continue
+                        # Waits in a thread since the url might not be found yet
+                        if (url := await loop.run_in_executor(executor, urls.get, i)) is None:
+                            break
+                        tasks.add(asyncio.create_task(download_chapter(i, url)))
+                        i += 1
+                    await asyncio.gather(*tasks)
+                except Exception as e:
+                    for task in tasks:
+                        task.cancel()
+                    await asyncio.gather(*tasks, return_exceptions=True)
+                    click.echo(e)
+                    return False
+        return True
+
+
+    async def get_chapter_page_async(self, session: aiohttp.ClientSession, executor: concurrent.futures.Executor, chapter_url: str, chapter_number: int, num_chapters: int, verbose: bool, rate_limiter: RateLimiter) -> (epub.EpubHtml | None, str):
+        """Get the page in the epub for the chapter without blocking the event loop
+
+            session: the non-blocking session to send the request with
+            executor: where the cache is read and the page is built
+            chapter_url: the url to the chapter
+            chapter_number: the chapter number
+            num_chapters: the number of total chapters to download
+            verbose: output extra information
+            rate_limiter: shared limiter every request waits on before being sent
+
+            returns the chapter page and the chapter_title
+        """
 
-            chapter_title = self.get_chapter_title(chapter_response) or f"Chapter {chapter_number}"
-            chapter_text = self.get_chapter_text(chapter_response)
-            chapter = epub.EpubHtml(title=chapter_title, file_name=f"{chapter_number}_{"_".join(chapter_title.split(" "))}.xhtml")
-            chapter.content = """<html>
+        # Pages are built in the executor since reading the cache blocks
+        loop = asyncio.get_running_loop()
+        if (cached := await loop.run_in_executor(executor, self.get_cached_chapter_page, chapter_url, chapter_number)) is not None:
+            return cached
+
+        if verbose:
+            click.echo(f"\tDownloading {chapter_url} ({chapter_number}/{num_chapters}).")
+
+        if (chapter_response := await self.fetch_chapter_async(session, chapter_url, verbose, rate_limiter)) is None:
+            return (None, "")
+        # Shielded so a chapter that was fetched is still built and cached when the download is cancelled
+        return await asyncio.shield(loop.run_in_executor(executor, self.build_chapter_page, chapter_response, chapter_url, chapter_number))
+
+
+    async def fetch_chapter_async(self, session: aiohttp.ClientSession, chapter_url: str, verbose: bool, rate_limiter: RateLimiter) -> requests.Response | None:
+        """Request a chapter without blocking the event loop, retrying when it fails
+
+            session: the non-blocking session to send the request with
+            chapter_url: the url to the chapter
+            verbose: output extra information
+            rate_limiter: limiter every request waits on before being sent and is told how it went
+
+            returns None if every attempt failed
+        """
+
+        start = time.perf_counter()
+        for attempt in range(self.max_attempts):
+            with self.stats.time("rate limit", chapter_url):
+                await rate_limiter.wait_async()
+            with self.stats.time("request", chapter_url) as result:
+                try:
+                    chapter_response = await get_async(session, chapter_url)
+                except (aiohttp.ClientError, TimeoutError) as e:
+                    chapter_response = None
+                    reason = str(e) or type(e).__name__
+                result["status"] = chapter_response.status_code if chapter_response is not None else "error"
+            if chapter_response is not None:
+                if chapter_response.status_code == 200 and not is_throttled(chapter_response):
+                    rate_limiter.record(chapter_response)
+                    self.stats.add_chapter(chapter_url, "downloaded", attempt + 1, time.perf_counter() - start, len(chapter_response.content))
+                    return chapter_response
+                reason = f"{chapter_response.status_code} {chapter_response.reason}"
+            rate_limiter.record(chapter_response)
+
+            if attempt < self.max_attempts - 1:
+                retry_delay = rate_limiter.get_retry_delay(attempt, chapter_response)
+                if verbose:
+                    click.echo(f"\t\tRetrying download of {chapter_url} after {retry_delay:.0f} seconds because {reason}.")
+                with self.stats.time("retry wait", chapter_url):
+                    await asyncio.sleep(retry_delay)
+        self.stats.add_chapter(chapter_url, "failed", self.max_attempts, time.perf_counter() - start)
+        return None
+
+
+    def build_chapter_page(self, response: requests.Response, chapter_url: str, chapter_number: int) -> (epub.EpubHtml, str):
+        """Build the page in the epub for a downloaded chapter and cache it
+
+            response: the chapter's response
+            chapter_url: the url the chapter was requested from
+            chapter_number: the chapter number
+
+            returns the chapter page and the chapter_title
+        """
+
+        with self.stats.time("parse", chapter_url):
+            chapter_title = self.get_chapter_title(response) or f"Chapter {chapter_number}"
+            chapter_text = self.get_chapter_text(response)
+        if self.cache is not None:
+            with self.stats.time("cache", chapter_url):
+                self.cache.put(chapter_url, response.text, chapter_title, chapter_text)
+        self.prefetch_images(chapter_text, chapter_url)
+        with self.stats.time("build", chapter_url):
+            return (self.make_chapter_page(chapter_number, chapter_title, chapter_text), chapter_title)
+
+
+    def get_cached_chapter_page(self, chapter_url: str, chapter_number: int) -> tuple[epub.EpubHtml, str] | None:
+        """Build the page in the epub for a chapter from the cache if it is cached
+
+            chapter_url: the url to the chapter
+            chapter_number: the chapter number
+
+            returns the chapter page and the chapter_title
+        """
+
+        if (cached := self.get_cached_chapter(chapter_url)) is None:
+            return None
+        chapter_title, chapter_text = cached
+        self.prefetch_images(chapter_text, chapter_url)
+        with self.stats.time("build", chapter_url):
+            return (self.make_chapter_page(chapter_number, chapter_title, chapter_text), chapter_title)
+
+
+    def get_cached_chapter(self, chapter_url: str) -> tuple[str, str] | None:
+        """Get the title and text of a chapter from the cache if it is cached"""
+
+        if self.cache is None:
+            return None
+        with self.stats.time("cache", chapter_url):
+            cached = self.cache.get(chapter_url)
+        if cached is not None:
+            self.stats.add_chapter(chapter_url, "cached")
+        return cached
+
+
+    def prefetch_images(self, chapter_text: str, chapter_url: str) -> None:
+        """Start downloading every image in a chapter if there is an image store
+
+            Chapters keep the urls of their images, they are only pointed to the images in the epub
+            when they are written so they never wait for them while holding a download. The cache
+            keeps the text with the original urls too so the images are downloaded again from it.
+        """
+
+        if self.images is not None:
+            self.images.prefetch(chapter_text, chapter_url)
+
+
+    def make_chapter_page(self, chapter_number: int, chapter_title: str, chapter_text: str, content: str | None = None) -> epub.EpubHtml:
+        """Make the page in the epub for a chapter
+
+            chapter_number: the chapter number
+            chapter_title: the chapter's title
+            chapter_text: the chapter's text with each paragraph on its own line
+            content: the page's content if it was already made with make_chapter_content
+        """
+
+        chapter = epub.EpubHtml(title=chapter_title, file_name=f"{chapter_number}_{"_".join(chapter_title.split(" "))}.xhtml")
+        chapter.content = content or self.make_chapter_content(chapter_title, chapter_text)
+        return chapter
+
+
+    @staticmethod
+    def make_chapter_content(chapter_title: str, chapter_text: str) -> str:
+        """Make the content of the page in the epub for a chapter"""
+
+        return """<html>
     <h1>{chapter_title}</h1>
     {chapter_text}
 </html>""".format(chapter_title=chapter_title, chapter_text="\n".join([f"<p>{line}</p>" for line in chapter_text.splitlines()]))
-            break
 
-        chapters_done[(chapter_number-1) % len(chapters_done)] = True
-        if chapter_number == num_chapters:
-            for i in range((len(chapters_done)-1)-((chapter_number-1) % len(chapters_done))):
-                chapters_done.pop()
 
-        if verbose:
-            click.echo(f"\t{chapter_title or "Failed Chapter"} is waiting ({chapters_done.count(True)}/{len(chapters_done)})... ")
-        while not chapters_done.count(True) == len(chapters_done):
-            pass
+    def iter_chapter_urls(self, response: requests.Response) -> Iterator[str]:
+        """Get every chapter url in order as soon as the page of the table of contents it is on is downloaded
+
+            response: the homepage's response
+        """
+
+        if (toc_page_urls := self.get_toc_page_urls(response)) is None:
+            with self.stats.time("chapter list"):
+                urls = self.get_all_chapter_urls(response)
+            yield from urls
+            return
+
+        def fetch_toc_page(url: str) -> requests.Response:
+            """Get a page of the table of contents, the homepage is not downloaded again"""
+
+            if url in (self.homepage_url, response.url):
+                return response
+            with self.stats.time("chapter list"):
+                return self.fetch(url)
+
+        # map gives the pages in order while up to max_toc_workers of them download at once
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_toc_workers) as executor:
+            for toc_page_response in executor.map(fetch_toc_page, toc_page_urls):
+                yield from self.get_all_chapter_urls(toc_page_response)
+
+
+    def get_toc_page_urls(self, response: requests.Response) -> list[str] | None:
+        """Get the url of every page of the table of contents, None if every chapter url is gotten from the homepage
+
+            response: the homepage's response
+        """
 
-        time.sleep(2)
-        chapters_done[(chapter_number-1) % len(chapters_done)] = False
-        return (chapter, chapter_title)
+        return None
 
 
     def get_all_chapter_urls(self, response: requests.Response) -> list[str]:
-        """Get all chapter urls"""
+        """Get all chapter urls, or the ones on a page of the table of contents if get_toc_page_urls is implemented"""
 
-        raise constants.ProgError("To be implemented.")
+        if self.chapter_urls_extractor is None:
+            raise constants.ProgError("To be implemented.")
+        return self.chapter_urls_extractor(response)
 
 
     def get_chapter_title(self, response: requests.Response) -> str | None:
         """Get the chapter's title"""
 
-        raise constants.ProgError("To be implemented.")
+        if self.chapter_title_extractor is None:
+            raise constants.ProgError("To be implemented.")
+        return self.chapter_title_extractor(response)
 
 
     def get_chapter_text(self, response: requests.Response) -> str:
         """Get the chapter's text"""
 
-        raise constants.ProgError("To be implemented.")
+        if self.chapter_text_extractor is None:
+            raise constants.ProgError("To be implemented.")
+        return self.chapter_text_extractor(response)
 
 
     def get_cover_image_url(self, response: requests.Response) -> str | None:
         """Get the novel's cover image's url"""
 
-        raise constants.ProgError("To be implemented.")
+        if self.cover_image_url_extractor is None:
+            raise constants.ProgError("To be implemented.")
+        return self.cover_image_url_extractor(response)
 
 
     def get_novel_title(self, response: requests.Response) -> str:
         """Get the novel's title"""
 
-        raise constants.ProgError("To be implemented.")
+        if self.novel_title_extractor is None:
+            raise constants.ProgError("To be implemented.")
+        return self.novel_title_extractor(response)
 
 
     def get_novel_author(self, response: requests.Response) -> str | None:
         """Get the novel's author"""
 
-        raise constants.ProgError("To be implemented.")
\ No newline at end of file
+        if self.novel_author_extractor is None:
+            raise constants.ProgError("To be implemented.")
+        return self.novel_author_extractor(response)
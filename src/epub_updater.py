@@ -0,0 +1,193 @@
+import datetime
+import os
+import posixpath
+import time
+import zipfile
+from ebooklib import epub
+from lxml import etree
+
+from src import constants
+from src.compressor import Compressor
+from src.images import get_image_id, get_media_type
+from src.zip_writer import ZipWriter
+
+
+class EpubUpdater:
+    """Epub Updater
+
+        Adds chapters to the end of an epub file made by the download command.
+
+        Only the package document, the ncx and the nav are changed. Every other member is
+        copied into the new file without decompressing it, and the new chapters are compressed
+        on every core with a Compressor while it is copied.
+    """
+
+
+    def __init__(self, filename: str) -> None:
+        """Constructor
+
+            filename: the path to the epub file
+        """
+
+        self.filename = filename
+        self.new_members = {} # path in the zip: content of each new chapter
+        self.new_images = {} # path in the zip: content of each new image
+        self.compressor = None # Compresses the new chapters, made when the epub is written
+        self.seconds = 0.0 # Time writing the epub took
+        parser = etree.XMLParser(remove_blank_text=True)
+        with zipfile.ZipFile(filename) as zip_file:
+            self.infos = zip_file.infolist()
+            container = etree.fromstring(zip_file.read("META-INF/container.xml"), parser)
+            self.opf_path = container.find(".//container:rootfile", constants.NAMESPACES).get("full-path")
+            self.opf_dir = posixpath.dirname(self.opf_path)
+            self.opf = etree.fromstring(zip_file.read(self.opf_path), parser).getroottree()
+
+            self.ncx_path = self.get_member_path(self.opf.find(".//opf:item[@media-type='application/x-dtbncx+xml']", constants.NAMESPACES).get("href"))
+            self.ncx = etree.fromstring(zip_file.read(self.ncx_path), parser).getroottree()
+            self.nav_path = self.get_member_path(self.opf.find(".//opf:item[@properties='nav']", constants.NAMESPACES).get("href"))
+            self.nav = etree.fromstring(zip_file.read(self.nav_path), parser).getroottree()
+        # Every id in the package document and the ncx, new ids are added as they are assigned
+        self.ids = {element.get("id") for tree in (self.opf, self.ncx) for element in tree.iter() if element.get("id")}
+
+        self.book = epub.EpubBook()
+        self.book.set_language(self.opf.findtext(".//dc:language", "en", constants.NAMESPACES))
+
+
+    def get_member_path(self, href: str) -> str:
+        """Get the path in the zip of an href in the package document"""
+
+        return posixpath.join(self.opf_dir, href)
+
+
+    def get_source_url(self) -> str | None:
+        """Get the url of the series the epub was downloaded from"""
+
+        return self.opf.findtext(".//dc:source", None, constants.NAMESPACES)
+
+
+    def set_source_url(self, url: str) -> None:
+        """Set the url of the series the epub was downloaded from"""
+
+        if (source := self.opf.find(".//dc:source", constants.NAMESPACES)) is None:
+            source = etree.SubElement(self.opf.find("opf:metadata", constants.NAMESPACES), f"{{{constants.NAMESPACES["dc"]}}}source")
+        source.text = url
+
+
+    def get_title(self) -> str:
+        """Get the novel's title"""
+
+        return self.opf.findtext(".//dc:title", "", constants.NAMESPACES)
+
+
+    def get_chapter_ids(self) -> list[str]:
+        """Get the id of every chapter, which are the documents whose name starts with their number"""
+
+        return [
+            item.get("id") for item in self.opf.iterfind(".//opf:item[@media-type='application/xhtml+xml']", constants.NAMESPACES)
+            if posixpath.basename(item.get("href"))[0].isdigit()
+        ]
+
+
+    def get_chapter_count(self) -> int:
+        """Get the number of chapters"""
+
+        return len(self.get_chapter_ids())
+
+
+    def get_chapter_urls(self) -> list[str] | None:
+        """Get the url every chapter was downloaded from in order
+
+            returns None if a chapter does not have its url, like in epub files made before they were kept
+        """
+
+        source_urls = {
+            meta.get("refines").removeprefix("#"): meta.text
+            for meta in self.opf.iterfind(".//opf:meta[@property='dcterms:source'][@refines]", constants.NAMESPACES)
+        }
+        chapter_urls = [source_urls.get(chapter_id) for chapter_id in self.get_chapter_ids()]
+        return None if None in chapter_urls else chapter_urls
+
+
+    def add_image(self, file_name: str, content: bytes) -> None:
+        """Add an image used by the new chapters unless the epub already has it"""
+
+        path = self.get_member_path(file_name)
+        if path in self.new_images or any(info.filename == path for info in self.infos):
+            return
+        self.new_images[path] = content
+        image_id = get_image_id(file_name)
+        etree.SubElement(self.opf.find("opf:manifest", constants.NAMESPACES), f"{{{constants.NAMESPACES["opf"]}}}item", {"href": file_name, "id": image_id, "media-type": get_media_type(file_name)})
+        self.ids.add(image_id)
+
+
+    def add_chapter(self, chapter: epub.EpubHtml, source_url: str | None = None) -> None:
+        """Add a chapter to the end of the epub
+
+            chapter: the chapter's page
+            source_url: the url the chapter was downloaded from, kept so the next update knows it has it
+        """
+
+        number = len(self.ids)
+        while f"chapter_{number}" in self.ids:
+            number += 1
+        chapter.id = f"chapter_{number}"
+        self.ids.add(chapter.id)
+
+        self.book.add_item(chapter)
+        self.new_members[self.get_member_path(chapter.file_name)] = chapter.get_content()
+
+        etree.SubElement(self.opf.find("opf:manifest", constants.NAMESPACES), f"{{{constants.NAMESPACES["opf"]}}}item", {"href": chapter.file_name, "id": chapter.id, "media-type": "application/xhtml+xml"})
+        etree.SubElement(self.opf.find("opf:spine", constants.NAMESPACES), f"{{{constants.NAMESPACES["opf"]}}}itemref", {"idref": chapter.id})
+        if source_url:
+            etree.SubElement(self.opf.find("opf:metadata", constants.NAMESPACES), f"{{{constants.NAMESPACES["opf"]}}}meta", {"property": "dcterms:source", "refines": f"#{chapter.id}"}).text = source_url
+
+        nav_point = etree.SubElement(self.ncx.find("ncx:navMap", constants.NAMESPACES), f"{{{constants.NAMESPACES["ncx"]}}}navPoint", {"id": chapter.id})
+        etree.SubElement(etree.SubElement(nav_point, f"{{{constants.NAMESPACES["ncx"]}}}navLabel"), f"{{{constants.NAMESPACES["ncx"]}}}text").text = chapter.title
+        etree.SubElement(nav_point, f"{{{constants.NAMESPACES["ncx"]}}}content", {"src": chapter.file_name})
+
+        toc = self.nav.find(".//xhtml:nav[@epub:type='toc']/xhtml:ol", constants.NAMESPACES)
+        etree.SubElement(etree.SubElement(toc, f"{{{constants.NAMESPACES["xhtml"]}}}li"), f"{{{constants.NAMESPACES["xhtml"]}}}a", {"href": chapter.file_name}).text = chapter.title
+
+
+    def write(self, compression: str = "normal") -> None:
+        """Write the updated epub over the old one
+
+            compression: how much the new chapters are compressed, one of Compressor.LEVELS
+        """
+
+        start = time.perf_counter()
+        if (modified := self.opf.find(".//opf:meta[@property='dcterms:modified']", constants.NAMESPACES)) is not None:
+            modified.text = datetime.datetime.now(datetime.UTC).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+        changed_members = {
+            self.opf_path: self.opf,
+            self.ncx_path: self.ncx,
+            self.nav_path: self.nav,
+        }
+        temp_filename = self.filename + ".tmp"
+        self.compressor = Compressor(compression)
+        try:
+            compressed = {path: self.compressor.submit(content) for path, content in self.new_members.items()}
+            # The old epub is opened once for every member that is copied from it
+            with ZipWriter(temp_filename) as writer, open(self.filename, "rb") as source:
+                for info in self.infos:
+                    if info.filename in changed_members:
+                        self.compressor.write(writer, info.filename, etree.tostring(changed_members[info.filename], pretty_print=True, xml_declaration=True, encoding="utf-8"))
+                    else:
+                        writer.copy(source, info)
+                for path, content in self.new_images.items():
+                    writer.write(path, content, compress=path.endswith(".svg"))
+                for path, future in compressed.items():
+                    writer.write_raw(path, *future.result())
+            os.replace(temp_filename, self.filename)
+        finally:
+            self.compressor.close()
+            if os.path.exists(temp_filename):
+                os.remove(temp_filename)
+        self.seconds = time.perf_counter() - start
+
+
+    def get_summary(self) -> str:
+        """Get how long writing the epub took and how many bytes compressing the new chapters saved"""
+
+        return self.compressor.get_summary(self.seconds)
@@ -0,0 +1,285 @@
+import datetime
+import functools
+import os
+import time
+from xml.sax.saxutils import escape, quoteattr
+from ebooklib import epub
+
+from src.compressor import Compressor
+from src.images import ImageStore, get_image_id, get_media_type
+from src.zip_writer import ZipWriter
+
+
+class StreamingEpubWriter:
+    """Streaming Epub Writer
+
+        Writes an epub file one chapter at a time so the whole novel never has to be in memory.
+
+        Chapters are added with their index in the spine and are compressed in the threads of a
+        Compressor, so adding a chapter never waits on zlib and every core compresses at once. They
+        are written into the file once they are compressed and every chapter before them has been
+        written, chapters that are ready early are kept in a reorder buffer until it is their turn.
+        With an image store the threads of the Compressor also wait for each chapter's images and
+        point the chapter to them, so the chapter's download never waits on them.
+        Once more than max_buffered chapters are waiting is_full is True, and the download stops
+        starting chapters until the one they wait for is added.
+        The package document, nav and ncx only need the title, file name and source url of each
+        chapter so they are written when the file is closed. Each chapter's source url is kept in the
+        package document so update can tell which chapters of the series are new.
+
+        The file is written to <filename>.tmp and only renamed to filename when it is closed so a
+        failed download never leaves a broken epub behind.
+    """
+
+    max_buffered = 64 # Max number of chapters waiting in the reorder buffer before no more are started
+
+
+    def __init__(self, filename: str, title: str, identifier: str, author: str | None = None, source_url: str | None = None, language: str = "en", compression: str = "normal", images: ImageStore | None = None) -> None:
+        """Constructor
+
+            filename: where the epub is written
+            title: the novel's title
+            identifier: the unique identifier of the epub
+            author: the novel's author
+            source_url: the url the novel was downloaded from
+            language: the language of the novel
+            compression: how much chapters are compressed, one of Compressor.LEVELS
+            images: where the images in chapters are downloaded, None to leave chapters as they are
+        """
+
+        self.filename = filename
+        self.title = title
+        self.identifier = identifier
+        self.author = author
+        self.source_url = source_url
+        self.language = language
+        self.images = images
+
+        # Chapters need a book to get their content from, but they are never added to it so it stays empty
+        self.book = epub.EpubBook()
+        self.book.set_language(language)
+
+        self.cover_image_name = None
+        self.image_names = [] # File name of every image besides the cover
+        self.items = [] # (id, file_name, title) of every written chapter in spine order
+        self.source_urls = {} # id: url every written chapter was downloaded from, if it is known
+        self.buffer = {} # index: (file_name, title, source_url, future of the compressed chapter) of chapters waiting to be written
+        self.next_index = 0
+        self.seconds = 0.0 # Time spent adding chapters and closing the file
+
+        self.compressor = Compressor(compression)
+        self.writer = ZipWriter(filename + ".tmp")
+        self.writer.write("mimetype", b"application/epub+zip", compress=False)
+        self.compressor.write(self.writer, epub.CONTAINER_PATH, (epub.CONTAINER_XML % {"folder_name": self.book.FOLDER_NAME}).encode())
+
+
+    def get_member_path(self, file_name: str) -> str:
+        """Get the path in the zip of a file in the book's folder"""
+
+        return f"{self.book.FOLDER_NAME}/{file_name}"
+
+
+    def set_cover(self, file_name: str, content: bytes) -> None:
+        """Write the cover image and a cover page for it
+
+            file_name: the name of the cover image, its suffix decides its media type
+            content: the cover image
+        """
+
+        self.cover_image_name = file_name
+        self.writer.write(self.get_member_path(file_name), content, compress=False)
+        cover_page = epub.EpubCoverHtml(image_name=file_name)
+        cover_page.book = self.book
+        self.compressor.write(self.writer, self.get_member_path(cover_page.file_name), cover_page.get_content())
+
+
+    def add_image(self, file_name: str, content: bytes) -> None:
+        """Write an image used by chapters
+
+            file_name: the name of the image, its suffix decides its media type
+            content: the image
+        """
+
+        self.image_names.append(file_name)
+        self.writer.write(self.get_member_path(file_name), content, compress=file_name.endswith(".svg"))
+
+
+    def add(self, index: int, chapter: epub.EpubHtml, source_url: str | None = None) -> None:
+        """Add a chapter
+
+            index: the position of the chapter in the spine, starting at 0
+            chapter: the chapter's page
+            source_url: the url the chapter was downloaded from, its images are only put into the epub if it is given
+        """
+
+        start = time.perf_counter()
+        chapter.book = self.book
+        localize = functools.partial(self.localize, source_url) if self.images is not None and source_url else None
+        self.buffer[index] = (chapter.file_name, chapter.title, source_url, self.compressor.submit(chapter.get_content(), localize))
+        # Waits for the compression once the buffer is full so it is only still full while a chapter is missing
+        self.flush(len(self.buffer) > self.max_buffered)
+        self.seconds += time.perf_counter() - start
+
+
+    def localize(self, source_url: str, content: bytes) -> bytes:
+        """Point a chapter to its images once they are downloaded, runs in the compressor's threads"""
+
+        return self.images.localize(content.decode(), source_url).encode()
+
+
+    def flush(self, wait: bool) -> None:
+        """Write the chapters in the reorder buffer whose turn it is
+
+            wait: wait for them to be compressed, otherwise stop at the first one that is not
+        """
+
+        while self.next_index in self.buffer and (wait or self.buffer[self.next_index][3].done()):
+            file_name, title, source_url, future = self.buffer.pop(self.next_index)
+            self.writer.write_raw(self.get_member_path(file_name), *future.result())
+            item_id = f"chapter_{self.next_index}"
+            self.items.append((item_id, file_name, title))
+            if source_url:
+                self.source_urls[item_id] = source_url
+            self.next_index += 1
+
+
+    def is_full(self) -> bool:
+        """Check if too many chapters are waiting for an earlier one to start another"""
+
+        return len(self.buffer) > self.max_buffered
+
+
+    def close(self) -> None:
+        """Write the package document, nav and ncx and move the epub to filename"""
+
+        start = time.perf_counter()
+        self.flush(True)
+        if self.buffer:
+            raise Exception(f"Chapter {self.next_index + 1} of {self.title} was never added.")
+
+        self.compressor.write(self.writer, self.get_member_path("nav.xhtml"), self.get_nav())
+        self.compressor.write(self.writer, self.get_member_path("toc.ncx"), self.get_ncx())
+        self.compressor.write(self.writer, self.get_member_path("content.opf"), self.get_opf())
+        self.writer.close()
+        self.compressor.close()
+        os.replace(self.filename + ".tmp", self.filename)
+        self.seconds += time.perf_counter() - start
+
+
+    def abort(self) -> None:
+        """Stop writing and delete the unfinished epub"""
+
+        self.compressor.close()
+        self.writer.close()
+        if os.path.exists(self.filename + ".tmp"):
+            os.remove(self.filename + ".tmp")
+
+
+    def get_summary(self) -> str:
+        """Get how long writing the epub took and how many bytes compressing its chapters saved"""
+
+        return self.compressor.get_summary(self.seconds)
+
+
+    def get_toc(self) -> list[tuple[str, str, str]]:
+        """Get the (id, file_name, title) of every entry in the table of contents"""
+
+        if self.cover_image_name:
+            return [("cover", "cover.xhtml", "Cover")] + self.items
+        return self.items
+
+
+    def get_opf(self) -> bytes:
+        """Get the package document"""
+
+        metadata = [
+            f"<meta property=\"dcterms:modified\">{datetime.datetime.now(datetime.UTC).strftime("%Y-%m-%dT%H:%M:%SZ")}</meta>",
+            f"<dc:identifier id=\"id\">{escape(self.identifier)}</dc:identifier>",
+            f"<dc:title>{escape(self.title)}</dc:title>",
+            f"<dc:language>{escape(self.language)}</dc:language>",
+        ]
+        if self.source_url:
+            metadata.append(f"<dc:source>{escape(self.source_url)}</dc:source>")
+        if self.author:
+            metadata.append(f"<dc:creator id=\"creator\">{escape(self.author)}</dc:creator>")
+        for item_id, source_url in self.source_urls.items():
+            metadata.append(f"<meta property=\"dcterms:source\" refines=\"#{item_id}\">{escape(source_url)}</meta>")
+
+        manifest = []
+        spine = []
+        if self.cover_image_name:
+            metadata.append("<meta name=\"cover\" content=\"cover-img\"/>")
+            manifest.append(f"<item href={quoteattr(self.cover_image_name)} id=\"cover-img\" media-type=\"{get_media_type(self.cover_image_name)}\" properties=\"cover-image\"/>")
+            manifest.append("<item href=\"cover.xhtml\" id=\"cover\" media-type=\"application/xhtml+xml\"/>")
+            spine.append("<itemref idref=\"cover\" linear=\"no\"/>")
+        spine.append("<itemref idref=\"nav\"/>")
+        for file_name in self.image_names:
+            manifest.append(f"<item href={quoteattr(file_name)} id=\"{get_image_id(file_name)}\" media-type=\"{get_media_type(file_name)}\"/>")
+        for item_id, file_name, _ in self.items:
+            manifest.append(f"<item href={quoteattr(file_name)} id=\"{item_id}\" media-type=\"application/xhtml+xml\"/>")
+            spine.append(f"<itemref idref=\"{item_id}\"/>")
+        manifest.append("<item href=\"toc.ncx\" id=\"ncx\" media-type=\"application/x-dtbncx+xml\"/>")
+        manifest.append("<item href=\"nav.xhtml\" id=\"nav\" media-type=\"application/xhtml+xml\" properties=\"nav\"/>")
+
+        return f"""<?xml version='1.0' encoding='utf-8'?>
+<package xmlns="http://www.idpf.org/2007/opf" unique-identifier="id" version="3.0" prefix="rendition: http://www.idpf.org/vocab/rendition/#">
+  <metadata xmlns:dc="http://purl.org/dc/elements/1.1/" xmlns:opf="http://www.idpf.org/2007/opf">
+    {"\n    ".join(metadata)}
+  </metadata>
+  <manifest>
+    {"\n    ".join(manifest)}
+  </manifest>
+  <spine toc="ncx">
+    {"\n    ".join(spine)}
+  </spine>
+</package>
+""".encode()
+
+
+    def get_nav(self) -> bytes:
+        """Get the nav document"""
+
+        entries = "\n".join(f"        <li>\n          <a href={quoteattr(file_name)}>{escape(title)}</a>\n        </li>" for _, file_name, title in self.get_toc())
+        return f"""<?xml version='1.0' encoding='utf-8'?>
+<!DOCTYPE html>
+<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops" lang={quoteattr(self.language)} xml:lang={quoteattr(self.language)}>
+  <head>
+    <title>{escape(self.title)}</title>
+  </head>
+  <body>
+    <nav epub:type="toc" id="id" role="doc-toc">
+      <h2>{escape(self.title)}</h2>
+      <ol>
+{entries}
+      </ol>
+    </nav>
+  </body>
+</html>
+""".encode()
+
+
+    def get_ncx(self) -> bytes:
+        """Get the ncx document"""
+
+        nav_points = "\n".join(f"""    <navPoint id="{item_id}">
+      <navLabel>
+        <text>{escape(title)}</text>
+      </navLabel>
+      <content src={quoteattr(file_name)}/>
+    </navPoint>""" for item_id, file_name, title in self.get_toc())
+        return f"""<?xml version='1.0' encoding='utf-8'?>
+<ncx xmlns="http://www.daisy.org/z3986/2005/ncx/" version="2005-1">
+  <head>
+    <meta content={quoteattr(self.identifier)} name="dtb:uid"/>
+    <meta content="0" name="dtb:depth"/>
+    <meta content="0" name="dtb:totalPageCount"/>
+    <meta content="0" name="dtb:maxPageNumber"/>
+  </head>
+  <docTitle>
+    <text>{escape(self.title)}</text>
+  </docTitle>
+  <navMap>
+{nav_points}
+  </navMap>
+</ncx>
+""".encode()
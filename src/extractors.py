@@ -0,0 +1,117 @@
+import re
+import requests
+
+from src import constants
+
+
+class Extractor:
+    """Extractor Template
+
+        Gets one piece of information out of a page. Providers declare extractors once as class
+        attributes of their Downloader instead of building patterns on every call.
+
+        In a derived Extractor class:
+            extract(self, text: str, url: str | None = None): MUST be implemented to get the information out of the text of a page.
+    """
+
+
+    def __call__(self, response: requests.Response):
+        """Get the information out of a response"""
+
+        return self.extract(response.text, response.url)
+
+
+    def extract(self, text: str, url: str | None = None):
+        """Get the information out of the text of a page
+
+            text: the page
+            url: where the page is from, only used in errors
+        """
+
+        raise constants.ProgError("To be implemented.")
+
+
+class RegexExtractor(Extractor):
+    """Regex Extractor
+
+        Gets the first group of the first match of a precompiled pattern.
+    """
+
+
+    def __init__(self, pattern: str, name: str, required: bool = True, flags: int = 0) -> None:
+        """Constructor
+
+            pattern: the pattern, its first group is what is extracted
+            name: what is extracted, used in the error when it is not found like "chapter's title"
+            required: raise an exception if the pattern is not found instead of returning None
+            flags: re flags of the pattern
+        """
+
+        self.pattern = re.compile(pattern, flags)
+        self.name = name
+        self.required = required
+
+
+    def extract(self, text: str, url: str | None = None) -> str | None:
+        """Get the first group of the first match"""
+
+        if (match := self.pattern.search(text)) is not None:
+            return match.group(1)
+        if self.required:
+            raise Exception(f"Cannot find the {self.name} at {url}.")
+        return None
+
+
+class RegexListExtractor(Extractor):
+    """Regex List Extractor
+
+        Gets the first group of every match of a precompiled pattern.
+    """
+
+
+    def __init__(self, pattern: str, flags: int = 0) -> None:
+        """Constructor
+
+            pattern: the pattern, its first group is what is extracted
+            flags: re flags of the pattern
+        """
+
+        self.pattern = re.compile(pattern, flags)
+
+
+    def extract(self, text: str, url: str | None = None) -> list[str]:
+        """Get the first group of every match"""
+
+        return self.pattern.findall(text)
+
+
+class ParagraphExtractor(Extractor):
+    """Paragraph Extractor
+
+        Gets the content of every <p> element as a line of text.
+
+        The pattern stops at the first closing tag after each opening tag so the page is only
+        scanned once, instead of looking ahead to the end of the page for every paragraph.
+    """
+
+    pattern = re.compile(r"<p>(.*?)</p>", re.DOTALL)
+
+
+    def __init__(self, skip_first: int = 0, skip_last: int = 0) -> None:
+        """Constructor
+
+            skip_first: number of paragraphs at the start of the page that are not part of the chapter
+            skip_last: number of paragraphs at the end of the page that are not part of the chapter
+        """
+
+        self.skip_first = skip_first
+        self.skip_last = skip_last
+
+
+    def extract(self, text: str, url: str | None = None) -> str:
+        """Get the text of the paragraphs, one paragraph on each line"""
+
+        paragraphs = self.pattern.findall(text)[self.skip_first:]
+        if self.skip_last:
+            paragraphs = paragraphs[:-self.skip_last]
+        return "\n".join(paragraph.strip() for paragraph in paragraphs)
@@ -0,0 +1,219 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import requests
+
+from src.cache import get_cache_dir
+
+
+class HttpCache:
+    """Http Cache
+
+        Stores the responses to requests that are sent on every download, like a novel's homepage,
+        its list of chapters and its cover, so they are not downloaded again when they did not change.
+
+        Each response is stored under the sha256 of its url as <key>.body and <key>.meta in the http
+        directory of the cache. A stored response is used as is for ttl seconds, after that the request
+        is sent again with If-None-Match and If-Modified-Since so the provider can answer 304 Not Modified
+        instead of sending the whole response again. Responses without an ETag or Last-Modified cannot be
+        checked that way so they are only stored when ttl is not 0 and are deleted once they are older
+        than ttl. Once the http directory grows past max_size the least recently used responses are deleted.
+    """
+
+
+    def __init__(self, max_size: int, ttl: int = 0, cache_dir: str | None = None) -> None:
+        """Constructor
+
+            max_size: max number of bytes the http cache can use
+            ttl: number of seconds a stored response is used without checking if it changed
+            cache_dir: where the responses are stored, defaults to the http directory in get_cache_dir()
+        """
+
+        self.cache_dir = cache_dir or os.path.join(get_cache_dir(), "http")
+        self.max_size = max_size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.saved = 0 # Number of bytes that did not have to be downloaded
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.size = sum(os.path.getsize(path) for path in self.get_all_files())
+
+
+    def get(self, session: requests.Session, url: str, **kwargs) -> requests.Response:
+        """Send a GET request through the cache
+
+            session: the session to send the request with
+            url: the url to request
+            kwargs: passed on to session.get
+
+            returns the stored response if it is fresh or did not change, otherwise the new response
+        """
+
+        key = hashlib.sha256(url.encode()).hexdigest()
+        meta_path = os.path.join(self.cache_dir, key + ".meta")
+        body_path = os.path.join(self.cache_dir, key + ".body")
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(body_path, "rb") as f:
+                body = f.read()
+        except (OSError, ValueError):
+            meta = body = None
+
+        if meta is not None and time.time() - meta["time"] < self.ttl:
+            self.touch(meta_path, body_path)
+            with self.lock:
+                self.saved += len(body)
+            return self.make_response(meta, body)
+
+        headers = dict(kwargs.pop("headers", None) or {})
+        stored_headers = requests.structures.CaseInsensitiveDict(meta["headers"] if meta is not None else {})
+        if "ETag" in stored_headers:
+            headers["If-None-Match"] = stored_headers["ETag"]
+        if "Last-Modified" in stored_headers:
+            headers["If-Modified-Since"] = stored_headers["Last-Modified"]
+
+        response = session.get(url, headers=headers, **kwargs)
+        if response.status_code == 304 and meta is not None:
+            meta["time"] = time.time()
+            self.write(meta_path, json.dumps(meta).encode())
+            self.touch(body_path)
+            with self.lock:
+                self.saved += len(body)
+            return self.make_response(meta, body)
+
+        if response.status_code == 200 and (self.ttl or self.can_check(response.headers)):
+            self.put(meta_path, body_path, response)
+        elif meta is not None and not self.can_check(stored_headers):
+            self.remove(meta_path, body_path)
+        return response
+
+
+    @staticmethod
+    def can_check(headers: requests.structures.CaseInsensitiveDict) -> bool:
+        """Check if a stored response can be checked for changes with a conditional request"""
+
+        return "ETag" in headers or "Last-Modified" in headers
+
+
+    @staticmethod
+    def make_response(meta: dict, body: bytes) -> requests.Response:
+        """Make a response from a stored one"""
+
+        response = requests.Response()
+        response._content = body
+        response.status_code = 200
+        response.reason = "OK"
+        response.url = meta["url"]
+        response.headers = requests.structures.CaseInsensitiveDict(meta["headers"])
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        return response
+
+
+    def put(self, meta_path: str, body_path: str, response: requests.Response) -> None:
+        """Store a response"""
+
+        # The meta is written last since it is what marks the response as stored
+        written = self.write(body_path, response.content)
+        written += self.write(meta_path, json.dumps({"url": response.url, "headers": dict(response.headers), "time": time.time()}).encode())
+
+        with self.lock:
+            self.size += written
+            if self.size > self.max_size:
+                self.evict()
+
+
+    @staticmethod
+    def write(path: str, content: bytes) -> int:
+        """Write a file atomically and return its size"""
+
+        with open(path + ".tmp", "wb") as f:
+            f.write(content)
+        os.replace(path + ".tmp", path)
+        return len(content)
+
+
+    @staticmethod
+    def touch(*paths: str) -> None:
+        """Mark files as recently used"""
+
+        for path in paths:
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+
+
+    def remove(self, *paths: str) -> None:
+        """Delete files from the cache"""
+
+        for path in paths:
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+            except OSError:
+                continue
+            with self.lock:
+                self.size -= size
+
+
+    def evict(self) -> None:
+        """Delete responses that cannot be checked and are older than ttl, then the least recently used
+            responses until the cache fits in max_size
+
+            A response's meta and body are deleted together and counted once. A body without its meta
+            is skipped since it is either still being stored or its meta was already deleted.
+        """
+
+        now = time.time()
+        entries = []
+        for meta_path in self.get_all_files():
+            if not meta_path.endswith(".meta"):
+                continue
+            body_path = meta_path[:-len(".meta")] + ".body"
+            try:
+                meta_stat = os.stat(meta_path)
+                body_stat = os.stat(body_path)
+            except OSError:
+                continue
+            if now - meta_stat.st_mtime >= self.ttl:
+                try:
+                    with open(meta_path, encoding="utf-8") as f:
+                        headers = json.load(f)["headers"]
+                except (OSError, ValueError, KeyError):
+                    headers = {}
+                if not self.can_check(requests.structures.CaseInsensitiveDict(headers)):
+                    self.delete(meta_path, body_path)
+                    continue
+            entries.append((max(meta_stat.st_mtime, body_stat.st_mtime), meta_stat.st_size + body_stat.st_size, meta_path, body_path))
+        entries.sort()
+
+        self.size = sum(size for _, size, _, _ in entries)
+        for _, size, meta_path, body_path in entries:
+            if self.size <= self.max_size:
+                break
+            self.delete(meta_path, body_path)
+            self.size -= size
+
+
+    @staticmethod
+    def delete(meta_path: str, body_path: str) -> None:
+        """Delete a stored response, the meta first so the body is never used without it"""
+
+        for path in (meta_path, body_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+    def get_all_files(self) -> list[str]:
+        """Get the paths of every stored file"""
+
+        return [
+            os.path.join(self.cache_dir, file_name)
+            for file_name in os.listdir(self.cache_dir)
+            if file_name.endswith(".meta") or file_name.endswith(".body")
+        ]
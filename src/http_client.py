@@ -0,0 +1,49 @@
+import datetime
+import time
+import aiohttp
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+
+def create_async_session(scraper: requests.Session, max_connections: int) -> aiohttp.ClientSession:
+    """Create a non-blocking session that keeps up to max_connections connections alive, must be made in a running event loop
+
+        scraper: the cloudscraper session whose cookies and headers are copied so
+                 requests keep passing cloudflare
+        max_connections: the max number of connections open at once
+    """
+
+    # aiohttp asks only for the encodings it can decode
+    headers = {name: value for name, value in scraper.headers.items() if name.lower() != "accept-encoding"}
+    return aiohttp.ClientSession(
+        headers=headers,
+        cookies={cookie.name: cookie.value for cookie in scraper.cookies},
+        connector=aiohttp.TCPConnector(limit=max_connections),
+        timeout=aiohttp.ClientTimeout(total=15),
+    )
+
+
+async def get_async(session: aiohttp.ClientSession, url: str) -> requests.Response:
+    """Send a GET request without blocking and read it into the requests.Response every provider parses
+
+        session: the session made by create_async_session
+        url: the url to request
+
+        raises aiohttp.ClientError or TimeoutError if the request fails
+    """
+
+    start = time.perf_counter()
+    async with session.get(url) as response:
+        content = await response.read()
+
+    converted = requests.Response()
+    converted._content = content
+    converted.status_code = response.status
+    converted.reason = response.reason
+    converted.headers = CaseInsensitiveDict(response.headers)
+    # Same encoding requests would pick so providers get the same text from every engine
+    converted.encoding = get_encoding_from_headers(converted.headers)
+    converted.url = str(response.url)
+    converted.elapsed = datetime.timedelta(seconds=time.perf_counter() - start)
+    return converted
@@ -0,0 +1,287 @@
+import concurrent.futures
+import hashlib
+import html
+import io
+import os
+import re
+import tempfile
+import threading
+import time
+import urllib.parse
+from typing import Callable
+
+try:
+    from PIL import Image
+except ImportError: # Pillow is only needed to resize and recompress images
+    Image = None
+
+
+MEDIA_TYPES = {
+    ".jpg": "image/jpeg",
+    ".png": "image/png",
+    ".gif": "image/gif",
+    ".webp": "image/webp",
+    ".svg": "image/svg+xml",
+}
+
+
+def get_media_type(file_name: str) -> str:
+    """Get the media type of an image from the suffix of its file name"""
+
+    suffix = os.path.splitext(file_name)[1].lower()
+    return MEDIA_TYPES.get(".jpg" if suffix == ".jpeg" else suffix, f"image/{suffix.lstrip(".")}")
+
+
+def get_image_id(file_name: str) -> str:
+    """Get the id in the package document of an image named by an ImageStore"""
+
+    return "image_" + os.path.basename(file_name).replace(".", "_")
+
+
+def get_suffix(content: bytes, url: str) -> str:
+    """Get the suffix of an image from its first bytes, or from its url if they are not known"""
+
+    if content.startswith(b"\xff\xd8"):
+        return ".jpg"
+    if content.startswith(b"\x89PNG"):
+        return ".png"
+    if content.startswith(b"GIF8"):
+        return ".gif"
+    if content[:4] == b"RIFF" and content[8:12] == b"WEBP":
+        return ".webp"
+    if b"<svg" in content[:512]:
+        return ".svg"
+    suffix = os.path.splitext(urllib.parse.urlsplit(url).path)[1].lower()
+    return ".jpg" if suffix in ("", ".jpeg") or suffix not in MEDIA_TYPES else suffix
+
+
+class ImageStore:
+    """Image Store
+
+        Downloads the cover and the images in chapters in its own pool of threads so they are
+        fetched while chapters are downloading, and keeps one file for every different image.
+
+        Images are found by the url they are downloaded from and by the sha256 of their content,
+        so an image used in many chapters (or served from several urls) is only downloaded once and
+        only written into the epub once. They are named images/<first 16 characters of the hash>.<suffix>
+        and kept in a temporary folder until the epub is written so they never have to all be in memory.
+
+        With a max size or a quality (and Pillow installed) images are scaled down so their longest
+        side is at most max_size and saved again as jpeg (png if they are transparent), the original
+        is kept whenever that would not make it smaller. Animated images and svgs are never changed.
+    """
+
+    max_workers = 4
+    img_pattern = re.compile(r"<img\b[^>]*>", re.IGNORECASE)
+    attribute_pattern = re.compile(r"""([\w-]+)\s*=\s*("[^"]*"|'[^']*')""")
+
+
+    def __init__(self, fetch: Callable[[str], bytes | None], max_size: int = 0, quality: int = 0, inline: bool = True, on_stage: Callable[[str, float], None] | None = None) -> None:
+        """Constructor
+
+            fetch: downloads an image, returns None if it could not be downloaded
+            max_size: max number of pixels of the longest side of an image, 0 to keep their size
+            quality: jpeg quality images are saved again at (1 to 95), 0 for 85 when max_size is given and to keep them as they are otherwise
+            inline: get the images in chapters, otherwise only the cover is downloaded
+            on_stage: called with "resize" and the number of seconds every time an image is scaled down or recompressed,
+                      and with "image wait" every time a chapter waits for its images
+        """
+
+        if (max_size or quality) and Image is None:
+            raise Exception("Resizing images needs Pillow, install it with pip install pillow.")
+
+        self.fetch = fetch
+        self.max_size = max_size
+        self.quality = quality
+        self.inline = inline
+        self.on_stage = on_stage
+
+        self.lock = threading.Lock()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="image")
+        self.folder = tempfile.TemporaryDirectory(prefix="n2epub_images_")
+        self.urls = {} # url: future of the image's file name, None if it could not be downloaded
+        self.digests = {} # sha256 of an image as downloaded: future of its file name
+        self.file_names = [] # The file name of every different image in the order they were downloaded
+        self.failed = [] # Urls of images that could not be downloaded
+        self.duplicates = 0 # Number of images downloaded that were the same as one downloaded before
+        self.original_size = 0 # Number of bytes of the different images as downloaded
+        self.size = 0 # Number of bytes of the different images once resized
+
+
+    def submit(self, url: str, fetch: Callable[[str], bytes | None] | None = None) -> concurrent.futures.Future:
+        """Start downloading an image if it was not already
+
+            url: the absolute url of the image
+            fetch: downloads the image instead of the store's fetch (like the cover going through the http cache)
+
+            returns a future of the image's file name, None if it could not be downloaded
+        """
+
+        with self.lock:
+            if url not in self.urls:
+                self.urls[url] = self.executor.submit(self.get_image, url, fetch or self.fetch)
+            return self.urls[url]
+
+
+    def find_urls(self, chapter_text: str, chapter_url: str) -> list[str]:
+        """Get the absolute url of every image in a chapter, none if the store does not get the images in chapters"""
+
+        if not self.inline:
+            return []
+        return [url for tag in self.img_pattern.findall(chapter_text) if (url := self.get_img_url(tag, chapter_url)) is not None]
+
+
+    def prefetch(self, chapter_text: str, chapter_url: str) -> None:
+        """Start downloading every image in a chapter without waiting for them"""
+
+        for url in self.find_urls(chapter_text, chapter_url):
+            self.submit(url)
+
+
+    def localize(self, chapter_text: str, chapter_url: str) -> str:
+        """Download every image in a chapter and point their tags to the images in the epub
+
+            chapter_text: the chapter's text or page
+            chapter_url: the url of the chapter, relative image urls are relative to it
+
+            Blocks until every image of the chapter is downloaded, the images are downloaded at the
+            same time. Images that could not be downloaded are replaced by their alt text.
+        """
+
+        futures = {url: self.submit(url) for url in self.find_urls(chapter_text, chapter_url)}
+        if not futures:
+            return chapter_text
+        start = time.perf_counter()
+        concurrent.futures.wait(futures.values())
+        if self.on_stage is not None:
+            self.on_stage("image wait", time.perf_counter() - start)
+
+        def replace(match: re.Match) -> str:
+            tag = match.group(0)
+            if (url := self.get_img_url(tag, chapter_url)) is None:
+                return tag
+            alt = {name.lower(): value for name, value in self.attribute_pattern.findall(tag)}.get("alt", "\"\"")
+            if (file_name := futures[url].result()) is None:
+                return alt[1:-1]
+            return f"<img src=\"{file_name}\" alt={alt}/>"
+
+        return self.img_pattern.sub(replace, chapter_text)
+
+
+    def get_img_url(self, tag: str, chapter_url: str) -> str | None:
+        """Get the absolute url of the image of an <img> tag, lazy loaded images keep it in data-src"""
+
+        attributes = {name.lower(): html.unescape(value[1:-1]).strip() for name, value in self.attribute_pattern.findall(tag)}
+        url = attributes.get("data-src") or attributes.get("src")
+        if not url or url.startswith("data:"):
+            return None
+        return urllib.parse.urljoin(chapter_url, url)
+
+
+    def get_image(self, url: str, fetch: Callable[[str], bytes | None]) -> str | None:
+        """Download an image and store it unless the same image was already stored, runs in the store's threads
+
+            returns the image's file name, None if it could not be downloaded
+        """
+
+        if (content := fetch(url)) is None:
+            with self.lock:
+                self.failed.append(url)
+            return None
+
+        digest = hashlib.sha256(content).hexdigest()
+        with self.lock:
+            duplicate = digest in self.digests
+            if duplicate:
+                self.duplicates += 1
+                future = self.digests[digest]
+            else:
+                future = self.digests[digest] = concurrent.futures.Future()
+        if duplicate:
+            return future.result() # The thread storing the same image is already running so this never waits long
+
+        try:
+            file_name = self.store(digest, content, url)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        future.set_result(file_name)
+        return file_name
+
+
+    def store(self, digest: str, content: bytes, url: str) -> str:
+        """Resize an image if it should be and write it into the temporary folder
+
+            returns its file name
+        """
+
+        suffix = get_suffix(content, url)
+        original_size = len(content)
+        if (self.max_size or self.quality) and suffix not in (".svg", ".gif"):
+            start = time.perf_counter()
+            content, suffix = self.resize(content, suffix)
+            if self.on_stage is not None:
+                self.on_stage("resize", time.perf_counter() - start)
+
+        file_name = f"images/{digest[:16]}{suffix}"
+        with open(os.path.join(self.folder.name, file_name.replace("/", "_")), "wb") as f:
+            f.write(content)
+        with self.lock:
+            self.file_names.append(file_name)
+            self.original_size += original_size
+            self.size += len(content)
+        return file_name
+
+
+    def resize(self, content: bytes, suffix: str) -> tuple[bytes, str]:
+        """Scale down an image and save it again
+
+            returns the new image and its suffix, or the image as it was if the new one is not smaller
+        """
+
+        try:
+            with Image.open(io.BytesIO(content)) as image:
+                if getattr(image, "is_animated", False):
+                    return (content, suffix)
+                resized = bool(self.max_size) and max(image.size) > self.max_size
+                if resized:
+                    image.thumbnail((self.max_size, self.max_size))
+                output = io.BytesIO()
+                if image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info:
+                    image.save(output, "PNG", optimize=True)
+                    new_suffix = ".png"
+                else:
+                    image.convert("RGB").save(output, "JPEG", quality=self.quality or 85, optimize=True)
+                    new_suffix = ".jpg"
+        except Exception: # Pillow cannot read it, it is kept as it is
+            return (content, suffix)
+
+        if len(output.getvalue()) >= len(content) and not resized:
+            return (content, suffix)
+        return (output.getvalue(), new_suffix)
+
+
+    def read(self, file_name: str) -> bytes:
+        """Get the content of a stored image"""
+
+        with open(os.path.join(self.folder.name, file_name.replace("/", "_")), "rb") as f:
+            return f.read()
+
+
+    def get_summary(self) -> str:
+        """Get the number of images, duplicates and failures and how much smaller they were made"""
+
+        summary = f"Got {len(self.file_names)} images ({self.duplicates} duplicates"
+        if self.failed:
+            summary += f", {len(self.failed)} could not be downloaded"
+        summary += ")"
+        if self.size != self.original_size:
+            summary += f", resized from {self.original_size / 1024 / 1024:.1f} MB to {self.size / 1024 / 1024:.1f} MB"
+        return summary + "."
+
+
+    def close(self) -> None:
+        """Stop downloading images and delete the temporary folder"""
+
+        self.executor.shutdown(cancel_futures=True)
+        self.folder.cleanup()
@@ -0,0 +1,332 @@
+import contextlib
+import os
+import sqlite3
+import time
+from typing import Iterator, NamedTuple
+
+from src import constants
+
+
+def get_queue_path() -> str:
+    """Get the default path of the queue's database"""
+
+    return os.path.join(constants.get_root_dir(), "n2epub_queue.sqlite3")
+
+
+class Job(NamedTuple):
+    """Job
+
+        Work claimed from the queue by a worker.
+
+        kind: "list" to find the novel's chapters, "chapters" to download chapters or "assemble" to write the epub
+        novel: the novel's row
+        chapters: the (number, url) of every chapter claimed by a "chapters" job, empty otherwise
+    """
+
+    kind: str
+    novel: sqlite3.Row
+    chapters: list[tuple[int, str]]
+
+
+class JobQueue:
+    """Job Queue
+
+        A queue of novels to download kept in a SQLite database so any number of worker processes,
+        on this computer or others sharing the file, can split the work and a worker that crashes
+        never loses more than the chapters it was downloading.
+
+        Each novel goes through:
+            listing: a worker finds its title, author, cover and the url of every chapter
+            downloading: every chapter is a work item workers claim in batches
+            assembling: every chapter is done, a worker writes the epub
+            done or failed
+
+        Work is claimed with a lease: it belongs to the worker until lease_until and is claimed again by
+        another worker once the lease runs out, so work of a worker that died is picked up again. Workers
+        renew their lease while they make progress. A chapter that fails is retried after a delay that
+        grows with each attempt and the novel fails once a chapter failed max_attempts times.
+
+        Downloaded chapters are stored in the database so the epub can be written by any worker.
+
+        The rollback journal is used instead of WAL since WAL does not work on network file systems.
+    """
+
+    max_attempts = 5
+    retry_delay = 30 # Seconds before a failed chapter is claimed again, multiplied by its number of attempts
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS novels (
+            id INTEGER PRIMARY KEY,
+            url TEXT NOT NULL UNIQUE,
+            provider TEXT,
+            output_dir TEXT NOT NULL,
+            status TEXT NOT NULL,
+            title TEXT,
+            author TEXT,
+            cover_url TEXT,
+            lease_owner TEXT,
+            lease_until REAL NOT NULL DEFAULT 0,
+            error TEXT,
+            added REAL NOT NULL,
+            finished REAL
+        );
+        CREATE TABLE IF NOT EXISTS chapters (
+            novel_id INTEGER NOT NULL REFERENCES novels (id) ON DELETE CASCADE,
+            number INTEGER NOT NULL,
+            url TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            lease_owner TEXT,
+            lease_until REAL NOT NULL DEFAULT 0,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            title TEXT,
+            content TEXT,
+            error TEXT,
+            PRIMARY KEY (novel_id, number)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS chapters_by_status ON chapters (status, novel_id, lease_until);
+    """
+
+
+    def __init__(self, path: str | None = None) -> None:
+        """Constructor
+
+            path: the path of the database, defaults to get_queue_path()
+        """
+
+        self.path = path or get_queue_path()
+        # Autocommit so every write is its own transaction unless it is wrapped in transaction
+        self.connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.executescript(self.SCHEMA)
+
+
+    def __enter__(self) -> "JobQueue":
+        return self
+
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+
+    def close(self) -> None:
+        """Close the database"""
+
+        self.connection.close()
+
+
+    @contextlib.contextmanager
+    def transaction(self) -> Iterator[None]:
+        """Run a transaction that is committed if nothing raised
+
+            The database is locked for writing as soon as it starts (BEGIN IMMEDIATE) so two
+            workers can never claim the same work.
+        """
+
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        self.connection.execute("COMMIT")
+
+
+    def add(self, url: str, provider: str | None, output_dir: str) -> bool:
+        """Add a novel to the queue
+
+            url: the url to the homepage of the novel
+            provider: the name of the provider, None to detect it from the url
+            output_dir: where the epub is written, "" for the directory of the worker that writes it
+
+            returns False if the novel is already in the queue
+        """
+
+        cursor = self.connection.execute(
+            "INSERT OR IGNORE INTO novels (url, provider, output_dir, status, added) VALUES (?, ?, ?, 'listing', ?)",
+            (url, provider, output_dir, time.time())
+        )
+        return cursor.rowcount == 1
+
+
+    def claim(self, worker: str, batch_size: int, lease: float) -> Job | None:
+        """Claim the next piece of work
+
+            worker: the id of the worker claiming it
+            batch_size: max number of chapters claimed at once
+            lease: number of seconds the work belongs to the worker
+
+            Novels that are ready to be written come first so epubs are finished as soon as possible,
+            then novels whose chapters have to be found, then chapters of the oldest novel.
+
+            returns None if there is no work that is not leased to another worker
+        """
+
+        now = time.time()
+        with self.transaction():
+            novel = self.connection.execute(
+                "SELECT * FROM novels WHERE status IN ('assembling', 'listing') AND lease_until < ? ORDER BY status = 'listing', id LIMIT 1",
+                (now,)
+            ).fetchone()
+            if novel is not None:
+                self.connection.execute("UPDATE novels SET lease_owner = ?, lease_until = ? WHERE id = ?", (worker, now + lease, novel["id"]))
+                return Job("assemble" if novel["status"] == "assembling" else "list", novel, [])
+
+            chapter = self.connection.execute(
+                "SELECT novel_id FROM chapters JOIN novels ON novels.id = chapters.novel_id"
+                " WHERE novels.status = 'downloading' AND chapters.status = 'pending' AND chapters.lease_until < ? ORDER BY novel_id LIMIT 1",
+                (now,)
+            ).fetchone()
+            if chapter is None:
+                return None
+            chapters = self.connection.execute(
+                "SELECT number, url FROM chapters WHERE novel_id = ? AND status = 'pending' AND lease_until < ? ORDER BY number LIMIT ?",
+                (chapter["novel_id"], now, batch_size)
+            ).fetchall()
+            self.connection.executemany(
+                "UPDATE chapters SET lease_owner = ?, lease_until = ? WHERE novel_id = ? AND number = ?",
+                [(worker, now + lease, chapter["novel_id"], number) for number, _ in chapters]
+            )
+            novel = self.connection.execute("SELECT * FROM novels WHERE id = ?", (chapter["novel_id"],)).fetchone()
+        return Job("chapters", novel, [(number, url) for number, url in chapters])
+
+
+    def renew(self, worker: str, lease: float) -> None:
+        """Extend the lease of everything a worker claimed and has not finished"""
+
+        until = time.time() + lease
+        with self.transaction():
+            self.connection.execute("UPDATE chapters SET lease_until = ? WHERE lease_owner = ? AND status = 'pending'", (until, worker))
+            self.connection.execute("UPDATE novels SET lease_until = ? WHERE lease_owner = ? AND status IN ('listing', 'assembling')", (until, worker))
+
+
+    def set_chapters(self, novel_id: int, title: str, author: str | None, cover_url: str | None, urls: list[str]) -> None:
+        """Finish listing a novel, its chapters are ready to be claimed
+
+            novel_id: the id of the novel
+            title: the novel's title
+            author: the novel's author
+            cover_url: the url of the novel's cover
+            urls: the url of every chapter in order
+        """
+
+        if not urls:
+            self.fail_novel(novel_id, f"{title} does not have any chapters.")
+            return
+        with self.transaction():
+            self.connection.execute(
+                "UPDATE novels SET status = 'downloading', title = ?, author = ?, cover_url = ?, lease_owner = NULL, lease_until = 0 WHERE id = ?",
+                (title, author, cover_url, novel_id)
+            )
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO chapters (novel_id, number, url) VALUES (?, ?, ?)",
+                [(novel_id, number, url) for number, url in enumerate(urls, start=1)]
+            )
+
+
+    def complete_chapter(self, novel_id: int, number: int, title: str, content: str) -> None:
+        """Store a downloaded chapter, the novel is ready to be written once it was its last chapter
+
+            novel_id: the id of the novel
+            number: the chapter number
+            title: the chapter's title
+            content: the content of the chapter's page
+        """
+
+        with self.transaction():
+            self.connection.execute(
+                "UPDATE chapters SET status = 'done', title = ?, content = ?, lease_owner = NULL, error = NULL WHERE novel_id = ? AND number = ? AND status = 'pending'",
+                (title, content, novel_id, number)
+            )
+            if self.connection.execute("SELECT 1 FROM chapters WHERE novel_id = ? AND status != 'done' LIMIT 1", (novel_id,)).fetchone() is None:
+                self.connection.execute("UPDATE novels SET status = 'assembling', lease_owner = NULL, lease_until = 0 WHERE id = ? AND status = 'downloading'", (novel_id,))
+
+
+    def release_chapters(self, worker: str, novel_id: int, failed: dict[int, str]) -> None:
+        """Give back the chapters of a novel a worker claimed and did not finish
+
+            worker: the id of the worker
+            novel_id: the id of the novel
+            failed: the number of each chapter that failed to the reason, chapters that are not in it
+                were never tried and can be claimed again right away
+        """
+
+        now = time.time()
+        with self.transaction():
+            for number, error in failed.items():
+                attempts = self.connection.execute(
+                    "UPDATE chapters SET attempts = attempts + 1, error = ?, lease_owner = NULL WHERE novel_id = ? AND number = ? AND status = 'pending' RETURNING attempts",
+                    (error, novel_id, number)
+                ).fetchone()
+                if attempts is None:
+                    continue
+                if attempts[0] >= self.max_attempts:
+                    self.connection.execute("UPDATE chapters SET status = 'failed' WHERE novel_id = ? AND number = ?", (novel_id, number))
+                    self.connection.execute("UPDATE novels SET status = 'failed', error = ?, finished = ? WHERE id = ?", (f"Chapter {number} failed {attempts[0]} times: {error}", now, novel_id))
+                else:
+                    self.connection.execute("UPDATE chapters SET lease_until = ? WHERE novel_id = ? AND number = ?", (now + self.retry_delay * attempts[0], novel_id, number))
+            self.connection.execute(
+                "UPDATE chapters SET lease_owner = NULL, lease_until = 0 WHERE novel_id = ? AND lease_owner = ? AND status = 'pending'",
+                (novel_id, worker)
+            )
+
+
+    def iter_chapters(self, novel_id: int) -> Iterator[tuple[int, str, str, str]]:
+        """Get the number, url, title and content of every chapter of a novel in order"""
+
+        yield from self.connection.execute("SELECT number, url, title, content FROM chapters WHERE novel_id = ? ORDER BY number", (novel_id,))
+
+
+    def finish_novel(self, novel_id: int) -> None:
+        """Mark a novel as written, the content of its chapters is deleted since the epub has it"""
+
+        with self.transaction():
+            self.connection.execute("UPDATE novels SET status = 'done', lease_owner = NULL, error = NULL, finished = ? WHERE id = ?", (time.time(), novel_id))
+            self.connection.execute("UPDATE chapters SET content = NULL WHERE novel_id = ?", (novel_id,))
+
+
+    def fail_novel(self, novel_id: int, error: str) -> None:
+        """Mark a novel as failed, it is only tried again with retry"""
+
+        self.connection.execute("UPDATE novels SET status = 'failed', lease_owner = NULL, error = ?, finished = ? WHERE id = ?", (error, time.time(), novel_id))
+
+
+    def retry(self, novel_ids: list[int] | None = None) -> int:
+        """Try failed novels again, chapters that were already downloaded are kept
+
+            novel_ids: the ids of the novels, None for every failed novel
+
+            returns the number of novels that will be tried again
+        """
+
+        ids = [row["id"] for row in self.connection.execute("SELECT id FROM novels WHERE status = 'failed'") if novel_ids is None or row["id"] in novel_ids]
+        with self.transaction():
+            for novel_id in ids:
+                self.connection.execute("UPDATE chapters SET status = 'pending', attempts = 0, lease_until = 0 WHERE novel_id = ? AND status = 'failed'", (novel_id,))
+                has_chapters = self.connection.execute("SELECT 1 FROM chapters WHERE novel_id = ? LIMIT 1", (novel_id,)).fetchone() is not None
+                has_pending = self.connection.execute("SELECT 1 FROM chapters WHERE novel_id = ? AND status != 'done' LIMIT 1", (novel_id,)).fetchone() is not None
+                status = "downloading" if has_pending else "assembling" if has_chapters else "listing"
+                self.connection.execute("UPDATE novels SET status = ?, error = NULL, finished = NULL, lease_owner = NULL, lease_until = 0 WHERE id = ?", (status, novel_id))
+        return len(ids)
+
+
+    def remove(self, novel_ids: list[int]) -> int:
+        """Remove novels and their chapters from the queue
+
+            returns the number of novels removed
+        """
+
+        with self.transaction():
+            return sum(self.connection.execute("DELETE FROM novels WHERE id = ?", (novel_id,)).rowcount for novel_id in novel_ids)
+
+
+    def get_status(self) -> list[sqlite3.Row]:
+        """Get every novel with the number of its chapters that are done, failed and in total"""
+
+        return self.connection.execute("""
+            SELECT novels.*, COUNT(chapters.number) AS total,
+                COALESCE(SUM(chapters.status = 'done'), 0) AS done,
+                COALESCE(SUM(chapters.status = 'failed'), 0) AS failed
+            FROM novels LEFT JOIN chapters ON chapters.novel_id = novels.id
+            GROUP BY novels.id ORDER BY novels.id
+        """).fetchall()
@@ -0,0 +1,54 @@
+import datetime
+import click
+
+from src import constants
+from src.library_catalog import LibraryCatalog
+
+
+@click.command()
+@click.help_option("-h", "--help")
+@click.argument("directory", required=False, type=click.Path(exists=True, file_okay=False))
+@click.option("-f", "--filter", "query", default="", type=click.STRING, help="Words that each have to be in the title or author of a novel, case does not matter.", metavar="WORDS")
+@click.option("-s", "--sort", "sort", default="title", type=click.Choice(list(LibraryCatalog.SORTS)), show_default=True, help="What the novels are sorted by, modified and read start with the most recent.")
+@click.option("-r", "--reverse", "reverse", is_flag=True, default=False, help="Sort in the other order.")
+@click.option("-l", "--limit", "limit", default=0, type=click.IntRange(0, clamp=True), show_default=True, help="Max number of novels to show (0 to show every novel).", metavar="NOVELS")
+@click.option("-o", "--output", "output", default="table", type=click.Choice(["table", "paths", "urls"]), show_default=True, help="Show a table of the novels, only the path of each epub or only the url each was downloaded from.")
+def library(directory: str | None, query: str, sort: str, reverse: bool, limit: int, output: str) -> None:
+    """Lists the epub files in a directory with their title, author, chapters and where they were last read
+
+        DIRECTORY: the directory of the epub files, the directory of the executable if not given.
+
+        The novels are kept in a catalog in the cache so only the epubs that are new or changed
+        since the last time are opened, listing thousands of novels takes milliseconds.
+
+        paths and urls output one epub or url on each line to give them to other commands, like
+        updating every novel that matches a filter.
+    """
+
+    try:
+        with LibraryCatalog() as catalog:
+            directory = directory or constants.get_root_dir() or "."
+            read_count, removed_count = catalog.refresh(directory)
+            novels = catalog.find(directory, query, sort, reverse, limit)
+
+            if output != "table":
+                for novel in novels:
+                    if (line := novel["path"] if output == "paths" else novel["source_url"]) is not None:
+                        click.echo(line)
+                return
+
+            if novels:
+                click.echo(f"{"chapters":>8} {"read at":>8} {"MB":>7}  {"modified":<16}  novel")
+            for novel in novels:
+                chapters = "-" if novel["chapters"] is None else novel["chapters"]
+                read_at = "-" if novel["chapter"] is None else novel["chapter"] + 1
+                modified = datetime.datetime.fromtimestamp(novel["mtime_ns"] / 1e9).strftime("%Y-%m-%d %H:%M")
+                click.echo(f"{chapters:>8} {read_at:>8} {novel["size"] / 1024 / 1024:>7.1f}  {modified:<16}  {novel["title"]}" + (f" by {novel["author"]}" if novel["author"] else ""))
+            click.echo(
+                f"\n{len(novels)} novels" + (f" matching \"{query}\"" if query else "") + f" in {directory}"
+                f" ({read_count} new or changed, {removed_count} removed since the last time)."
+            )
+    except constants.ProgError as e:
+        raise Exception(e)
+    except Exception as e:
+        click.echo(f"Error occurred while listing the library:\n\t{e}", err=True)
@@ -0,0 +1,190 @@
+import os
+import posixpath
+import sqlite3
+import time
+import zipfile
+
+from src import constants
+from src.cache import get_cache_dir
+from src.reader_index import ReaderIndex
+
+
+def get_metadata(filename: str) -> dict:
+    """Get the title, author, source url and number of chapters of an epub file
+
+        Only the container and the package document are read out of the zip.
+    """
+
+    from lxml import etree # Only needed for epubs the catalog does not know yet, so listing the library does not import it
+
+    with zipfile.ZipFile(filename) as zip_file:
+        container = etree.fromstring(zip_file.read("META-INF/container.xml"))
+        opf = etree.fromstring(zip_file.read(container.find(".//container:rootfile", constants.NAMESPACES).get("full-path")))
+
+    return {
+        "title": opf.findtext(".//dc:title", "", constants.NAMESPACES) or os.path.splitext(os.path.basename(filename))[0],
+        "author": opf.findtext(".//dc:creator", "", constants.NAMESPACES),
+        "source_url": opf.findtext(".//dc:source", None, constants.NAMESPACES),
+        # Chapters are the documents whose name starts with their number, like in EpubUpdater
+        "chapters": sum(
+            1 for item in opf.iterfind(".//opf:item[@media-type='application/xhtml+xml']", constants.NAMESPACES)
+            if posixpath.basename(item.get("href"))[:1].isdigit()
+        ),
+    }
+
+
+class LibraryCatalog:
+    """Library Catalog
+
+        An index of the epub files in directories kept in a SQLite database in the cache, so
+        thousands of novels can be listed, filtered and sorted without opening every zip.
+
+        refresh compares the mtime and size of every epub in a directory with the ones in the
+        catalog and only reads the package document of the epubs that are new or changed, the
+        epubs that are gone are removed. The read command sets when a novel was last read, the
+        chapter and line it was read at are only kept in its reader index and are read from there
+        for the novels find returns.
+
+        A novel whose package document cannot be read is kept with the name of its file as its
+        title and no chapters so it is not opened again until it changes.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS books (
+            path TEXT PRIMARY KEY,
+            directory TEXT NOT NULL,
+            file_name TEXT NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            title TEXT NOT NULL,
+            author TEXT NOT NULL,
+            source_url TEXT,
+            chapters INTEGER,
+            last_read REAL
+        );
+        CREATE INDEX IF NOT EXISTS books_by_directory ON books (directory);
+    """
+    SORTS = { # name: (column, whether it is sorted in descending order unless reversed)
+        "title": ("title COLLATE NOCASE", False),
+        "author": ("author COLLATE NOCASE", False),
+        "chapters": ("chapters", False),
+        "size": ("size", False),
+        "modified": ("mtime_ns", True),
+        "read": ("last_read", True),
+    }
+
+
+    def __init__(self, path: str | None = None) -> None:
+        """Constructor
+
+            path: the path of the database, defaults to library.sqlite3 in get_cache_dir()
+        """
+
+        if path is None:
+            os.makedirs(get_cache_dir(), exist_ok=True)
+        self.path = path or os.path.join(get_cache_dir(), "library.sqlite3")
+        self.connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript(self.SCHEMA)
+
+
+    def __enter__(self) -> "LibraryCatalog":
+        return self
+
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+
+    def close(self) -> None:
+        """Close the database"""
+
+        self.connection.close()
+
+
+    def refresh(self, directory: str) -> tuple[int, int]:
+        """Add the epubs in a directory that are new or changed to the catalog and remove the ones that are gone
+
+            directory: the directory to scan, its subdirectories are not scanned
+
+            returns the number of epubs read and the number removed
+        """
+
+        directory = os.path.abspath(directory)
+        known = {row["path"]: (row["mtime_ns"], row["size"]) for row in self.connection.execute("SELECT path, mtime_ns, size FROM books WHERE directory = ?", (directory,))}
+        changed = []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if not entry.name.endswith(".epub") or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                if known.pop(entry.path, None) != (stat.st_mtime_ns, stat.st_size):
+                    changed.append((entry, stat))
+
+        self.connection.execute("BEGIN")
+        try:
+            for entry, stat in changed:
+                try:
+                    metadata = get_metadata(entry.path)
+                except Exception: # Not an epub made by n2epub or a broken one
+                    metadata = {"title": os.path.splitext(entry.name)[0], "author": "", "source_url": None, "chapters": None}
+                self.connection.execute("""
+                    INSERT INTO books (path, directory, file_name, mtime_ns, size, title, author, source_url, chapters)
+                    VALUES (:path, :directory, :file_name, :mtime_ns, :size, :title, :author, :source_url, :chapters)
+                    ON CONFLICT (path) DO UPDATE SET mtime_ns = excluded.mtime_ns, size = excluded.size, title = excluded.title,
+                        author = excluded.author, source_url = excluded.source_url, chapters = excluded.chapters
+                """, {
+                    "path": entry.path, "directory": directory, "file_name": entry.name, "mtime_ns": stat.st_mtime_ns,
+                    "size": stat.st_size, **metadata,
+                })
+            self.connection.executemany("DELETE FROM books WHERE path = ?", [(path,) for path in known])
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        self.connection.execute("COMMIT")
+        return (len(changed), len(known))
+
+
+    def find(self, directory: str, query: str = "", sort: str = "title", reverse: bool = False, limit: int = 0) -> list[dict]:
+        """Get the epubs in a directory with the chapter and line each was last read at, refresh it first to see its changes
+
+            directory: the directory the epubs are in
+            query: words that have to each be in the title or author, case does not matter
+            sort: one of SORTS, novels are sorted by title after it
+            reverse: sort in the other order
+            limit: max number of epubs, 0 for every one
+        """
+
+        if sort not in self.SORTS:
+            raise constants.ProgError(f"Cannot sort the library by {sort}.")
+
+        conditions = ["directory = ?"]
+        parameters = [os.path.abspath(directory)]
+        for word in query.split():
+            pattern = "%" + word.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            conditions.append("(title LIKE ? ESCAPE '\\' OR author LIKE ? ESCAPE '\\')")
+            parameters += [pattern, pattern]
+
+        column, descending = self.SORTS[sort]
+        order = f"{column} {"DESC" if descending != reverse else "ASC"} NULLS LAST, title COLLATE NOCASE" # Novels never read or not known are always last
+        rows = self.connection.execute(
+            f"SELECT path, directory, file_name, mtime_ns, size, title, author, source_url, chapters, last_read FROM books WHERE {" AND ".join(conditions)} ORDER BY {order}" + (" LIMIT ?" if limit else ""),
+            [*parameters, limit] if limit else parameters,
+        ).fetchall()
+
+        novels = []
+        for row in rows:
+            novel = dict(row)
+            # Only the header of the reader index is read, None if the novel was never read or changed since
+            try:
+                novel["chapter"], novel["line"] = ReaderIndex(row["path"]).load_position() or (None, None)
+            except OSError: # Deleted since the refresh
+                novel["chapter"], novel["line"] = (None, None)
+            novels.append(novel)
+        return novels
+
+
+    def set_read(self, filename: str) -> None:
+        """Set when an epub was last read, does nothing if the epub is not in the catalog"""
+
+        self.connection.execute("UPDATE books SET last_read = ? WHERE path = ?", (time.time(), os.path.abspath(filename)))
@@ -1,18 +1,53 @@
+import importlib
+import multiprocessing
 import click
 
-from src.download import download
-from src.read import read
 
+class LazyGroup(click.Group):
+    """Lazy Group
 
-@click.group()
+        A click group that only imports the module of a command when the command is used (or its
+        help is shown), so running one command does not import what every other command needs.
+    """
+
+
+    def __init__(self, *args, lazy_commands: dict[str, str], **kwargs) -> None:
+        """Constructor
+
+            lazy_commands: the name of each command to "module:attribute" of the command
+        """
+
+        super().__init__(*args, **kwargs)
+        self.lazy_commands = lazy_commands
+
+
+    def list_commands(self, ctx: click.Context) -> list[str]:
+        return sorted([*super().list_commands(ctx), *self.lazy_commands])
+
+
+    def get_command(self, ctx: click.Context, name: str) -> click.Command | None:
+        if name not in self.lazy_commands:
+            return super().get_command(ctx, name)
+        module_name, attribute = self.lazy_commands[name].split(":")
+        return getattr(importlib.import_module(module_name), attribute)
+
+
+@click.group(cls=LazyGroup, lazy_commands={
+    "download": "src.download:download",
+    "batch": "src.batch:batch",
+    "read": "src.read:read",
+    "search": "src.search:search",
+    "library": "src.library:library",
+    "update": "src.update:update",
+    "queue": "src.queue_command:queue",
+    "worker": "src.worker:worker",
+})
 @click.help_option("-h", "--help")
 @click.version_option("0.1.2", "-v", "--version", message="%(prog)s %(version)s", prog_name="n2epub")
 def cli() -> None:
     """A cli to download light/web novels as epub files."""
     pass
 
-cli.add_command(download)
-cli.add_command(read)
-
 if __name__ == "__main__":
-    cli()
\ No newline at end of file
+    multiprocessing.freeze_support() # Lets the parse processes of the pipeline engine start in the pyinstaller executable
+    cli()
@@ -6,7 +6,10 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[],
-    hiddenimports=[],
+    hiddenimports=[ # Commands and providers are imported by name only when they are used
+        'src.download', 'src.batch', 'src.read', 'src.search', 'src.library', 'src.update', 'src.queue_command', 'src.worker',
+        'src.providers.novel_bin',
+    ],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
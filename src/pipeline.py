@@ -0,0 +1,42 @@
+import time
+import requests
+
+# The Downloader each parse process parses chapters with, made once when the process starts
+parse_downloader = None
+
+
+def init_parse_process(downloader_class: type, homepage_url: str) -> None:
+    """Make the Downloader of a parse process
+
+        downloader_class: the class of the provider, has to be importable by the process
+        homepage_url: the url to the homepage of the novel
+    """
+
+    global parse_downloader
+    parse_downloader = downloader_class(homepage_url)
+
+
+def parse_chapter(content: bytes, encoding: str | None, url: str, chapter_number: int) -> tuple[str, str, str, float, float]:
+    """Parse a chapter that was downloaded in another process
+
+        content: the body of the chapter's response
+        encoding: the encoding of the chapter's response
+        url: the url of the chapter's response
+        chapter_number: the chapter number
+
+        returns the chapter's title, text, the content of its page and the seconds it took to parse the
+        chapter and to make the content
+    """
+
+    response = requests.Response()
+    response._content = content
+    response.encoding = encoding
+    response.url = url
+    response.status_code = 200
+
+    start = time.perf_counter()
+    chapter_title = parse_downloader.get_chapter_title(response) or f"Chapter {chapter_number}"
+    chapter_text = parse_downloader.get_chapter_text(response)
+    parsed = time.perf_counter()
+    content = parse_downloader.make_chapter_content(chapter_title, chapter_text)
+    return (chapter_title, chapter_text, content, parsed - start, time.perf_counter() - parsed)
@@ -0,0 +1,51 @@
+import importlib
+import re
+from typing import NamedTuple
+
+
+class Provider(NamedTuple):
+    """Provider
+
+        An entry in the registry of providers. A provider's module is only imported when one of its
+        novels is downloaded, so listing providers and matching urls does not import any of them.
+
+        name: the name of the provider's module in the providers folder, what --provider takes
+        title: the name of the website shown when listing providers
+        class_name: the name of the class extending Downloader in the module
+        url_pattern: matches the start of the url of every novel on the website
+    """
+
+    name: str
+    title: str
+    class_name: str
+    url_pattern: re.Pattern
+
+
+    def load(self) -> type:
+        """Import the provider's module and get its Downloader class"""
+
+        return getattr(importlib.import_module(f"{__name__}.{self.name}"), self.class_name)
+
+
+# Every provider, a new one has to be added here (and to the hiddenimports of n2epub.spec)
+PROVIDERS = [
+    Provider("novel_bin", "Novel Bin", "NovelBinDownloader", re.compile(r"https://novelbin")),
+]
+
+
+def find_provider(url: str) -> Provider | None:
+    """Get the provider whose url_pattern matches the url, None if there is none"""
+
+    for provider in PROVIDERS:
+        if provider.url_pattern.match(url):
+            return provider
+    return None
+
+
+def get_provider(name: str) -> Provider | None:
+    """Get a provider by the name of its module, None if there is none"""
+
+    for provider in PROVIDERS:
+        if provider.name == name:
+            return provider
+    return None
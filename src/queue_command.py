@@ -0,0 +1,110 @@
+import datetime
+import os
+import click
+
+from src.job_queue import JobQueue
+
+DATABASE_HELP = "Path to the queue's database, on a shared drive for workers on other computers.  [default: n2epub_queue.sqlite3 next to the executable]"
+
+
+@click.group()
+@click.help_option("-h", "--help")
+def queue() -> None:
+    """Manages the queue of novels downloaded by the worker command
+
+        Novels are added to a queue kept in a SQLite database, then any number of worker
+        commands download them, on this computer or on others that share the database. A
+        worker that stops or crashes loses no work since every chapter is stored in the queue
+        as soon as it is downloaded.
+
+        The database can be on a shared drive as long as it supports file locks.
+    """
+    pass
+
+
+@queue.command()
+@click.help_option("-h", "--help")
+@click.argument("urls", nargs=-1)
+@click.option("-f", "--file", "url_file", default=None, type=click.File("r"), help="File with a url on each line to add too, - for stdin. Empty lines and lines starting with # are skipped.", metavar="FILE")
+@click.option("-p", "--provider", "provider", default=None, type=click.STRING, help="Name of the provider (website) of the novels, detected from each url if not given.", metavar="PROVIDER")
+@click.option("-o", "--output", "output_dir", default=None, type=click.Path(file_okay=False), help="Directory the epub files are written to.  [default: the directory of the worker that writes it]", metavar="DIRECTORY")
+@click.option("-d", "--database", "database", default=None, type=click.Path(dir_okay=False), help=DATABASE_HELP, metavar="FILE")
+def add(urls: tuple[str, ...], url_file: click.File | None, provider: str | None, output_dir: str | None, database: str | None) -> None:
+    """Adds novels to the queue
+
+        URLS: the url to the homepage of each series to download.
+    """
+
+    urls = list(urls)
+    if url_file is not None:
+        urls.extend(line.strip() for line in url_file if line.strip() and not line.strip().startswith("#"))
+    if not urls:
+        click.echo("No urls to add.", err=True)
+        return
+
+    try:
+        with JobQueue(database) as jobs:
+            added = sum(1 for url in urls if jobs.add(url, provider, os.path.abspath(output_dir) if output_dir else ""))
+            click.echo(f"Added {added} novels to {jobs.path}" + (f", {len(urls) - added} were already in it." if added < len(urls) else "."))
+    except Exception as e:
+        click.echo(f"Error occurred while adding to the queue:\n\t{e}", err=True)
+
+
+@queue.command()
+@click.help_option("-h", "--help")
+@click.option("-d", "--database", "database", default=None, type=click.Path(dir_okay=False), help=DATABASE_HELP, metavar="FILE")
+def status(database: str | None) -> None:
+    """Shows every novel in the queue and how many of its chapters are done"""
+
+    try:
+        with JobQueue(database) as jobs:
+            novels = jobs.get_status()
+            if not novels:
+                click.echo(f"{jobs.path} is empty.")
+                return
+            click.echo(f"{"id":>5} {"status":<11} {"chapters":>13} {"failed":>6}  novel")
+            for novel in novels:
+                chapters = f"{novel["done"]}/{novel["total"]}" if novel["total"] else "-"
+                click.echo(f"{novel["id"]:>5} {novel["status"]:<11} {chapters:>13} {novel["failed"]:>6}  {novel["title"] or novel["url"]}")
+                if novel["finished"] is not None and novel["status"] == "done":
+                    click.echo(f"{"":>5} finished {datetime.datetime.fromtimestamp(novel["finished"]).strftime("%Y-%m-%d %H:%M")}")
+                if novel["error"]:
+                    click.echo(f"{"":>5} {novel["error"]}")
+    except Exception as e:
+        click.echo(f"Error occurred while reading the queue:\n\t{e}", err=True)
+
+
+@queue.command()
+@click.help_option("-h", "--help")
+@click.argument("ids", nargs=-1, type=click.INT)
+@click.option("-d", "--database", "database", default=None, type=click.Path(dir_okay=False), help=DATABASE_HELP, metavar="FILE")
+def retry(ids: tuple[int, ...], database: str | None) -> None:
+    """Tries failed novels again
+
+        IDS: the id of each novel to try again (shown by queue status), every failed novel if none are given.
+
+        Chapters that were already downloaded are not downloaded again.
+    """
+
+    try:
+        with JobQueue(database) as jobs:
+            click.echo(f"{jobs.retry(list(ids) or None)} novels will be tried again.")
+    except Exception as e:
+        click.echo(f"Error occurred while updating the queue:\n\t{e}", err=True)
+
+
+@queue.command()
+@click.help_option("-h", "--help")
+@click.argument("ids", nargs=-1, type=click.INT, required=True)
+@click.option("-d", "--database", "database", default=None, type=click.Path(dir_okay=False), help=DATABASE_HELP, metavar="FILE")
+def remove(ids: tuple[int, ...], database: str | None) -> None:
+    """Removes novels and their chapters from the queue
+
+        IDS: the id of each novel to remove (shown by queue status).
+    """
+
+    try:
+        with JobQueue(database) as jobs:
+            click.echo(f"Removed {jobs.remove(list(ids))} novels.")
+    except Exception as e:
+        click.echo(f"Error occurred while updating the queue:\n\t{e}", err=True)
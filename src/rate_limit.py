@@ -0,0 +1,170 @@
+import asyncio
+import email.utils
+import threading
+import time
+import requests
+
+
+def is_throttled(response: requests.Response) -> bool:
+    """Check if the response means the server wants requests to slow down"""
+
+    if response.status_code in (429, 503):
+        return True
+    if response.headers.get("cf-mitigated") == "challenge":
+        return True
+    return response.status_code == 403 and "<title>Just a moment...</title>" in response.text
+
+
+def get_retry_after(response: requests.Response) -> float | None:
+    """Get the number of seconds the Retry-After header asks to wait"""
+
+    retry_after = response.headers.get("Retry-After")
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimiter:
+    """Rate Limiter
+
+        Spaces out requests so that no more than rate requests are started each second,
+        shared between every thread that calls wait.
+    """
+
+    max_retry_delay = 60
+
+
+    def __init__(self, rate: float) -> None:
+        """Constructor
+
+            rate: max number of requests per second, 0 for no limit
+        """
+
+        self.rate = rate
+        self.next_time = 0.0
+        self.lock = threading.Lock()
+
+
+    def reserve(self) -> float:
+        """Take the next slot if it has started
+
+            returns 0 if the slot was taken, otherwise the number of seconds until it starts
+
+            Slots are only taken once they start instead of being handed out ahead of time so
+            a change of the rate applies to every request that is still waiting.
+        """
+
+        with self.lock:
+            now = time.monotonic()
+            if now < self.next_time:
+                return self.next_time - now
+            self.next_time = now + (1 / self.rate if self.rate > 0 else 0)
+        return 0
+
+
+    def wait(self) -> None:
+        """Block until the next request is allowed to start"""
+
+        while (delay := self.reserve()) > 0:
+            time.sleep(delay)
+
+
+    async def wait_async(self) -> None:
+        """Wait without blocking the event loop until the next request is allowed to start"""
+
+        while (delay := self.reserve()) > 0:
+            await asyncio.sleep(delay)
+
+
+    def record(self, response: requests.Response | None) -> None:
+        """Record how a request went, None if it raised an exception"""
+
+        if response is not None and (retry_after := get_retry_after(response)) is not None:
+            with self.lock:
+                self.next_time = max(self.next_time, time.monotonic() + retry_after)
+
+
+    def get_retry_delay(self, attempt: int, response: requests.Response | None) -> float:
+        """Get the number of seconds to wait before retrying a failed request
+
+            attempt: the number of times the request has already failed, starting at 0
+            response: the failed response, None if the request raised an exception
+        """
+
+        if response is not None and (retry_after := get_retry_after(response)) is not None:
+            return retry_after
+        return min(self.max_retry_delay, 3 * 2 ** attempt)
+
+
+class AdaptiveRateLimiter(RateLimiter):
+    """Adaptive Rate Limiter
+
+        A RateLimiter that finds the fastest rate a host allows on its own.
+
+        While responses are 200 and not slow_factor times slower than usual the rate grows, doubling
+        every second until the host first throttles and then by about increase requests per second
+        every second. When the host throttles (429, 503 or a cloudflare challenge) the rate is halved,
+        and a Retry-After header stops every request until it is over.
+    """
+
+    increase = 1
+    decrease = 0.5
+    slow_factor = 3
+
+
+    def __init__(self, rate: float, max_rate: float, min_rate: float = 0.1) -> None:
+        """Constructor
+
+            rate: number of requests per second to start at, 0 to start with no limit
+            max_rate: the rate never grows past this
+            min_rate: the rate never drops under this
+        """
+
+        super().__init__(min(rate, max_rate))
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.latency = None # Moving average of the latency of 200 responses
+        self.last_start = None
+        self.interval = None # Moving average of the time between requests, used when there is no limit
+        self.slow_start = True # Grow quickly until the host throttles for the first time
+
+
+    def reserve(self) -> float:
+        """Take the next slot if it has started and keep track of the time between requests"""
+
+        if (delay := super().reserve()) > 0:
+            return delay
+        with self.lock:
+            now = time.monotonic()
+            if self.last_start is not None:
+                interval = now - self.last_start
+                self.interval = interval if self.interval is None else self.interval * 0.9 + interval * 0.1
+            self.last_start = now
+        return 0
+
+
+    def record(self, response: requests.Response | None) -> None:
+        """Record how a request went and change the rate to match"""
+
+        super().record(response)
+        with self.lock:
+            if response is None or is_throttled(response):
+                current_rate = self.rate or (1 / self.interval if self.interval else self.max_rate)
+                self.rate = max(self.min_rate, current_rate * self.decrease)
+                self.slow_start = False
+                return
+            if response.status_code != 200:
+                return
+
+            latency = response.elapsed.total_seconds()
+            is_slow = self.latency is not None and latency > self.latency * self.slow_factor
+            self.latency = latency if self.latency is None else self.latency * 0.9 + latency * 0.1
+            if self.rate and not is_slow:
+                self.rate = min(self.max_rate, self.rate + (1 if self.slow_start else self.increase / self.rate))
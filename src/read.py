@@ -1,134 +1,139 @@
 import curses
 import os
-import re
+from typing import Sequence
 import click
-import ebooklib
-from ebooklib import epub
 
 from src import constants
+from src.book import Book
+from src.library_catalog import LibraryCatalog
+from src.screen import Screen
+from src.search_index import SearchIndex, SearchResults
 
 
 @click.command()
 @click.help_option("-h", "--help")
-@click.argument("filename")
+@click.argument("filename", required=False)
 @click.option("-s", "--select", "select", is_flag=True, default=False, help="Choose a novel from the directory of the executable.") # If I replace choose with select pycharm gets mad (bruh)
-def read(filename: str, select: bool) -> None:
+def read(filename: str | None, select: bool) -> None:
     """Read a novel in the command line from an epub file"""
 
     try:
         if select:
             filename = choose_novel()
+        elif filename is None:
+            raise Exception("Give the epub file to read or use --select to choose one.")
 
         if not os.path.exists(filename) or not filename.endswith(".epub"):
             raise Exception(f"File {filename} either does not exist or is not an epub file.")
 
         curses.wrapper(main_window, filename)
+        with LibraryCatalog() as catalog:
+            catalog.set_read(filename)
     except Exception as e:
         click.echo(f"Error occurred while reading:\n\t{e}", err=True)
 
 
 def choose_novel() -> str:
-    """Choose a novel from the directory of the executable"""
+    """Choose a novel from the directory of the executable, the most recently read novels are shown first"""
+
+    dir = constants.get_root_dir() or "."
+    with LibraryCatalog() as catalog:
+        catalog.refresh(dir)
+        novels = list_novels(catalog, dir, "")
+        if not novels:
+            raise Exception(f"No epub files found in {os.path.abspath(dir)}.")
+
+        stdin = click.get_text_stream("stdin") # Kept since each stream buffers what it reads
+        while True:
+            if not (chosen_novel := stdin.readline()):
+                raise Exception("No novel was chosen.")
+            chosen_novel = chosen_novel.strip()
+            if not chosen_novel.isdigit():
+                novels = list_novels(catalog, dir, chosen_novel)
+                continue
+            if not novels:
+                click.echo("No novels are shown, type words to find novels or press enter to show every novel.\n", err=True)
+                continue
+            if int(chosen_novel) < 1 or int(chosen_novel) > len(novels):
+                click.echo(f"Choose a number between 1 and {len(novels)}.\n", err=True)
+                continue
+            click.clear()
+            return novels[int(chosen_novel)-1]["path"]
+
+
+def list_novels(catalog: LibraryCatalog, dir: str, query: str, max_novels: int = 50) -> list[dict]:
+    """Show the novels in the catalog with every word of the query, returns the ones shown"""
 
     click.clear()
-    dir = constants.get_root_dir()
-    files = [path for path in os.listdir(dir) if path.endswith(".epub")]
-    if not files:
-        raise Exception(f"No epub files found in {dir}.")
+    novels = catalog.find(dir, query, "read")
+    if query and not novels:
+        click.echo(f"No novels match \"{query}\", press enter to show every novel.")
+        return []
 
-    click.echo("Choose a novel by entering the number:")
-    for i, file in enumerate(files):
-        click.echo(f"{i+1}. {file}")
+    click.echo("Choose a novel by entering the number, or type words to only show the novels with all of them:")
+    for i, novel in enumerate(novels[:max_novels]):
+        position = "not read" if novel["chapter"] is None else f"chapter {novel["chapter"] + 1}/{novel["chapters"]}"
+        click.echo(f"{i+1}. {novel["title"]}" + (f" by {novel["author"]}" if novel["author"] else "") + f" ({position})")
+    if len(novels) > max_novels:
+        click.echo(f"... {len(novels) - max_novels} more, type words to find them.")
+    return novels[:max_novels]
 
-    while True:
-        try:
-            chosen_novel = click.get_text_stream("stdin").readline().strip()
-            chosen_novel = int(chosen_novel)
-            if chosen_novel < 1 or chosen_novel > len(files):
-                raise Exception
-        except Exception as e:
-            click.echo(f"Choose a number between 1 and {len(files)}.\n", err=True)
-            continue
-        else:
-            click.clear()
-            return files[chosen_novel-1]
-
-
-def get_content(filename: str) -> list[tuple[str, list[str]]]:
-    """Get the content of an epub file
-
-        [
-            (chapter_title, [
-                lines_of_text_with_max_len_curses.COLS,
-            ]),
-        ]
-    """
-
-    book = epub.read_epub(filename)
-
-    content = []
-    for item in book.get_items_of_type(ebooklib.ITEM_DOCUMENT):
-        if isinstance(item, epub.EpubHtml) and item.file_name[0].isdigit():
-            text = item.get_content().decode()
-            title = re.search('<h1>((?=.*</h1>).*?)</h1>', text).group(1)
-            lines = re.findall(r'<p>((?=.*</p>).*?)</p>', text)
-            lines = text_to_lines("\n ".join(lines))
-            content.append((title, lines))
-    return content
-
-
-def text_to_lines(text: str) -> list[str]:
-    """Formats text to lines with max length of curses.COLS"""
-
-    words = re.split(r' ', text)
-    lines = []
-    line = ""
-    for word in words:
-        if len(line) + len(word) >= curses.COLS:
-            lines.append(line.strip())
-            line = ""
-            continue
-        line += word + " "
-        if word[-1] == "\n":
-            lines.append(line.strip())
-            line = ""
-    if line.strip() != "":
-        lines.append(line.strip())
-    return lines
+
+def get_width() -> int:
+    """Get the max length of a line, the last column is left empty since curses cannot write to the bottom right corner"""
+
+    return curses.COLS - 1
 
 
 def main_window(window: curses.window, filename: str) -> None:
     """Manages the curses window"""
 
     window.keypad(True)
-    window.scrollok(True)
     curses.noecho()
     curses.cbreak()
     curses.curs_set(0)
-
-    content = get_content(filename)
-    start_line_index = 0 # The line to start rendering text from
-    chapter_index = 0 # The index of the chapter to render
-
-    render_chapter(window, content, start_line_index, chapter_index)
-    while (key := window.getkey()) != "q":
-        if (key == "KEY_UP" or key == "w") and start_line_index > 0:
-            start_line_index -= 1
-        elif (key == "KEY_DOWN" or key == "s") and start_line_index < len(content[chapter_index][1]) - curses.LINES + 1: # +1 for chapter title
-            start_line_index += 1
-        elif (key == "KEY_LEFT" or key == "a") and chapter_index > 0:
-            chapter_index -= 1
-            start_line_index = 0
-        elif (key == "KEY_RIGHT" or key == "d") and chapter_index < len(content) - 1:
-            chapter_index += 1
-            start_line_index = 0
-        elif key == "\t":
-            if (new_index := manage_toc(window, content, chapter_index)) is not None:
-                chapter_index = new_index
+    curses.set_escdelay(25)
+    screen = Screen(window)
+
+    with Book(filename) as book, SearchIndex(filename) as search_index:
+        if not len(book):
+            raise Exception(f"{filename} does not have any chapters.")
+
+        width = get_width() # The width the chapter being read is wrapped to
+        chapter_index, start_line_index = book.get_position() # The index of the chapter and the line to start rendering text from
+        start_line_index = min(start_line_index, max(0, book.get_wrapped(chapter_index, width).wrap_to(start_line_index + curses.LINES) - curses.LINES + 1)) # The terminal might be bigger than last time
+
+        render_chapter(screen, book, start_line_index, chapter_index)
+        while (key := window.getkey()) != "q":
+            if (key == "KEY_UP" or key == "w") and start_line_index > 0:
+                start_line_index -= 1
+            elif (key == "KEY_DOWN" or key == "s") and start_line_index < book.get_wrapped(chapter_index, width).wrap_to(start_line_index + curses.LINES) - curses.LINES + 1: # +1 for chapter title
+                start_line_index += 1
+            elif (key == "KEY_LEFT" or key == "a") and chapter_index > 0:
+                chapter_index -= 1
                 start_line_index = 0
-
-        window.clear()
-        render_chapter(window, content, start_line_index, chapter_index)
+            elif (key == "KEY_RIGHT" or key == "d") and chapter_index < len(book) - 1:
+                chapter_index += 1
+                start_line_index = 0
+            elif key == "\t":
+                if (new_index := manage_toc(screen, book.titles, chapter_index)) is not None:
+                    chapter_index = new_index
+                    start_line_index = 0
+            elif key == "/":
+                if (hit := search_book(screen, book, search_index)) is not None:
+                    chapter_index, paragraph_index = hit
+                    start_line_index = book.get_wrapped(chapter_index, width).get_paragraph_line(paragraph_index)
+            elif key == "KEY_RESIZE":
+                screen.resize()
+
+            if width != get_width():
+                # Only the chapter being read is wrapped again, starting at the paragraph that was at the top
+                paragraph_index = book.get_wrapped(chapter_index, width).get_paragraph(start_line_index)
+                width = get_width()
+                start_line_index = book.get_wrapped(chapter_index, width).get_paragraph_line(paragraph_index)
+
+            render_chapter(screen, book, start_line_index, chapter_index)
+        book.set_position(chapter_index, start_line_index)
 
     curses.nocbreak()
     window.keypad(False)
@@ -136,36 +141,74 @@ def main_window(window: curses.window, filename: str) -> None:
     curses.endwin()
 
 
-def render_chapter(window: curses.window, content: list[tuple[str, list[str]]], start_line_index: int, chapter_index: int) -> None:
+def render_chapter(screen: Screen, book: Book, start_line_index: int, chapter_index: int) -> None:
     """Renders the chapter's lines starting at start_line_index and ending when reaching curses.LINES and renders the chapter's title"""
 
-    title = content[chapter_index][0]
-    chapter_tracker = f" ({chapter_index+1}/{len(content)})"
+    title = book.titles[chapter_index]
+    chapter_tracker = f" ({chapter_index+1}/{len(book)})"
     if len(title) + len(chapter_tracker) >= curses.COLS:
         title = title[:curses.COLS-len(chapter_tracker)-3] + "..."
-    window.addstr(0, 0, title + chapter_tracker)
-    y = 1
-    for line in content[chapter_index][1][start_line_index: start_line_index + curses.LINES - 1]:
-        window.addstr(y, 0, line)
-        y += 1
+    rows = [(title + chapter_tracker, curses.A_NORMAL)]
+    for line in book.get_wrapped(chapter_index, get_width()).get_lines(start_line_index, curses.LINES - 1):
+        rows.append((line, curses.A_NORMAL))
+    screen.draw(rows)
+    book.prefetch(chapter_index)
+
+
+def search_book(screen: Screen, book: Book, search_index: SearchIndex) -> tuple[int, int] | None:
+    """Manages searching the book and choosing a hit, returns the chosen hit's chapter and paragraph index"""
+
+    if not (query := prompt(screen, "/")):
+        return None
 
+    if search_index.map is None and not search_index.load():
+        search_index.build(book, lambda i: i % 100 == 0 and screen.draw_row(curses.LINES - 1, f"Indexing {i}/{len(book)} chapters, this is only done once..."))
 
-def manage_toc(window: curses.window, content: list[tuple[str, list[str]]], chapter_index: int) -> int | None:
+    if not (hits := search_index.search(query)):
+        screen.draw_row(curses.LINES - 1, f"No hits for {query}.")
+        screen.window.getkey()
+        return None
+    if (hit_index := manage_toc(screen, SearchResults(book, hits), 0)) is None:
+        return None
+    return hits[hit_index]
+
+
+def prompt(screen: Screen, text: str) -> str:
+    """Asks for an answer on the last row, returns "" if escape is pressed"""
+
+    answer = ""
+    while True:
+        screen.draw_row(curses.LINES - 1, text + answer)
+        key = screen.window.get_wch()
+        if key == "\n":
+            return answer
+        if key == "\x1b":
+            return ""
+        if key in (curses.KEY_BACKSPACE, "\b", "\x7f"):
+            answer = answer[:-1]
+        elif key == curses.KEY_RESIZE:
+            screen.resize()
+        elif isinstance(key, str) and key.isprintable():
+            answer += key
+
+
+def manage_toc(screen: Screen, titles: Sequence[str], chapter_index: int) -> int | None:
     """Manages choosing a chapter in the table of contents"""
 
     new_chapter_index = chapter_index
     y_position = 0 if chapter_index < curses.LINES else chapter_index - curses.LINES + 1
     while True:
-        window.clear()
-        render_toc(window, content, new_chapter_index, y_position)
-        key = window.getkey()
+        render_toc(screen, titles, new_chapter_index, y_position)
+        key = screen.window.getkey()
         if key == "q":
             return None
+        if key == "KEY_RESIZE":
+            screen.resize()
         if (key == "KEY_UP" or key == "w") and new_chapter_index > 0:
             new_chapter_index -= 1
             if new_chapter_index > curses.LINES - 2:
                 y_position -= 1
-        elif (key == "KEY_DOWN" or key == "s") and new_chapter_index < len(content) - 1:
+        elif (key == "KEY_DOWN" or key == "s") and new_chapter_index < len(titles) - 1:
             new_chapter_index += 1
             if new_chapter_index >= curses.LINES:
                 y_position += 1
@@ -173,13 +216,15 @@ def manage_toc(window: curses.window, content: list[tuple[str, list[str]]], chap
             return new_chapter_index
 
 
-def render_toc(window: curses.window, content: list[tuple[str, list[str]]], chapter_index: int, y_position: int) -> None:
+def render_toc(screen: Screen, titles: Sequence[str], chapter_index: int, y_position: int) -> None:
     """Renders the table of contents and returns the chosen chapter's index"""
 
+    rows = []
     y = 0
-    for title, _ in content[y_position:y_position + curses.LINES]:
+    for title in titles[y_position:y_position + curses.LINES]:
         if y_position + y == chapter_index:
-            window.addstr(y, 0, title, curses.A_BOLD)
+            rows.append((title, curses.A_BOLD))
         else:
-            window.addstr(y, 0, title)
+            rows.append((title, curses.A_NORMAL))
         y += 1
+    screen.draw(rows)
@@ -0,0 +1,161 @@
+import hashlib
+import mmap
+import os
+import struct
+
+from src.cache import get_cache_dir
+
+
+class ReaderIndex:
+    """Reader Index
+
+        Remembers what the read command found out about an epub file so opening it again does not
+        parse it again.
+
+        The index is stored in the reader directory of the cache under the sha256 of the epub's absolute
+        path and is only used while the epub's mtime and size are the same as when it was made. It stores
+        each chapter's title, where its member starts in the zip and the byte offsets of each paragraph
+        in the decompressed member, as well as the chapter and line the reader was last at.
+
+        The file is memory-mapped and a chapter's paragraphs are only read from it when the chapter is
+        loaded, so opening a book with thousands of chapters only decodes the titles.
+
+        Layout (little endian):
+            header: magic, mtime_ns, size, number of chapters, last chapter, last line
+            chapters: header offset, compressed size, compress type, title offset, title length,
+                paragraphs offset, number of paragraphs (NO_PARAGRAPHS if the chapter was never loaded)
+            paragraphs: start and end of each paragraph
+            titles: every title encoded as utf-8
+    """
+
+    MAGIC = b"N2EIDX01"
+    HEADER = struct.Struct("<8sqqIII")
+    CHAPTER = struct.Struct("<QIIIIII")
+    PARAGRAPH = struct.Struct("<II")
+    NO_PARAGRAPHS = 0xFFFFFFFF
+
+
+    def __init__(self, filename: str, index_dir: str | None = None) -> None:
+        """Constructor
+
+            filename: the path to the epub file
+            index_dir: where indexes are stored, defaults to the reader directory in get_cache_dir()
+        """
+
+        stat = os.stat(filename)
+        self.mtime_ns = stat.st_mtime_ns
+        self.size = stat.st_size
+        self.index_dir = index_dir or os.path.join(get_cache_dir(), "reader")
+        self.path = os.path.join(self.index_dir, hashlib.sha256(os.path.abspath(filename).encode()).hexdigest() + ".idx")
+
+        self.titles = []
+        self.members = [] # (header offset, compressed size, compress type) of each chapter
+        self.paragraphs = {} # Paragraphs found since the index was loaded
+        self.chapter = 0
+        self.line = 0
+
+        self.file = None
+        self.map = None
+
+
+    def load(self) -> bool:
+        """Load the index if there is one for the epub as it is now
+
+            returns False if the epub has to be indexed again
+        """
+
+        try:
+            self.file = open(self.path, "rb")
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, mtime_ns, size, count, chapter, line = self.HEADER.unpack_from(self.map)
+            if magic != self.MAGIC or mtime_ns != self.mtime_ns or size != self.size:
+                raise ValueError(f"{self.path} is not an index of the epub as it is now.")
+
+            titles = []
+            members = []
+            for i in range(count):
+                header_offset, compress_size, compress_type, title_offset, title_length, _, _ = self.CHAPTER.unpack_from(self.map, self.HEADER.size + i * self.CHAPTER.size)
+                titles.append(self.map[title_offset:title_offset + title_length].decode())
+                members.append((header_offset, compress_size, compress_type))
+        except (OSError, ValueError, struct.error):
+            self.close()
+            return False
+
+        self.titles, self.members = titles, members
+        self.chapter, self.line = chapter, line
+        return True
+
+
+    def load_position(self) -> tuple[int, int] | None:
+        """Get the chapter and line the reader was last at by only reading the header of the index
+
+            returns None if there is no index of the epub as it is now
+        """
+
+        try:
+            with open(self.path, "rb") as f:
+                magic, mtime_ns, size, _, chapter, line = self.HEADER.unpack(f.read(self.HEADER.size))
+        except (OSError, struct.error):
+            return None
+        if magic != self.MAGIC or mtime_ns != self.mtime_ns or size != self.size:
+            return None
+        return (chapter, line)
+
+
+    def get_paragraphs(self, chapter_index: int) -> list[tuple[int, int]] | None:
+        """Get the start and end of each paragraph in a chapter if the chapter was indexed"""
+
+        if chapter_index in self.paragraphs:
+            return self.paragraphs[chapter_index]
+        if self.map is None:
+            return None
+
+        *_, paragraphs_offset, paragraph_count = self.CHAPTER.unpack_from(self.map, self.HEADER.size + chapter_index * self.CHAPTER.size)
+        if paragraph_count == self.NO_PARAGRAPHS:
+            return None
+        return list(self.PARAGRAPH.iter_unpack(self.map[paragraphs_offset:paragraphs_offset + paragraph_count * self.PARAGRAPH.size]))
+
+
+    def set_paragraphs(self, chapter_index: int, paragraphs: list[tuple[int, int]]) -> None:
+        """Set the start and end of each paragraph in a chapter"""
+
+        self.paragraphs[chapter_index] = paragraphs
+
+
+    def write(self) -> None:
+        """Write the index with everything that was found out since it was loaded"""
+
+        all_paragraphs = [self.get_paragraphs(i) for i in range(len(self.titles))]
+        titles = [title.encode() for title in self.titles]
+
+        paragraphs_offset = self.HEADER.size + len(titles) * self.CHAPTER.size
+        titles_offset = paragraphs_offset + sum(len(paragraphs) for paragraphs in all_paragraphs if paragraphs is not None) * self.PARAGRAPH.size
+
+        data = bytearray(self.HEADER.pack(self.MAGIC, self.mtime_ns, self.size, len(titles), self.chapter, self.line))
+        for (header_offset, compress_size, compress_type), title, paragraphs in zip(self.members, titles, all_paragraphs):
+            paragraph_count = self.NO_PARAGRAPHS if paragraphs is None else len(paragraphs)
+            data += self.CHAPTER.pack(header_offset, compress_size, compress_type, titles_offset, len(title), paragraphs_offset, paragraph_count)
+            paragraphs_offset += 0 if paragraphs is None else len(paragraphs) * self.PARAGRAPH.size
+            titles_offset += len(title)
+        for paragraphs in all_paragraphs:
+            for paragraph in paragraphs or []:
+                data += self.PARAGRAPH.pack(*paragraph)
+        for title in titles:
+            data += title
+
+        self.close() # The index cannot be replaced while it is mapped on windows
+        os.makedirs(self.index_dir, exist_ok=True)
+        with open(self.path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(self.path + ".tmp", self.path)
+
+
+    def close(self) -> None:
+        """Unmap and close the index"""
+
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
@@ -0,0 +1,96 @@
+import curses
+
+
+class Screen:
+    """Screen
+
+        Draws rows of text on a curses window, only writing the rows that changed since the last draw.
+
+        When every row below the first moved up or down by one (scrolling a line in a chapter or the
+        table of contents) the window is scrolled in a scroll region instead, so the terminal only
+        receives the one new row. Changes are staged with noutrefresh and sent with a single doupdate.
+    """
+
+
+    def __init__(self, window: curses.window) -> None:
+        """Constructor
+
+            window: the window to draw on
+        """
+
+        self.window = window
+        self.window.idlok(True)
+        self.window.scrollok(True)
+        self.rows = [] # The text and attribute of each row on the screen, None if it is not known
+
+
+    def draw(self, rows: list[tuple[str, int]]) -> None:
+        """Draw rows of (text, attribute), the rows after the last one are left empty"""
+
+        width = curses.COLS - 1 # curses cannot write to the bottom right corner
+        rows = [(text[:width], attribute) for text, attribute in rows[:curses.LINES]]
+        rows += [("", 0)] * (curses.LINES - len(rows))
+        if len(self.rows) != curses.LINES:
+            self.rows = [None] * curses.LINES
+
+        for shift in (1, -1):
+            if self.can_scroll(rows, shift):
+                self.scroll(shift)
+                break
+
+        self.draw_rows({y: row for y, row in enumerate(rows) if row != self.rows[y]})
+        self.window.noutrefresh()
+        curses.doupdate()
+
+
+    def draw_row(self, y: int, text: str, attribute: int = curses.A_NORMAL) -> None:
+        """Draw one row of text and leave every other row as it is"""
+
+        if len(self.rows) != curses.LINES:
+            self.rows = [None] * curses.LINES
+        self.draw_rows({y: (text[:curses.COLS - 1], attribute)})
+        self.window.noutrefresh()
+        curses.doupdate()
+
+
+    def draw_rows(self, rows: dict[int, tuple[str, int]]) -> None:
+        """Write rows of (text, attribute) by their y to the window without updating the terminal"""
+
+        for y, row in rows.items():
+            self.window.move(y, 0)
+            self.window.clrtoeol()
+            if row[0]:
+                self.window.addstr(y, 0, *row)
+            self.rows[y] = row
+
+
+    def can_scroll(self, rows: list[tuple[str, int]], shift: int) -> bool:
+        """Check if the rows below the first are the rows on the screen moved up (shift 1) or down (shift -1)"""
+
+        old_rows = self.rows[1:]
+        new_rows = rows[1:]
+        if len(new_rows) < 3 or new_rows == old_rows:
+            return False
+        if shift > 0:
+            return new_rows[:-shift] == old_rows[shift:]
+        return new_rows[-shift:] == old_rows[:shift]
+
+
+    def scroll(self, shift: int) -> None:
+        """Scroll the rows below the first up (shift 1) or down (shift -1)"""
+
+        self.window.setscrreg(1, curses.LINES - 1)
+        self.window.scroll(shift)
+        self.window.setscrreg(0, curses.LINES - 1)
+        if shift > 0:
+            self.rows[1:] = self.rows[1 + shift:] + [None] * shift
+        else:
+            self.rows[1:] = [None] * -shift + self.rows[1:shift]
+
+
+    def resize(self) -> None:
+        """Update the size of the screen after the terminal was resized and draw everything again next time"""
+
+        curses.update_lines_cols()
+        self.window.clear()
+        self.rows = []
@@ -0,0 +1,40 @@
+import os
+import click
+
+from src.book import Book
+from src.search_index import SearchIndex
+
+
+@click.command()
+@click.help_option("-h", "--help")
+@click.argument("filename")
+@click.argument("query")
+@click.option("-l", "--limit", "limit", default=20, type=click.IntRange(0, clamp=True), show_default=True, help="Max number of hits to show (0 to show every hit).", metavar="HITS")
+def search(filename: str, query: str, limit: int) -> None:
+    """Search a novel for paragraphs with every word in a query
+
+        FILENAME: the epub file to search.
+
+        QUERY: the words to search for, case does not matter.
+
+        The first search of a novel indexes every word in it, which is kept in the cache
+        so every search after it is instant. The index is made again when the epub changes.
+    """
+
+    try:
+        if not os.path.exists(filename) or not filename.endswith(".epub"):
+            raise Exception(f"File {filename} either does not exist or is not an epub file.")
+
+        with Book(filename) as book, SearchIndex(filename) as index:
+            if not index.load():
+                with click.progressbar(length=len(book), label=f"Indexing {filename}", file=click.get_text_stream("stderr")) as bar:
+                    index.build(book, lambda _: bar.update(1))
+
+            hits = index.search(query)
+            for chapter_index, paragraph_index in hits[:limit or len(hits)]:
+                click.echo(f"{book.titles[chapter_index]} (chapter {chapter_index + 1}, paragraph {paragraph_index + 1}): {book.get_text(chapter_index)[paragraph_index]}")
+            if limit and len(hits) > limit:
+                click.echo(f"... {len(hits) - limit} more hits, use --limit 0 to show them.")
+            click.echo(f"\n{len(hits)} hits for \"{query}\" in {filename}.")
+    except Exception as e:
+        click.echo(f"Error occurred while searching:\n\t{e}", err=True)
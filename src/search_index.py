@@ -0,0 +1,211 @@
+import array
+import bisect
+import collections.abc
+import hashlib
+import mmap
+import os
+import re
+import struct
+import sys
+from typing import Callable
+
+from src.book import Book
+from src.cache import get_cache_dir
+
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def get_words(text: str) -> set[str]:
+    """Get the lowercase words in a text"""
+
+    return set(WORD_PATTERN.findall(text.lower()))
+
+
+class SearchIndex:
+    """Search Index
+
+        An inverted index of every word in an epub file to the paragraphs it is in, so searching a novel
+        does not decompress and scan each chapter.
+
+        The index is made once by reading every chapter and is stored in the search directory of the cache
+        under the sha256 of the epub's absolute path. Like the ReaderIndex it is only used while the epub's
+        mtime and size are the same as when it was made. The file is memory-mapped and the word table is
+        binary searched, so only the postings of the words searched for are ever read.
+
+        Layout (little endian):
+            header: magic, mtime_ns, size, number of words
+            words: word offset, word length, postings offset, number of postings, sorted by word
+            postings: chapter << 32 | paragraph of each paragraph a word is in, sorted
+            words: every word encoded as utf-8
+    """
+
+    MAGIC = b"N2ESRC01"
+    HEADER = struct.Struct("<8sqqI")
+    WORD = struct.Struct("<IIII")
+
+
+    def __init__(self, filename: str, index_dir: str | None = None) -> None:
+        """Constructor
+
+            filename: the path to the epub file
+            index_dir: where indexes are stored, defaults to the search directory in get_cache_dir()
+        """
+
+        stat = os.stat(filename)
+        self.mtime_ns = stat.st_mtime_ns
+        self.size = stat.st_size
+        self.index_dir = index_dir or os.path.join(get_cache_dir(), "search")
+        self.path = os.path.join(self.index_dir, hashlib.sha256(os.path.abspath(filename).encode()).hexdigest() + ".idx")
+
+        self.word_count = 0
+        self.file = None
+        self.map = None
+
+
+    def __enter__(self) -> "SearchIndex":
+        return self
+
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+
+    def load(self) -> bool:
+        """Load the index if there is one for the epub as it is now
+
+            returns False if the epub has to be indexed again
+        """
+
+        try:
+            self.file = open(self.path, "rb")
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, mtime_ns, size, self.word_count = self.HEADER.unpack_from(self.map)
+            if magic != self.MAGIC or mtime_ns != self.mtime_ns or size != self.size:
+                raise ValueError(f"{self.path} is not an index of the epub as it is now.")
+        except (OSError, ValueError, struct.error):
+            self.close()
+            return False
+        return True
+
+
+    def build(self, book: Book, on_chapter: Callable[[int], None] | None = None) -> None:
+        """Index every chapter of a book, write the index and load it
+
+            book: the book of the epub file
+            on_chapter: called with the index of each chapter after it is indexed
+        """
+
+        postings = collections.defaultdict(lambda: array.array("Q"))
+        for chapter_index in range(len(book)):
+            for paragraph_index, text in enumerate(book.read_text(chapter_index)):
+                for word in get_words(text):
+                    postings[word].append(chapter_index << 32 | paragraph_index)
+            if on_chapter is not None:
+                on_chapter(chapter_index)
+
+        words = sorted(postings)
+        encoded_words = [word.encode() for word in words]
+        postings_offset = self.HEADER.size + len(words) * self.WORD.size
+        words_offset = postings_offset + sum(len(word_postings) for word_postings in postings.values()) * 8
+
+        self.close()
+        os.makedirs(self.index_dir, exist_ok=True)
+        with open(self.path + ".tmp", "wb") as f:
+            f.write(self.HEADER.pack(self.MAGIC, self.mtime_ns, self.size, len(words)))
+            for word, encoded_word in zip(words, encoded_words):
+                f.write(self.WORD.pack(words_offset, len(encoded_word), postings_offset, len(postings[word])))
+                words_offset += len(encoded_word)
+                postings_offset += len(postings[word]) * 8
+            for word in words:
+                if sys.byteorder == "big":
+                    postings[word].byteswap()
+                postings[word].tofile(f)
+            for encoded_word in encoded_words:
+                f.write(encoded_word)
+        os.replace(self.path + ".tmp", self.path)
+
+        if not self.load():
+            raise Exception(f"Could not load the search index at {self.path}.")
+
+
+    def get_word(self, word_index: int) -> bytes:
+        """Get a word in the word table"""
+
+        word_offset, word_length, _, _ = self.WORD.unpack_from(self.map, self.HEADER.size + word_index * self.WORD.size)
+        return self.map[word_offset:word_offset + word_length]
+
+
+    def get_postings(self, word: str) -> array.array:
+        """Get the sorted chapter << 32 | paragraph of every paragraph a word is in"""
+
+        encoded_word = word.encode()
+        low, high = 0, self.word_count
+        while low < high:
+            middle = (low + high) // 2
+            if self.get_word(middle) < encoded_word:
+                low = middle + 1
+            else:
+                high = middle
+        if low == self.word_count or self.get_word(low) != encoded_word:
+            return array.array("Q")
+
+        _, _, postings_offset, posting_count = self.WORD.unpack_from(self.map, self.HEADER.size + low * self.WORD.size)
+        postings = array.array("Q", self.map[postings_offset:postings_offset + posting_count * 8])
+        if sys.byteorder == "big":
+            postings.byteswap()
+        return postings
+
+
+    def search(self, query: str) -> list[tuple[int, int]]:
+        """Get the chapter and paragraph index of every paragraph with every word in the query, in order"""
+
+        # Only the paragraphs of the rarest word are checked against the postings of the other words
+        all_postings = sorted((self.get_postings(word) for word in get_words(query)), key=len)
+        if not all_postings:
+            return []
+        hits = all_postings[0]
+        for postings in all_postings[1:]:
+            hits = [hit for hit in hits if (i := bisect.bisect_left(postings, hit)) < len(postings) and postings[i] == hit]
+        return [(hit >> 32, hit & 0xFFFFFFFF) for hit in hits]
+
+
+    def close(self) -> None:
+        """Unmap and close the index"""
+
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class SearchResults(collections.abc.Sequence):
+    """Search Results
+
+        The description of each hit of a search, a hit's chapter is only read when its description is used
+        so a search with thousands of hits can be scrolled through without reading every chapter.
+    """
+
+
+    def __init__(self, book: Book, hits: list[tuple[int, int]]) -> None:
+        """Constructor
+
+            book: the book that was searched
+            hits: the chapter and paragraph index of each hit
+        """
+
+        self.book = book
+        self.hits = hits
+
+
+    def __len__(self) -> int:
+        return len(self.hits)
+
+
+    def __getitem__(self, index: int | slice) -> str | list[str]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        chapter_index, paragraph_index = self.hits[index]
+        return f"{self.book.titles[chapter_index]}: {self.book.get_text(chapter_index)[paragraph_index]}"
@@ -0,0 +1,156 @@
+import collections
+import contextlib
+import json
+import threading
+import time
+from typing import Iterator, TextIO
+
+
+class DownloadStats:
+    """Download Stats
+
+        Times where a download spends its time and records how each chapter went, to find slow
+        providers and tune the number of workers and the rate.
+
+        Stages are timed by every thread that runs them so a stage like request adds up the time of
+        every request in flight, the stages are:
+            homepage, chapter list, cover: the requests sent once per download
+            rate limit: waiting on the rate limiter before each request
+            request: sending a request and reading its response
+            retry wait: waiting before a failed request is sent again
+            parse: getting the title and text out of a chapter
+            build: making the page of a chapter
+            cache: reading and writing chapters in the chapter cache
+            image, resize: downloading each image in chapters and scaling it down, in the threads of the image store
+            image wait: a chapter waiting for its images before it is written
+            write: writing the epub file
+
+        With a trace file every timed stage and every chapter is written to it as a line of json as soon as it happens.
+    """
+
+    trace_lock = threading.Lock() # Shared by every download so novels of a batch can write to one trace file
+
+
+    def __init__(self, novel_url: str, trace: TextIO | None = None) -> None:
+        """Constructor
+
+            novel_url: the url to the homepage of the novel
+            trace: file every event is written to as a line of json, None to only keep the totals
+        """
+
+        self.novel_url = novel_url
+        self.trace = trace
+        self.start_time = time.perf_counter()
+        self.lock = threading.Lock()
+        self.stages = {} # stage: (count, total seconds, max seconds)
+        self.statuses = collections.Counter() # The status of every response to a chapter request
+        self.chapters = collections.Counter() # The number of chapters downloaded, cached and failed
+        self.retries = 0
+        self.size = 0 # Number of bytes in the chapters downloaded
+        self.latencies = [] # (seconds, attempts, url) of each chapter downloaded
+        self.failed = [] # Url of each chapter that failed to download
+
+
+    @contextlib.contextmanager
+    def time(self, stage: str, chapter_url: str | None = None) -> Iterator[dict]:
+        """Time a stage
+
+            stage: the name of the stage
+            chapter_url: the url of the chapter the stage is for, None if it is not for one
+
+            yields a dict, a "status" set in it is added as the status of a response to a chapter request
+        """
+
+        result = {}
+        start = time.perf_counter()
+        try:
+            yield result
+        finally:
+            self.add_stage(stage, time.perf_counter() - start, chapter_url, result.get("status"))
+
+
+    def add_stage(self, stage: str, seconds: float, chapter_url: str | None = None, status: int | str | None = None) -> None:
+        """Add the time a stage took
+
+            stage: the name of the stage
+            seconds: the number of seconds it took
+            chapter_url: the url of the chapter the stage is for, None if it is not for one
+            status: the status of the response to a chapter request, None if the stage did not get one
+        """
+
+        with self.lock:
+            count, total, longest = self.stages.get(stage, (0, 0.0, 0.0))
+            self.stages[stage] = (count + 1, total + seconds, max(longest, seconds))
+            if status is not None:
+                self.statuses[status] += 1
+        event = {"event": "stage", "stage": stage, "chapter": chapter_url, "seconds": seconds}
+        if status is not None:
+            event["status"] = status
+        self.write_event(event)
+
+
+    def add_chapter(self, chapter_url: str, status: str, attempts: int = 0, seconds: float = 0.0, size: int = 0) -> None:
+        """Add how a chapter went
+
+            chapter_url: the url of the chapter
+            status: "downloaded", "cached" or "failed"
+            attempts: number of requests sent for the chapter
+            seconds: number of seconds from waiting on the rate limiter for the first request to the last response
+            size: number of bytes in the chapter's response
+        """
+
+        with self.lock:
+            self.chapters[status] += 1
+            self.retries += max(attempts - 1, 0)
+            self.size += size
+            if status == "downloaded":
+                self.latencies.append((seconds, attempts, chapter_url))
+            elif status == "failed":
+                self.failed.append(chapter_url)
+        self.write_event({"event": "chapter", "chapter": chapter_url, "status": status, "attempts": attempts, "retries": max(attempts - 1, 0), "seconds": seconds, "bytes": size})
+
+
+    def write_event(self, event: dict) -> None:
+        """Write an event to the trace file if there is one"""
+
+        if self.trace is None:
+            return
+        line = json.dumps({"time": round(time.perf_counter() - self.start_time, 6), "novel": self.novel_url, **event})
+        with self.trace_lock:
+            self.trace.write(line + "\n")
+
+
+    def get_summary(self) -> str:
+        """Get a table of the time spent in each stage and a summary of the chapters"""
+
+        seconds = time.perf_counter() - self.start_time
+        with self.lock:
+            stages = dict(self.stages)
+            latencies = sorted(self.latencies)
+            statuses = dict(self.statuses)
+            chapters = dict(self.chapters)
+
+        lines = [
+            f"Stats of {self.novel_url} after {seconds:.1f} seconds:",
+            f"\t{"stage":<14} {"count":>7} {"total s":>9} {"mean ms":>9} {"max ms":>9}",
+        ]
+        for stage, (count, total, longest) in stages.items():
+            lines.append(f"\t{stage:<14} {count:>7} {total:>9.2f} {total / count * 1000:>9.1f} {longest * 1000:>9.1f}")
+
+        lines.append(
+            f"\tChapters: {chapters.get("downloaded", 0)} downloaded ({self.size / 1024 / 1024:.1f} MB), "
+            f"{chapters.get("cached", 0)} from the cache, {chapters.get("failed", 0)} failed, {self.retries} retries"
+        )
+        if statuses:
+            lines.append(f"\tResponses: {", ".join(f"{status}: {count}" for status, count in sorted(statuses.items(), key=lambda item: str(item[0])))}")
+        if latencies:
+            p50 = latencies[(len(latencies) - 1) // 2][0]
+            p99 = latencies[-(-len(latencies) * 99 // 100) - 1][0]
+            lines.append(f"\tChapter latency: p50 {p50 * 1000:.0f} ms, p99 {p99 * 1000:.0f} ms, max {latencies[-1][0] * 1000:.0f} ms")
+        if "request" in stages and seconds:
+            lines.append(f"\tRequests in flight on average: {stages["request"][1] / seconds:.1f}")
+        if latencies:
+            lines.append("\tSlowest chapters:")
+            for chapter_seconds, attempts, chapter_url in latencies[:-6:-1]:
+                lines.append(f"\t\t{chapter_seconds:.2f} seconds ({attempts} {"attempt" if attempts == 1 else "attempts"}): {chapter_url}")
+        return "\n".join(lines)
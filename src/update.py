@@ -0,0 +1,106 @@
+import itertools
+import os
+import click
+
+from src import constants
+from src.cache import ChapterCache
+from src.chapter_urls import ChapterUrls
+from src.download import get_downloader
+
+
+@click.command()
+@click.help_option("-h", "--help")
+@click.argument("filename")
+@click.option("-u", "--url", "url", default=None, type=click.STRING, help="Url to the homepage of the series if the epub does not have one.", metavar="URL")
+@click.option("-p", "--provider", "provider", is_flag=False, flag_value="", type=click.STRING, default=None, help="Name of the provider (website) of the novel.", metavar="PROVIDER")
+@click.option("-e", "--engine", "engine", default="threaded", type=click.Choice(["sync", "threaded", "async", "pipeline"]), show_default=True, help="How chapters are downloaded.")
+@click.option("-w", "--wait", "wait_time", default=3, type=click.IntRange(0, clamp=True), show_default=True, help="Time between each chapter to start at in sync.", metavar="TIME")
+@click.option("-v", "--verbose", "verbose", is_flag=True, default=False, help="Output extra information.")
+@click.option("-m", "--max-workers", "max_workers", default=10, type=click.IntRange(1, clamp=True), show_default=True, help="Max number of chapters downloading at once in threaded, async and pipeline.", metavar="WORKERS")
+@click.option("-P", "--processes", "processes", default=0, type=click.IntRange(0, clamp=True), show_default=True, help="Number of processes parsing chapters in pipeline (0 for one per cpu).", metavar="PROCESSES")
+@click.option("-r", "--rate", "rate", default=4.0, type=click.FloatRange(0, clamp=True), show_default=True, help="Requests per second to start at in threaded, async and pipeline (0 for no limit).", metavar="RATE")
+@click.option("-R", "--max-rate", "max_rate", default=20.0, type=click.FloatRange(0, clamp=True), show_default=True, help="Highest requests per second the rate adapts to (0 to never change the rate).", metavar="RATE")
+@click.option("-c", "--cache-size", "cache_size", default=500, type=click.IntRange(0, clamp=True), show_default=True, help="Max size of the chapter cache and of the http cache in MB (0 to not cache anything).", metavar="MB")
+@click.option("-t", "--ttl", "ttl", default=0, type=click.IntRange(0, clamp=True), show_default=True, help="Seconds the homepage, chapter list and cover are used from the http cache without asking the provider if they changed.", metavar="SECONDS")
+@click.option("--images/--no-images", "images", default=True, show_default=True, help="Put the images in chapters into the epub.")
+@click.option("-i", "--image-size", "image_size", default=0, type=click.IntRange(0, clamp=True), show_default=True, help="Max pixels of the longest side of the cover and images, bigger ones are scaled down (0 to keep their size, needs Pillow).", metavar="PIXELS")
+@click.option("-q", "--image-quality", "image_quality", default=0, type=click.IntRange(0, 95, clamp=True), show_default=True, help="Jpeg quality the cover and images are saved again at (0 for 85 with --image-size and to keep them otherwise, needs Pillow).", metavar="QUALITY")
+@click.option("-z", "--compression", "compression", default="normal", type=click.Choice(["store", "fast", "normal", "max"]), show_default=True, help="How much chapters are compressed, store writes the epub the fastest and max makes it the smallest.")
+@click.option("--stats", "stats", is_flag=True, default=False, help="Show how long each stage of the download took and how each chapter went.")
+@click.option("-T", "--trace", "trace", default=None, type=click.File("w"), help="Write every timed stage and chapter to a file as json lines.", metavar="FILE")
+def update(filename: str, url: str | None, provider: str | None, engine: str, wait_time: int, verbose: bool, max_workers: int, processes: int, rate: float, max_rate: float, cache_size: int, ttl: int, images: bool, image_size: int, image_quality: int, compression: str, stats: bool, trace: click.File | None) -> None:
+    """Adds new chapters to an epub file downloaded with the download command
+
+        FILENAME: the epub file to update.
+
+        The url of each chapter in the epub is compared to the chapters of the series and only
+        the new ones are downloaded and added to the end. The chapters already in the epub are
+        copied as they are.
+
+        Epub files downloaded before update was added do not know where they were downloaded
+        from so --url has to be given. Epub files that do not know the url of each chapter are
+        compared by their number of chapters instead.
+
+        The rest of the options are the same as in the download command.
+    """
+
+    # Imported here so other commands do not import ebooklib, lxml and requests
+    from src.epub_updater import EpubUpdater
+    from src.http_cache import HttpCache
+    from src.images import ImageStore
+
+    downloader = None
+    try:
+        if not os.path.exists(filename) or not filename.endswith(".epub"):
+            raise Exception(f"File {filename} either does not exist or is not an epub file.")
+
+        updater = EpubUpdater(filename)
+        url = url or updater.get_source_url()
+        if url is None:
+            raise Exception(f"{filename} does not have the url of the series, use --url to give it.")
+
+        downloader = get_downloader(url, provider)(url)
+        downloader.stats.trace = trace
+        if cache_size:
+            downloader.http_cache = HttpCache(cache_size * 1024 * 1024, ttl)
+        with downloader.stats.time("homepage"):
+            home_page_response = downloader.fetch(url)
+        chapter_count = updater.get_chapter_count()
+        chapter_urls = updater.get_chapter_urls()
+        if chapter_urls is None:
+            urls = ChapterUrls(itertools.islice(downloader.iter_chapter_urls(home_page_response), chapter_count, None))
+        else:
+            known_urls = set(chapter_urls)
+            urls = ChapterUrls(chapter_url for chapter_url in downloader.iter_chapter_urls(home_page_response) if chapter_url not in known_urls)
+        if urls.get(0) is None:
+            click.echo(f"{filename} is already up to date ({chapter_count} chapters).")
+            return
+
+        if cache_size:
+            downloader.cache = ChapterCache(updater.get_title(), cache_size * 1024 * 1024)
+        downloader.images = ImageStore(downloader.fetch_image, image_size, image_quality, images, downloader.stats.add_stage)
+        chapters = {}
+        if not downloader.get_chapter_pages(urls, chapters.__setitem__, engine, wait_time, verbose, max_workers, rate, max_rate, chapter_count + 1, processes):
+            return
+
+        for i in range(len(urls)):
+            # The images kept downloading with the chapters so this only waits for the last ones
+            chapters[i].content = downloader.images.localize(chapters[i].content, urls.get(i))
+            updater.add_chapter(chapters[i], urls.get(i))
+        for file_name in downloader.images.file_names:
+            updater.add_image(file_name, downloader.images.read(file_name))
+        updater.set_source_url(url)
+        with downloader.stats.time("write"):
+            updater.write(compression)
+        downloader.echo_images()
+        click.echo(updater.get_summary())
+        click.echo(f"\nAdded {len(chapters)} chapters to {filename}.")
+    except constants.ProgError as e:
+        raise Exception(e)
+    except Exception as e:
+        click.echo(f"Error occurred while updating:\n\t{e}", err=True)
+    finally:
+        if downloader is not None and downloader.images is not None:
+            downloader.images.close()
+        if stats and downloader is not None:
+            click.echo(f"\n{downloader.stats.get_summary()}")
@@ -0,0 +1,182 @@
+import os
+import socket
+import time
+from typing import TYPE_CHECKING
+import click
+
+from src import constants
+from src.cache import ChapterCache
+from src.download import get_downloader
+from src.job_queue import Job, JobQueue
+
+if TYPE_CHECKING: # Importing a Downloader imports cloudscraper, requests and ebooklib so it is only done once a job needs one
+    from ebooklib import epub
+    from src.downloader import Downloader
+
+
+@click.command()
+@click.help_option("-h", "--help")
+@click.option("-d", "--database", "database", default=None, type=click.Path(dir_okay=False), help="Path to the queue's database, on a shared drive for workers on other computers.  [default: n2epub_queue.sqlite3 next to the executable]", metavar="FILE")
+@click.option("-e", "--engine", "engine", default="threaded", type=click.Choice(["sync", "threaded", "async", "pipeline"]), show_default=True, help="How chapters are downloaded.")
+@click.option("-w", "--wait", "wait_time", default=3, type=click.IntRange(0, clamp=True), show_default=True, help="Time between each chapter to start at in sync.", metavar="TIME")
+@click.option("-v", "--verbose", "verbose", is_flag=True, default=False, help="Output extra information.")
+@click.option("-m", "--max-workers", "max_workers", default=10, type=click.IntRange(1, clamp=True), show_default=True, help="Max number of chapters downloading at once in threaded, async and pipeline.", metavar="WORKERS")
+@click.option("-P", "--processes", "processes", default=0, type=click.IntRange(0, clamp=True), show_default=True, help="Number of processes parsing chapters in pipeline (0 for one per cpu).", metavar="PROCESSES")
+@click.option("-r", "--rate", "rate", default=4.0, type=click.FloatRange(0, clamp=True), show_default=True, help="Requests per second to start at in threaded, async and pipeline (0 for no limit).", metavar="RATE")
+@click.option("-R", "--max-rate", "max_rate", default=20.0, type=click.FloatRange(0, clamp=True), show_default=True, help="Highest requests per second the rate adapts to (0 to never change the rate).", metavar="RATE")
+@click.option("-c", "--cache-size", "cache_size", default=500, type=click.IntRange(0, clamp=True), show_default=True, help="Max size of the chapter cache in MB (0 to not cache anything).", metavar="MB")
+@click.option("--images/--no-images", "images", default=True, show_default=True, help="Put the images in chapters into the epub.")
+@click.option("-i", "--image-size", "image_size", default=0, type=click.IntRange(0, clamp=True), show_default=True, help="Max pixels of the longest side of the cover and images, bigger ones are scaled down (0 to keep their size, needs Pillow).", metavar="PIXELS")
+@click.option("-q", "--image-quality", "image_quality", default=0, type=click.IntRange(0, 95, clamp=True), show_default=True, help="Jpeg quality the cover and images are saved again at (0 for 85 with --image-size and to keep them otherwise, needs Pillow).", metavar="QUALITY")
+@click.option("-z", "--compression", "compression", default="normal", type=click.Choice(["store", "fast", "normal", "max"]), show_default=True, help="How much chapters are compressed, store writes the epub the fastest and max makes it the smallest.")
+@click.option("-b", "--batch-size", "batch_size", default=50, type=click.IntRange(1, clamp=True), show_default=True, help="Number of chapters claimed at once.", metavar="CHAPTERS")
+@click.option("-l", "--lease", "lease", default=300, type=click.IntRange(10, clamp=True), show_default=True, help="Seconds claimed work belongs to the worker without progress before other workers can claim it.", metavar="SECONDS")
+@click.option("-W", "--watch", "watch", is_flag=True, default=False, help="Keep waiting for new work instead of stopping once the queue is empty.")
+def worker(database: str | None, engine: str, wait_time: int, verbose: bool, max_workers: int, processes: int, rate: float, max_rate: float, cache_size: int, images: bool, image_size: int, image_quality: int, compression: str, batch_size: int, lease: int, watch: bool) -> None:
+    """Downloads the novels added to the queue with the queue command
+
+        Any number of workers can run at once, on this computer or on others that share the
+        queue's database. Each worker claims work for lease seconds: finding the chapters of a
+        novel, downloading batch_size of its chapters or writing its epub once every chapter is
+        done. Work of a worker that stopped or crashed is claimed by another one once its lease
+        runs out, so at most the chapters it was downloading are downloaded again.
+
+        A chapter that fails is tried again later, after 5 failed attempts the novel fails and
+        has to be tried again with queue retry.
+
+        Epub files are written to the directory given to queue add, by default the directory
+        of the worker that writes it. The cover and images are downloaded by the worker that
+        writes the epub.
+
+        The rest of the options are the same as in the download command.
+    """
+
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    downloaders = {} # novel id: Downloader, kept so a novel's session and rate limit are reused by every batch
+    try:
+        with JobQueue(database) as jobs:
+            click.echo(f"Worker {worker_id} is using {jobs.path}.")
+            while True:
+                if (job := jobs.claim(worker_id, batch_size, lease)) is None:
+                    if not watch:
+                        click.echo("\nThe queue is empty.")
+                        return
+                    time.sleep(5)
+                    continue
+
+                novel_id = job.novel["id"]
+                if novel_id not in downloaders:
+                    try:
+                        downloaders[novel_id] = get_downloader(job.novel["url"], job.novel["provider"])(job.novel["url"])
+                    except Exception as e:
+                        jobs.fail_novel(novel_id, str(e))
+                        click.echo(f"Could not download {job.novel["url"]}: {e}", err=True)
+                        continue
+                downloader = downloaders[novel_id]
+                if job.kind == "list":
+                    list_novel(jobs, job, downloader)
+                elif job.kind == "chapters":
+                    download_chapters(jobs, job, downloader, worker_id, lease, engine, wait_time, verbose, max_workers, processes, rate, max_rate, cache_size)
+                else:
+                    assemble_novel(jobs, job, downloader, images, image_size, image_quality, compression)
+                    del downloaders[novel_id]
+    except constants.ProgError as e:
+        raise Exception(e)
+    except Exception as e:
+        click.echo(f"Error occurred in the worker:\n\t{e}", err=True)
+
+
+def list_novel(jobs: JobQueue, job: Job, downloader: "Downloader") -> None:
+    """Find the title, author, cover and chapters of a novel"""
+
+    try:
+        with downloader.stats.time("homepage"):
+            home_page_response = downloader.fetch(job.novel["url"])
+        novel_title = downloader.get_novel_title(home_page_response)
+        urls = list(downloader.iter_chapter_urls(home_page_response))
+        jobs.set_chapters(job.novel["id"], novel_title, downloader.get_novel_author(home_page_response), downloader.get_cover_image_url(home_page_response), urls)
+    except constants.ProgError:
+        raise
+    except Exception as e:
+        jobs.fail_novel(job.novel["id"], str(e))
+        click.echo(f"Could not get the chapters of {job.novel["url"]}: {e}", err=True)
+        return
+    click.echo(f"Found {len(urls)} chapters of {novel_title}.")
+
+
+def download_chapters(jobs: JobQueue, job: Job, downloader: "Downloader", worker_id: str, lease: int, engine: str, wait_time: int, verbose: bool, max_workers: int, processes: int, rate: float, max_rate: float, cache_size: int) -> None:
+    """Download the chapters of a job with the engine and store each one in the queue as soon as it is done"""
+
+    novel_id = job.novel["id"]
+    numbers = [number for number, _ in job.chapters]
+    urls = [url for _, url in job.chapters]
+    if cache_size and downloader.cache is None:
+        downloader.cache = ChapterCache(job.novel["title"], cache_size * 1024 * 1024)
+    if downloader.rate_limiter is None:
+        # Kept between batches so the rate it adapted to is not lost
+        downloader.rate_limiter = downloader.create_rate_limiter(1 / wait_time if engine == "sync" and wait_time else rate, max_rate)
+
+    def on_chapter(index: int, chapter: "epub.EpubHtml") -> None:
+        jobs.complete_chapter(novel_id, numbers[index], chapter.title, chapter.content)
+        jobs.renew(worker_id, lease)
+
+    click.echo(f"Downloading {len(numbers)} chapters of {job.novel["title"]} (chapter {numbers[0]} to {numbers[-1]}).")
+    failed_count = len(downloader.stats.failed)
+    try:
+        downloader.get_chapter_pages(urls, on_chapter, engine, wait_time, verbose, max_workers, rate, max_rate, numbers[0], processes)
+    except constants.ProgError:
+        raise
+    except Exception as e:
+        # Every chapter that is not done is tried again later as if it failed
+        jobs.release_chapters(worker_id, novel_id, {number: str(e) for number in numbers})
+        click.echo(f"Could not download chapters of {job.novel["title"]}: {e}", err=True)
+        return
+    failed_urls = set(downloader.stats.failed[failed_count:])
+    jobs.release_chapters(worker_id, novel_id, {number: "Every attempt to download it failed." for number, url in job.chapters if url in failed_urls})
+
+
+def assemble_novel(jobs: JobQueue, job: Job, downloader: "Downloader", images: bool, image_size: int, image_quality: int, compression: str) -> None:
+    """Write the epub of a novel whose chapters are all done, its cover and images are downloaded while it is written"""
+
+    # Imported here since only the worker that writes the epub needs them
+    from src.epub_writer import StreamingEpubWriter
+    from src.images import ImageStore
+
+    novel_title = job.novel["title"]
+    filename = os.path.join(job.novel["output_dir"] or constants.get_root_dir(), novel_title + ".epub")
+    chapter_count = 0
+    try:
+        if os.path.exists(filename):
+            raise Exception(f"{filename} already exists.")
+        downloader.images = ImageStore(downloader.fetch_image, image_size, image_quality, images, downloader.stats.add_stage)
+        writer = StreamingEpubWriter(filename, novel_title, novel_title, job.novel["author"], job.novel["url"], compression=compression, images=downloader.images)
+        try:
+            cover_future = downloader.images.submit(job.novel["cover_url"], downloader.fetch_cover) if job.novel["cover_url"] else None
+            for index, (number, chapter_url, chapter_title, content) in enumerate(jobs.iter_chapters(job.novel["id"])):
+                downloader.prefetch_images(content, chapter_url)
+                writer.add(index, downloader.make_chapter_page(number, chapter_title, "", content), chapter_url)
+                chapter_count += 1
+            writer.flush(True) # Every image of the chapters is downloaded once they are written
+            if (cover_image_name := cover_future.result() if cover_future else None) is not None:
+                writer.set_cover(cover_image_name, downloader.images.read(cover_image_name))
+            for file_name in downloader.images.file_names:
+                if file_name != cover_image_name:
+                    writer.add_image(file_name, downloader.images.read(file_name))
+            writer.identifier = f"{novel_title} {chapter_count}"
+            writer.close()
+        except BaseException:
+            writer.abort()
+            raise
+    except constants.ProgError:
+        raise
+    except Exception as e:
+        jobs.fail_novel(job.novel["id"], str(e))
+        click.echo(f"Could not write {filename}: {e}", err=True)
+        return
+    finally:
+        if downloader.images is not None:
+            downloader.images.close()
+    jobs.finish_novel(job.novel["id"])
+    downloader.echo_images()
+    click.echo(writer.get_summary())
+    click.echo(f"\nDownloaded {filename} ({chapter_count} chapters).")
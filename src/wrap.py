@@ -0,0 +1,86 @@
+import bisect
+import re
+
+
+WORD_PATTERN = re.compile(r"\S+")
+
+
+def wrap_paragraph(paragraph: str, width: int) -> list[str]:
+    """Wrap a paragraph into lines no longer than width
+
+        Each line is one slice of the paragraph so the paragraph is only walked over once.
+        Words longer than width are split over as many lines as they need.
+    """
+
+    lines = []
+    start = None # Where the line being made starts in the paragraph
+    end = 0 # Where the last word that fits on the line ends
+    for match in WORD_PATTERN.finditer(paragraph):
+        word_start, word_end = match.span()
+        if start is None:
+            start = word_start
+        elif word_end - start > width:
+            lines.append(paragraph[start:end])
+            start = word_start
+        while word_end - start > width:
+            lines.append(paragraph[start:start + width])
+            start += width
+        end = word_end
+    if start is not None:
+        lines.append(paragraph[start:end])
+    return lines
+
+
+class WrappedChapter:
+    """Wrapped Chapter
+
+        The lines of a chapter wrapped to a width, only the paragraphs up to the last line that was
+        asked for are wrapped so a long chapter is wrapped as it is scrolled through.
+    """
+
+
+    def __init__(self, paragraphs: list[str], width: int) -> None:
+        """Constructor
+
+            paragraphs: the text of each paragraph in the chapter
+            width: the max length of a line
+        """
+
+        self.paragraphs = paragraphs
+        self.width = max(width, 1)
+        self.lines = []
+        self.paragraph_starts = [] # The line each wrapped paragraph starts at
+
+
+    def wrap_to(self, line_count: int) -> int:
+        """Wrap paragraphs until there are line_count lines or the chapter is wrapped
+
+            returns the number of lines wrapped
+        """
+
+        while len(self.lines) < line_count and len(self.paragraph_starts) < len(self.paragraphs):
+            self.paragraph_starts.append(len(self.lines))
+            self.lines.extend(wrap_paragraph(self.paragraphs[len(self.paragraph_starts) - 1], self.width))
+        return len(self.lines)
+
+
+    def get_lines(self, start: int, count: int) -> list[str]:
+        """Get count lines starting at the line start"""
+
+        self.wrap_to(start + count)
+        return self.lines[start:start + count]
+
+
+    def get_paragraph(self, line_index: int) -> int:
+        """Get the index of the paragraph a line is in"""
+
+        self.wrap_to(line_index + 1)
+        return max(bisect.bisect_right(self.paragraph_starts, line_index) - 1, 0)
+
+
+    def get_paragraph_line(self, paragraph_index: int) -> int:
+        """Get the line a paragraph starts at"""
+
+        while len(self.paragraph_starts) <= paragraph_index and len(self.paragraph_starts) < len(self.paragraphs):
+            self.wrap_to(len(self.lines) + 1)
+        return self.paragraph_starts[min(paragraph_index, len(self.paragraph_starts) - 1)] if self.paragraph_starts else 0
@@ -0,0 +1,114 @@
+import struct
+import time
+import zipfile
+import zlib
+from typing import BinaryIO
+
+
+class ZipWriter:
+    """Zip Writer
+
+        Writes a zip file one member at a time. Members can be written from bytes or copied
+        from another zip file as they are, without decompressing and compressing them again.
+
+        Zip64 is not supported so the file has to be smaller than 4GB with fewer than 65535 members,
+        which is a lot more than any epub needs.
+    """
+
+
+    def __init__(self, path: str) -> None:
+        """Constructor
+
+            path: where the zip file is written
+        """
+
+        self.file = open(path, "wb")
+        self.entries = []
+
+
+    def __enter__(self) -> "ZipWriter":
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+
+    def write(self, name: str, data: bytes, compress: bool = True, level: int = 6) -> None:
+        """Write a member from its uncompressed bytes
+
+            name: the name of the member
+            data: the member's content
+            compress: deflate the member if true, store it as is if false
+            level: the zlib compression level used when compress is true
+        """
+
+        if compress:
+            self.write_raw(name, self.deflate(data, level), zlib.crc32(data), len(data), zipfile.ZIP_DEFLATED)
+        else:
+            self.write_raw(name, data, zlib.crc32(data), len(data), zipfile.ZIP_STORED)
+
+
+    @staticmethod
+    def deflate(data: bytes, level: int = 6) -> bytes:
+        """Compress data the way it is stored in a deflated member"""
+
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        return compressor.compress(data) + compressor.flush()
+
+
+    def write_raw(self, name: str, raw: bytes, crc: int, size: int, method: int, date_time: tuple[int, int, int, int, int, int] | None = None) -> None:
+        """Write a member that is already compressed
+
+            name: the name of the member
+            raw: the member's content as it is stored in the zip
+            crc: the crc32 of the uncompressed content
+            size: the size of the uncompressed content
+            method: zipfile.ZIP_STORED or zipfile.ZIP_DEFLATED
+            date_time: the member's modification time, defaults to now
+        """
+
+        if self.file.tell() + len(raw) >= 0xFFFFFFFF or len(self.entries) >= 0xFFFF:
+            raise Exception(f"{self.file.name} is too big to be written without zip64.")
+
+        date_time = date_time or time.localtime()[:6]
+        dos_time = date_time[3] << 11 | date_time[4] << 5 | date_time[5] // 2
+        dos_date = (date_time[0] - 1980) << 9 | date_time[1] << 5 | date_time[2]
+        encoded_name = name.encode()
+        flags = 0x800 # Names are utf-8
+
+        offset = self.file.tell()
+        self.file.write(struct.pack("<IHHHHHIIIHH", 0x04034B50, 20, flags, method, dos_time, dos_date, crc, len(raw), size, len(encoded_name), 0))
+        self.file.write(encoded_name)
+        self.file.write(raw)
+        self.entries.append((encoded_name, flags, method, dos_time, dos_date, crc, len(raw), size, offset))
+
+
+    def copy(self, source: BinaryIO, info: zipfile.ZipInfo) -> None:
+        """Copy a member from another zip file without decompressing it
+
+            source: the zip file the member is in, opened in binary mode
+            info: the member's info from zipfile.ZipFile(source).infolist()
+        """
+
+        source.seek(info.header_offset)
+        header = source.read(30)
+        name_length, extra_length = struct.unpack("<HH", header[26:30])
+        source.seek(name_length + extra_length, 1)
+        raw = source.read(info.compress_size)
+        self.write_raw(info.filename, raw, info.CRC, info.file_size, info.compress_type, info.date_time)
+
+
+    def close(self) -> None:
+        """Write the central directory and close the file"""
+
+        if self.file.closed:
+            return
+
+        central_directory_offset = self.file.tell()
+        for encoded_name, flags, method, dos_time, dos_date, crc, compressed_size, size, offset in self.entries:
+            self.file.write(struct.pack("<IHHHHHHIIIHHHHHII", 0x02014B50, 3 << 8 | 20, 20, flags, method, dos_time, dos_date, crc, compressed_size, size, len(encoded_name), 0, 0, 0, 0, 0o644 << 16, offset))
+            self.file.write(encoded_name)
+        central_directory_size = self.file.tell() - central_directory_offset
+        self.file.write(struct.pack("<IHHHHIIH", 0x06054B50, 0, 0, len(self.entries), len(self.entries), central_directory_size, central_directory_offset, 0))
+        self.file.close()
@@ -0,0 +1,62 @@
+import os
+import tempfile
+import unittest
+
+from src.cache import ChapterCache
+
+
+class ChapterCacheTest(unittest.TestCase):
+    """Tests for the chapter cache's eviction"""
+
+
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = self.temp_dir.name
+
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+
+    def add_sidecar_files(self, cache_dir: str, name: str, suffixes: tuple[str, ...], count: int) -> list[str]:
+        """Add files of another cache to a directory of the chapter cache that are older than every chapter
+
+            cache_dir: the chapter cache's directory
+            name: the directory inside the cache directory
+            suffixes: the suffix of each file added for every entry
+            count: the number of entries to add
+        """
+
+        sidecar_dir = os.path.join(cache_dir, name)
+        os.makedirs(sidecar_dir)
+        paths = []
+        for i in range(count):
+            for suffix in suffixes:
+                path = os.path.join(sidecar_dir, f"{i}{suffix}")
+                with open(path, "wb") as f:
+                    f.write(b"\0" * 1000)
+                os.utime(path, (0, 0))
+                paths.append(path)
+        return paths
+
+
+    def test_eviction_keeps_sidecar_files(self) -> None:
+        # The read and search commands keep their indexes and the http cache its responses next to the chapters
+        for name, suffixes in (("reader", (".idx",)), ("search", (".idx",)), ("http", (".meta", ".body"))):
+            with self.subTest(name):
+                cache_dir = os.path.join(self.cache_dir, name)
+                sidecar_paths = self.add_sidecar_files(cache_dir, name, suffixes, 3)
+                cache = ChapterCache("novel", 5000, cache_dir)
+                for i in range(20):
+                    cache.put(f"https://example.com/{i}", "<p>" + "a" * 500 + "</p>", f"Chapter {i}", "a" * 500)
+
+                for path in sidecar_paths:
+                    self.assertTrue(os.path.exists(path), path)
+                self.assertLessEqual(cache.size, cache.max_size)
+                self.assertEqual(cache.size, sum(os.path.getsize(path) for path in cache.get_all_files()))
+                self.assertIsNotNone(cache.get("https://example.com/19"))
+                self.assertIsNone(cache.get("https://example.com/0"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import tempfile
+import time
+import unittest
+import requests
+
+from src.http_cache import HttpCache
+
+
+class HttpCacheTest(unittest.TestCase):
+    """Tests for the http cache's eviction"""
+
+
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = self.temp_dir.name
+
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+
+    def store(self, cache: HttpCache, url: str, headers: dict, used: float) -> None:
+        """Store a response for url as if it was last used at the time used"""
+
+        response = requests.Response()
+        response._content = b"a" * 1000
+        response.status_code = 200
+        response.url = url
+        response.headers = requests.structures.CaseInsensitiveDict(headers)
+        meta_path, body_path = (os.path.join(self.cache_dir, name) for name in (f"{url[-1]}.meta", f"{url[-1]}.body"))
+        cache.put(meta_path, body_path, response)
+        for path in (meta_path, body_path):
+            if os.path.exists(path):
+                os.utime(path, (used, used))
+
+
+    def get_disk_size(self) -> int:
+        """Get the number of bytes every file in the cache directory uses"""
+
+        return sum(os.path.getsize(os.path.join(self.cache_dir, file_name)) for file_name in os.listdir(self.cache_dir))
+
+
+    def test_eviction_counts_each_response_once(self) -> None:
+        cache = HttpCache(5000, ttl=60, cache_dir=self.cache_dir)
+        # Each body is listed before its meta
+        cache.get_all_files = lambda: sorted(HttpCache.get_all_files(cache))
+        now = time.time()
+        # Responses without validators that are older than ttl are deleted before any others
+        self.store(cache, "https://example.com/a", {}, now - 3600)
+        for i, url in enumerate("https://example.com/" + name for name in "defg"):
+            self.store(cache, url, {"ETag": f'"{i}"'}, now - 60 + i)
+
+        file_names = set(os.listdir(self.cache_dir))
+        self.assertEqual(cache.size, self.get_disk_size())
+        self.assertLessEqual(cache.size, cache.max_size)
+        # Only the stale response is deleted since the others fit once it is gone
+        self.assertEqual(file_names, {f"{name}.{suffix}" for name in "defg" for suffix in ("meta", "body")})
+
+
+    def test_eviction_skips_bodies_without_meta(self) -> None:
+        with open(os.path.join(self.cache_dir, "x.body"), "wb") as f:
+            f.write(b"a" * 10000)
+        cache = HttpCache(5000, cache_dir=self.cache_dir)
+        self.store(cache, "https://example.com/a", {"ETag": '"a"'}, time.time())
+
+        self.assertTrue(os.path.exists(os.path.join(self.cache_dir, "a.meta")))
+        self.assertEqual(cache.size, self.get_disk_size() - 10000)
+
+
+if __name__ == "__main__":
+    unittest.main()